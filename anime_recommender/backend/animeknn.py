@@ -10,48 +10,195 @@ Original file is located at
 import pandas as pd
 import numpy as np
 from typing import List, Dict, Tuple, Optional
+import os
+import threading
 import time
 from pathlib import Path
 
-print("Imports complete")
+from display_store import get_display_store
+from embedding_store import load_embeddings, rows, scan_scores
+from franchise_clusters import load_franchise_ids
+from metrics import STAGE_SECONDS
 
 # --- File paths relative to this backend folder ---
 BASE_DIR = Path(__file__).resolve().parent
 DATA_DIR = BASE_DIR / "data"
 
 EMBEDDINGS_PATH = DATA_DIR / "embeddings.parquet"           # or embeddings_series.parquet
+EMBEDDINGS_NPY_PATH = DATA_DIR / "embeddings.npy"           # memory-mapped export (embedding_store.py)
 RAW_DATA_PATH = DATA_DIR / "raw_data.csv"
 CLEANED_DATA_PATH = DATA_DIR / "cleaned_data_names.parquet"  # your main cleaned file
+NEIGHBORS_PATH = DATA_DIR / "neighbors.npz"                 # built by neighbor_table.py
+IVF_INDEX_PATH = DATA_DIR / "ivf_index.npz"                 # built by ivf_index.py
+HNSW_INDEX_PATH = DATA_DIR / "hnsw_index.npz"               # built by hnsw_index.py
+FRANCHISES_PATH = DATA_DIR / "franchises.npz"               # built by franchise_clusters.py
+QUANTIZED_PATHS = {                                         # built by quantization.py
+    "sq8": DATA_DIR / "quantized_sq8.npz",
+    "pq": DATA_DIR / "quantized_pq.npz",
+}
 
 DEFAULT_K = 10
 DEFAULT_CANDIDATES = 100
 
-print(f"Configuration set. Data directory: {DATA_DIR}")
+# Live neighbor search backend: "exact", "ivf", "hnsw", "sq8" or "pq"
+SEARCH_BACKEND = os.getenv("ANIME_SEARCH_BACKEND", "exact")
 
-def load_data():
-    """Load all necessary data files"""
-    print("Loading data files...")
+# Load the display table (raw_data) only when something first needs it
+LAZY_DISPLAY = os.getenv("ANIME_LAZY_DISPLAY", "0") == "1"
 
-    # Embeddings
-    emb_df = pd.read_parquet(EMBEDDINGS_PATH)
-    embeddings = np.vstack(emb_df['embedding'].values)
-    print(f"✓ Embeddings loaded: {embeddings.shape}")
 
+def load_core_data():
+    """
+    Load the embeddings and metadata needed for ranking.
+
+    Returns:
+        embeddings, emb_df, metadata, and the embeddings fingerprint that
+        stale-artifact checks compare against (computed once here)
+    """
     # Metadata
     metadata = pd.read_parquet(CLEANED_DATA_PATH)
     print(f"✓ Metadata loaded: {len(metadata)} rows")
 
-    # Raw data (for name, score, genre, image, etc.)
+    # Embeddings (memory-mapped from the .npy export when it matches the metadata)
+    anime_ids = pd.to_numeric(metadata["anime_id"], errors="coerce").to_numpy(dtype=np.int64)
+    embeddings, emb_df, mapped, fingerprint = load_embeddings(EMBEDDINGS_NPY_PATH, EMBEDDINGS_PATH, anime_ids)
+    print(f"✓ Embeddings loaded: {embeddings.shape}{' (memory-mapped)' if mapped else ''}")
+
+    assert len(embeddings) == len(emb_df) == len(metadata), "Data size mismatch!"
+
+    return embeddings, emb_df, metadata, fingerprint
+
+
+def load_raw_data():
+    """Load the display table (name, score, genre, image, etc.)"""
     raw_data = pd.read_csv(RAW_DATA_PATH)
     raw_data["anime_id"] = pd.to_numeric(raw_data["anime_id"], errors="coerce")
     print(f"✓ Raw data loaded: {len(raw_data)} rows")
+    return raw_data
 
-    assert len(embeddings) == len(emb_df) == len(metadata), "Data size mismatch!"
 
-    return embeddings, emb_df, metadata, raw_data
+def load_data():
+    """Load all necessary data files"""
+    print("Loading data files...")
+    embeddings, emb_df, metadata, _ = load_core_data()
+    return embeddings, emb_df, metadata, load_raw_data()
+
+
+class DataEngine:
+    """
+    Lazily loaded catalog data.
+
+    Nothing is read at import: data loads on first attribute access, or in
+    the background via warm_up(). status() reports progress for readiness
+    probes. With lazy_display, raw_data is loaded separately on first use.
+    """
+
+    def __init__(self, lazy_display: bool = LAZY_DISPLAY):
+        self.lazy_display = lazy_display
+        self.state = "idle"               # idle → loading → ready | failed
+        self.steps: List[Dict] = []
+        self.error: Optional[str] = None
+        self._lock = threading.RLock()
+        self._display_lock = threading.Lock()
+        self._core = None
+        self._raw_data = None
+
+    def _step(self, name: str, fn):
+        start = time.time()
+        result = fn()
+        self.steps.append({"step": name, "seconds": round(time.time() - start, 3)})
+        return result
+
+    def ensure_loaded(self):
+        """Load the core data once; concurrent callers wait for the first."""
+        if self._core is not None:
+            return
+        with self._lock:
+            if self._core is not None:
+                return
+            self.state = "loading"
+            try:
+                print("Loading data files...")
+                core = self._step("embeddings+metadata", load_core_data)
+                self._step("series_index", lambda: get_series_index(core[2]))
+                if not self.lazy_display:
+                    self._load_display()
+                self._core = core
+                self.state = "ready"
+            except Exception as e:
+                self.state, self.error = "failed", f"{type(e).__name__}: {e}"
+                raise
+
+    def _load_display(self):
+        with self._display_lock:
+            if self._raw_data is None:
+                self._raw_data = self._step("raw_data", load_raw_data)
+
+    def warm_up(self, then=None) -> threading.Thread:
+        """Load in a background thread, then optionally call `then()`."""
+        def run():
+            try:
+                self.ensure_loaded()
+                if then is not None:
+                    then()
+            except Exception as e:
+                print(f"❌ Warm-up failed: {e}")
+
+        thread = threading.Thread(target=run, name="animeknn-warmup", daemon=True)
+        thread.start()
+        return thread
+
+    @property
+    def ready(self) -> bool:
+        return self.state == "ready"
+
+    @property
+    def embeddings(self) -> np.ndarray:
+        self.ensure_loaded()
+        return self._core[0]
+
+    @property
+    def emb_df(self) -> pd.DataFrame:
+        self.ensure_loaded()
+        return self._core[1]
+
+    @property
+    def metadata(self) -> pd.DataFrame:
+        self.ensure_loaded()
+        return self._core[2]
+
+    @property
+    def fingerprint(self) -> int:
+        """embeddings_fingerprint of the loaded embeddings."""
+        self.ensure_loaded()
+        return self._core[3]
+
+    @property
+    def raw_data(self) -> pd.DataFrame:
+        self.ensure_loaded()
+        if self._raw_data is None:
+            self._load_display()
+        return self._raw_data
+
+    def status(self) -> Dict:
+        return {
+            "state": self.state,
+            "steps": list(self.steps),
+            "display_loaded": self._raw_data is not None,
+            "error": self.error,
+        }
+
 
+engine = DataEngine()
 
-embeddings, emb_df, metadata, raw_data = load_data()
+_ENGINE_ATTRS = ("embeddings", "emb_df", "metadata", "raw_data", "fingerprint")
+
+
+def __getattr__(name):
+    # Keeps animeknn.embeddings / .metadata / ... working, loading on first access
+    if name in _ENGINE_ATTRS:
+        return getattr(engine, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 """# KNN SEARCH FUNCTIONS"""
 
@@ -61,7 +208,7 @@ def cosine_similarity_batch(query_vec: np.ndarray,
     Compute cosine similarity between query and all embeddings.
     Assumes both query_vec and embeddings are already L2-normalized.
     """
-    return np.dot(embeddings, query_vec)
+    return scan_scores(query_vec, embeddings)
 
 
 def knn_search(query_vec: np.ndarray,
@@ -89,28 +236,199 @@ def knn_search(query_vec: np.ndarray,
     return top_indices[:k], sims[top_indices[:k]]
 
 
+def knn_search_batch(query_vecs: np.ndarray,
+                     embeddings: np.ndarray,
+                     k: int = 10,
+                     exclude_idx: Optional[np.ndarray] = None,
+                     block_size: int = 1024) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Find k nearest neighbors for Q queries at once.
+    Scores each block of queries with one matrix-matrix product and takes a
+    row-wise argpartition.
+
+    Args:
+        query_vecs: (Q, dim) L2-normalized queries
+        embeddings: (N, dim) L2-normalized catalog
+        k: neighbors per query
+        exclude_idx: optional (Q,) catalog index to drop per query
+
+    Returns:
+        indices: (Q, k) neighbor indices, best first
+        similarities: (Q, k) similarity scores
+    """
+    Q = len(query_vecs)
+    k = min(k, len(embeddings) - (1 if exclude_idx is not None else 0))
+    indices = np.empty((Q, k), dtype=np.intp)
+    similarities = np.empty((Q, k), dtype=np.float32)
+
+    for start in range(0, Q, block_size):
+        stop = min(start + block_size, Q)
+        sims = scan_scores(query_vecs[start:stop], embeddings)  # (B, N)
+        if exclude_idx is not None:
+            sims[np.arange(stop - start), exclude_idx[start:stop]] = -np.inf
+        indices[start:stop], similarities[start:stop] = _top_k_rows(sims, k)
+
+    return indices, similarities
+
+
+def _top_k_rows(sims: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Row-wise top k of a (B, N) score matrix, best first."""
+    top = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+    top_sims = np.take_along_axis(sims, top, axis=1)
+    order = np.argsort(-top_sims, axis=1)
+    return np.take_along_axis(top, order, axis=1), np.take_along_axis(top_sims, order, axis=1)
+
+
+def multi_seed_knn_search_batch(seed_lists: List[np.ndarray],
+                                embeddings: np.ndarray,
+                                k: int = 10,
+                                mode: str = "centroid",
+                                block_size: int = 256) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    multi_seed_knn_search for many seed lists at once.
+
+    Each block of lists is scored with one matrix product: against the
+    per-list centroids ("centroid"), or against every seed followed by a
+    segmented max over each list's rows ("max"). Each list's own seeds are
+    excluded from its results.
+
+    Args:
+        seed_lists: Q non-empty arrays of catalog indices
+
+    Returns:
+        indices: (Q, k) neighbor indices, best first
+        similarities: (Q, k) similarity scores
+    """
+    if mode not in ("centroid", "max"):
+        raise ValueError(f"Unknown multi-seed mode: {mode!r}")
+    seed_lists = [np.asarray(s, dtype=np.intp) for s in seed_lists]
+    Q = len(seed_lists)
+    k = min(k, len(embeddings) - max((len(s) for s in seed_lists), default=0))
+    indices = np.empty((Q, k), dtype=np.intp)
+    similarities = np.empty((Q, k), dtype=np.float32)
+
+    for start in range(0, Q, block_size):
+        block = seed_lists[start:start + block_size]
+        lengths = np.array([len(s) for s in block])
+        seeds = np.concatenate(block)
+        owners = np.repeat(np.arange(len(block)), lengths)
+        offsets = np.r_[0, np.cumsum(lengths)[:-1]]
+
+        seed_vecs = rows(embeddings, seeds)
+        if mode == "centroid":
+            centroids = np.add.reduceat(seed_vecs, offsets, axis=0) / lengths[:, None]
+            norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+            centroids = centroids / np.where(norms > 0, norms, 1)
+            sims = scan_scores(centroids, embeddings)          # (B, N)
+        else:
+            sims = np.maximum.reduceat(scan_scores(seed_vecs, embeddings), offsets, axis=0)
+        sims[owners, seeds] = -np.inf
+        indices[start:start + len(block)], similarities[start:start + len(block)] = _top_k_rows(sims, k)
+
+    return indices, similarities
+
+
+def multi_seed_knn_search(seed_indices: np.ndarray,
+                          embeddings: np.ndarray,
+                          k: int = 10,
+                          mode: str = "centroid") -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Find k nearest neighbors of several seed rows, scored in one pass.
+
+    Args:
+        seed_indices: catalog indices of the seeds (all are excluded)
+        mode: "centroid" scores against the normalized mean of the seeds,
+              "max" takes each item's best similarity to any seed
+    """
+    seed_indices = np.asarray(seed_indices, dtype=np.intp)
+    seed_vecs = rows(embeddings, seed_indices)
+
+    if mode == "centroid":
+        sims = scan_scores(seed_centroid(seed_vecs), embeddings)
+    elif mode == "max":
+        sims = scan_scores(seed_vecs, embeddings).max(axis=0)
+    else:
+        raise ValueError(f"Unknown multi-seed mode: {mode!r}")
+    sims[seed_indices] = -np.inf
+
+    K = min(k, len(embeddings) - len(np.unique(seed_indices)))
+    top_indices = np.argpartition(-sims, K-1)[:K]
+    top_indices = top_indices[np.argsort(-sims[top_indices])]
+    return top_indices, sims[top_indices]
+
+
+def seed_centroid(seed_vecs: np.ndarray) -> np.ndarray:
+    """L2-normalized mean of several embeddings."""
+    centroid = seed_vecs.mean(axis=0)
+    norm = np.linalg.norm(centroid)
+    return centroid / norm if norm > 0 else centroid
+
+
 def approximate_knn_search(query_vec: np.ndarray,
                           embeddings: np.ndarray,
                           k: int = 10,
-                          probe_size: int = 1000) -> Tuple[np.ndarray, np.ndarray]:
+                          index=None,
+                          exclude_idx: Optional[int] = None,
+                          **search_kwargs) -> Tuple[np.ndarray, np.ndarray]:
     """
-    Faster approximate KNN using random sampling for very large datasets.
-    Useful when exact search is too slow.
+    Approximate KNN through an ANN index (IVF, HNSW or a quantized store)
+    for very large datasets.
+    Falls back to exact search when no index is available.
+
+    Extra keyword arguments are passed to the index, e.g. nprobe for IVF or
+    ef_search for HNSW, rerank for quantized stores.
     """
-    n = len(embeddings)
-    if n <= probe_size or probe_size >= n:
-        return knn_search(query_vec, embeddings, k)
+    if index is None:
+        return knn_search(query_vec, embeddings, k, exclude_idx=exclude_idx)
+    return index.search(query_vec, k, exclude_idx=exclude_idx, **search_kwargs)
+
 
-    # Random sample
-    sample_idx = np.random.choice(n, size=probe_size, replace=False)
-    sample_emb = embeddings[sample_idx]
+def load_search_index(backend: str, embeddings: np.ndarray, fingerprint: Optional[int] = None):
+    """
+    Load the persisted ANN index for a search backend.
+    Returns None for "exact", or when the index is missing or stale.
+    Pass the embeddings' fingerprint when known to skip recomputing it.
+    """
+    from neighbor_table import embeddings_fingerprint
+
+    if backend == "exact":
+        return None
+    if backend == "ivf":
+        from ivf_index import IVFIndex
+        path, loader = IVF_INDEX_PATH, IVFIndex.load
+    elif backend == "hnsw":
+        from hnsw_index import HNSWIndex
+        path, loader = HNSW_INDEX_PATH, HNSWIndex.load
+    elif backend in QUANTIZED_PATHS:
+        from quantization import QuantizedStore
+        path, loader = QUANTIZED_PATHS[backend], QuantizedStore.load
+    else:
+        raise ValueError(f"Unknown search backend: {backend!r}")
 
-    # Search in sample
-    local_top, local_sims = knn_search(query_vec, sample_emb, k)
+    if not path.exists():
+        print(f"⚠️  {path.name} not found, using exact search")
+        return None
 
-    # Map back to original indices
-    global_indices = sample_idx[local_top]
-    return global_indices, local_sims
+    index = loader(path, embeddings)
+    if fingerprint is None:
+        fingerprint = embeddings_fingerprint(embeddings)
+    if index.fingerprint != fingerprint:
+        print(f"⚠️  {path.name} is stale, using exact search")
+        return None
+
+    print(f"✓ {backend} index loaded from {path.name}")
+    return index
+
+
+_search_indexes = {}
+
+
+def get_search_index(backend: str, embeddings: np.ndarray, fingerprint: Optional[int] = None):
+    """Load a backend's index once per embeddings matrix and reuse it."""
+    key = (backend, id(embeddings))
+    if key not in _search_indexes:
+        _search_indexes[key] = load_search_index(backend, embeddings, fingerprint)
+    return _search_indexes[key]
 
 """# QUERY PROCESSING"""
 
@@ -141,6 +459,31 @@ def find_anime_by_name(query_name: str,
     return None
 
 
+def find_anime_by_names(query_names: List[str],
+                        metadata: pd.DataFrame,
+                        search_columns: List[str] = None) -> List[Optional[int]]:
+    """
+    Resolve many names at once, with the same first-match semantics as
+    find_anime_by_name. Each column is lowercased once for the whole batch.
+    """
+    if search_columns is None:
+        search_columns = ["name", "english_name", "japanese_names", "embed_text"]
+
+    columns = [metadata[c].astype(str).str.lower() for c in search_columns if c in metadata.columns]
+
+    resolved = []
+    for query_name in query_names:
+        q = query_name.lower()
+        hit = None
+        for col in columns:
+            mask = col.str.contains(q, na=False, regex=False).to_numpy()
+            if mask.any():
+                hit = metadata.index[np.argmax(mask)]
+                break
+        resolved.append(hit)
+    return resolved
+
+
 def create_query_embedding(query_text: str,
                           model) -> np.ndarray:
     """
@@ -161,97 +504,233 @@ def create_query_embedding(query_text: str,
 
 """# RESULT FILTERING"""
 
+class SeriesIndex:
+    """
+    Per-row franchise data precomputed once, aligned with `embeddings`.
+
+    - group_ids: int32 id of the normalized series_key (-1 when the key is
+      empty or the column is missing)
+    - franchise_ids: int32 offline franchise cluster (franchise_clusters.py),
+      -1 for titles not clustered yet; None when there is no franchises file
+    - titles / roots: lowercased names and their first-two-word prefixes,
+      used by the title-prefix fallback
+    - has_name: rows with a non-empty name (unnamed queries are not filtered)
+    """
+
+    def __init__(self, metadata: pd.DataFrame, franchise_ids: Optional[np.ndarray] = None):
+        n = len(metadata)
+        names = [str(x) for x in metadata['name'].tolist()] if 'name' in metadata.columns else [''] * n
+
+        self.has_name = np.array([bool(x.strip()) for x in names], dtype=bool)
+        self.titles = np.array([x.lower() for x in names], dtype=str)
+        self.roots = np.array([' '.join(t.split()[:2]) for t in self.titles], dtype=str)
+
+        self.use_series_key = 'series_key' in metadata.columns
+        self.group_ids = np.full(n, -1, dtype=np.int32)
+        if self.use_series_key:
+            keys = pd.Series([str(x).strip().lower() for x in metadata['series_key'].tolist()], dtype=object)
+            codes, _ = pd.factorize(keys)
+            self.group_ids = np.where(keys.to_numpy() != '', codes, -1).astype(np.int32)
+
+        self.franchise_ids = franchise_ids
+
+    def same_series_mask(self, candidate_indices: np.ndarray, query_idx: int) -> np.ndarray:
+        """Boolean mask over candidate_indices: True for the query's own franchise."""
+        candidate_indices = np.asarray(candidate_indices, dtype=np.intp)
+        mask = candidate_indices == query_idx
+
+        query_franchise = self.franchise_ids[query_idx] if self.franchise_ids is not None else -1
+        if query_franchise >= 0:
+            mask |= self.franchise_ids[candidate_indices] == query_franchise
+
+        if self.use_series_key:
+            query_group = self.group_ids[query_idx]
+            if query_group >= 0:
+                mask |= self.group_ids[candidate_indices] == query_group
+        else:
+            # Also with a franchise id: catches sequels the clustering missed
+            query_root = self.roots[query_idx]
+            if query_root:
+                mask |= np.char.startswith(self.titles[candidate_indices], query_root)
+
+        return mask
+
+    def same_series_mask_batch(self, pools: np.ndarray, query_indices: np.ndarray) -> np.ndarray:
+        """
+        same_series_mask for Q queries at once: (Q, C) mask over a (Q, C)
+        array of candidate pools. Unnamed queries filter nothing.
+        """
+        pools = np.asarray(pools, dtype=np.intp)
+        q = np.asarray(query_indices, dtype=np.intp)[:, None]
+        mask = pools == q
+
+        if self.franchise_ids is not None:
+            query_franchise = self.franchise_ids[q]
+            mask |= (query_franchise >= 0) & (self.franchise_ids[pools] == query_franchise)
+
+        if self.use_series_key:
+            query_group = self.group_ids[q]
+            mask |= (query_group >= 0) & (self.group_ids[pools] == query_group)
+        else:
+            query_root = self.roots[q]
+            mask |= (np.char.str_len(query_root) > 0) & np.char.startswith(self.titles[pools], query_root)
+
+        return mask & self.has_name[q]
+
+
+_series_indexes = {}
+
+
+def get_series_index(metadata: pd.DataFrame) -> SeriesIndex:
+    """Build a metadata frame's SeriesIndex once and reuse it."""
+    key = id(metadata)
+    if key not in _series_indexes:
+        franchise_ids = (load_franchise_ids(FRANCHISES_PATH, metadata['anime_id'].tolist())
+                         if 'anime_id' in metadata.columns else None)
+        _series_indexes[key] = SeriesIndex(metadata, franchise_ids)
+    return _series_indexes[key]
+
+
 def filter_same_series(candidate_indices: np.ndarray,
                       query_idx: int,
                       metadata: pd.DataFrame,
-                      use_aggressive: bool = True) -> np.ndarray:
+                      use_aggressive: bool = True,
+                      series_index: Optional[SeriesIndex] = None) -> np.ndarray:
     """
     Remove sequels/related entries from the same series.
-    Uses multiple strategies for robust filtering.
+    Matches on the offline franchise ids when available, plus series_key
+    or else a title prefix; all run as one boolean mask over precomputed
+    SeriesIndex arrays.
 
     Args:
         candidate_indices: Array of candidate indices to filter
         query_idx: Index of the query anime
         metadata: DataFrame with anime metadata
         use_aggressive: If True, uses more aggressive title matching
+        series_index: Precomputed SeriesIndex (built from metadata if omitted)
     """
-    import re
+    if series_index is None:
+        series_index = get_series_index(metadata)
 
-    query_row = metadata.iloc[query_idx]
-    query_name = str(query_row.get('name', '')).strip()
-
-    if not query_name:
+    candidate_indices = np.asarray(candidate_indices, dtype=np.intp)
+    if not series_index.has_name[query_idx]:
         return candidate_indices
 
-    # Try series_key first
-    if 'series_key' in metadata.columns:
-        query_key = str(query_row.get('series_key', '')).strip().lower()
-
-        def same_series(idx):
-            if idx == query_idx:
-                return True
-            target_key = str(metadata.iloc[idx].get('series_key', '')).strip().lower()
-            return query_key and target_key and (query_key == target_key)
-    else:
-        # Fallback to title matching
-        query_title = str(query_row.get('name', '')).lower()
-        query_root = ' '.join(query_title.split()[:2])
-
-        def same_series(idx):
-            if idx == query_idx:
-                return True
-            target_title = str(metadata.iloc[idx].get('name', '')).lower()
-            return query_root and target_title.startswith(query_root)
-
-    filtered = [idx for idx in candidate_indices if not same_series(idx)]
-    return np.array(filtered)
+    return candidate_indices[~series_index.same_series_mask(candidate_indices, query_idx)]
 
 
 def mmr_rerank(candidate_embeddings: np.ndarray,
                query_vec: np.ndarray,
                lambda_mult: float = 0.7,
-               top_n: int = 10) -> List[int]:
+               top_n: int = 10,
+               relevance: Optional[np.ndarray] = None) -> List[int]:
     """
     Maximal Marginal Relevance re-ranking for diversity.
 
+    The candidate Gram matrix is computed once; a running max-similarity
+    vector is updated after each pick, so every step is one vectorized argmax.
+
     Args:
         candidate_embeddings: (N, dim) embeddings of candidates
         query_vec: (dim,) query embedding
         lambda_mult: relevance vs diversity tradeoff (higher = more relevant)
         top_n: number of results to return
+        relevance: optional precomputed (N,) relevance scores, used instead
+            of candidate_embeddings @ query_vec (e.g. multi-seed max scores)
     """
+    n = len(candidate_embeddings)
+    top_n = min(top_n, n)
+    if top_n == 0:
+        return []
+
+    query_sims = candidate_embeddings @ query_vec if relevance is None else np.asarray(relevance)
+    gram = candidate_embeddings @ candidate_embeddings.T
+
+    # Diversity term is 0 until the first pick
+    max_sim = np.zeros(n, dtype=query_sims.dtype)
+    available = np.ones(n, dtype=bool)
     selected = []
-    remaining = list(range(len(candidate_embeddings)))
 
-    # Precompute query similarities
-    query_sims = np.dot(candidate_embeddings, query_vec)
+    for step in range(top_n):
+        scores = lambda_mult * query_sims - (1 - lambda_mult) * max_sim
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
 
-    for _ in range(min(top_n, len(candidate_embeddings))):
-        if not remaining:
-            break
+        selected.append(best)
+        available[best] = False
+        if step == 0:
+            max_sim = gram[best].copy()
+        else:
+            np.maximum(max_sim, gram[best], out=max_sim)
 
-        mmr_scores = []
-        for idx in remaining:
-            rel = query_sims[idx]  # Relevance to query
+    return selected
 
-            if selected:
-                # Diversity: max similarity to already selected
-                selected_emb = candidate_embeddings[selected]
-                div = np.max(np.dot(selected_emb, candidate_embeddings[idx]))
-            else:
-                div = 0
 
-            mmr = lambda_mult * rel - (1 - lambda_mult) * div
-            mmr_scores.append((mmr, idx))
+def mmr_rerank_batch(candidate_embeddings: np.ndarray,
+                     query_vecs: np.ndarray,
+                     lambda_mult: float = 0.7,
+                     top_n: int = 10,
+                     valid: Optional[np.ndarray] = None,
+                     relevance: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    MMR for Q queries at once, each over its own padded candidate pool.
 
-        # Select best MMR score
-        best_idx = max(mmr_scores, key=lambda x: x[0])[1]
-        selected.append(best_idx)
-        remaining.remove(best_idx)
+    Args:
+        candidate_embeddings: (Q, C, dim) candidate embeddings per query
+        query_vecs: (Q, dim) query embeddings
+        lambda_mult: relevance vs diversity tradeoff (higher = more relevant)
+        top_n: number of results to return per query
+        valid: optional (Q, C) mask of real (non-padding) candidates
+        relevance: optional (Q, C) scores used instead of query similarity
+
+    Returns:
+        (Q, top_n) positions into each pool, best first; -1 once a pool
+        runs out of valid candidates.
+    """
+    Q, C = candidate_embeddings.shape[:2]
+    top_n = min(top_n, C)
+    q_idx = np.arange(Q)
+
+    if relevance is not None:
+        query_sims = np.asarray(relevance)
+    else:
+        query_sims = np.einsum('qcd,qd->qc', candidate_embeddings, query_vecs)
+    gram = candidate_embeddings @ candidate_embeddings.transpose(0, 2, 1)   # (Q, C, C)
+
+    max_sim = np.zeros((Q, C), dtype=query_sims.dtype)
+    available = np.ones((Q, C), dtype=bool) if valid is None else valid.copy()
+    selected = np.full((Q, top_n), -1, dtype=np.intp)
+
+    for step in range(top_n):
+        scores = lambda_mult * query_sims - (1 - lambda_mult) * max_sim
+        scores[~available] = -np.inf
+        best = np.argmax(scores, axis=1)
+        has_any = available[q_idx, best]
+
+        selected[has_any, step] = best[has_any]
+        available[q_idx, best] = False
+        picked = gram[q_idx, best]
+        if step == 0:
+            max_sim = picked
+        else:
+            np.maximum(max_sim, picked, out=max_sim)
 
     return selected
 
 
+def gather_similarities(indices: np.ndarray,
+                        pool_indices: np.ndarray,
+                        pool_sims: np.ndarray) -> np.ndarray:
+    """
+    Similarity scores of `indices`, looked up from the candidate pool they
+    were selected from instead of being recomputed.
+    """
+    pool_indices = np.asarray(pool_indices)
+    order = np.argsort(pool_indices)
+    pos = order[np.searchsorted(pool_indices, indices, sorter=order)]
+    return np.asarray(pool_sims)[pos]
+
+
 def diversify_by_genre(candidate_indices: List[int],
                       metadata: pd.DataFrame,
                       max_per_genre: int = 2) -> List[int]:
@@ -276,6 +755,54 @@ def diversify_by_genre(candidate_indices: List[int],
 
     return diverse
 
+
+def main_genre_codes(metadata: pd.DataFrame) -> Tuple[np.ndarray, List[str]]:
+    """
+    Integer-code each row's main genre (first entry of genre_theme_set,
+    "Unknown" if missing), matching diversify_by_genre.
+
+    Returns:
+        codes: (N,) int32 genre id per row
+        genres: genre names, indexed by code
+    """
+    def main_genre(genres):
+        if isinstance(genres, str):
+            return genres
+        if isinstance(genres, (list, tuple, np.ndarray)) and len(genres):
+            return genres[0]
+        return "Unknown"
+
+    if 'genre_theme_set' in metadata.columns:
+        names = [main_genre(g) for g in metadata['genre_theme_set'].tolist()]
+    else:
+        names = ["Unknown"] * len(metadata)
+    codes, uniques = pd.factorize(pd.Series(names, dtype=object))
+    return codes.astype(np.int32), list(uniques)
+
+
+def diversify_by_genre_codes(candidate_indices: np.ndarray,
+                             genre_codes: np.ndarray,
+                             max_per_genre: int = 2) -> np.ndarray:
+    """
+    Vectorized diversify_by_genre: keep a candidate only if fewer than
+    max_per_genre earlier candidates share its main genre.
+    """
+    candidate_indices = np.asarray(candidate_indices)
+    if len(candidate_indices) == 0:
+        return candidate_indices
+
+    codes = genre_codes[candidate_indices]
+    order = np.argsort(codes, kind="stable")
+    sorted_codes = codes[order]
+
+    # Position of each candidate within its genre group
+    group_start = np.r_[True, sorted_codes[1:] != sorted_codes[:-1]]
+    first = np.maximum.accumulate(np.where(group_start, np.arange(len(codes)), 0))
+    rank = np.empty(len(codes), dtype=np.int64)
+    rank[order] = np.arange(len(codes)) - first
+
+    return candidate_indices[rank < max_per_genre]
+
 """# RECOMMENDATION MAIN"""
 
 def recommend_anime(query_name: str,
@@ -288,7 +815,8 @@ def recommend_anime(query_name: str,
                    lambda_mult: float = 0.7,
                    filter_series: bool = True,
                    diversify_genres: bool = True,
-                   verbose: bool = True) -> List[Dict]:
+                   verbose: bool = True,
+                   search_backend: Optional[str] = None) -> List[Dict]:
     """
     Complete recommendation pipeline.
 
@@ -304,14 +832,17 @@ def recommend_anime(query_name: str,
         filter_series: Remove same-series entries
         diversify_genres: Ensure genre diversity
         verbose: Print detailed output
+        search_backend: "exact", "ivf", "hnsw", "sq8" or "pq" (defaults to SEARCH_BACKEND)
 
     Returns:
         List of recommendation dictionaries
     """
     start_time = time.time()
+    stage = STAGE_SECONDS.time
 
     # 1. Find query anime
-    query_idx = find_anime_by_name(query_name, metadata)
+    with stage(pipeline="cli", stage="resolve_ids"):
+        query_idx = find_anime_by_name(query_name, metadata)
     if query_idx is None:
         print(f"❌ '{query_name}' not found in database")
         return []
@@ -324,65 +855,61 @@ def recommend_anime(query_name: str,
         print(f"{'='*80}")
 
     # 2. Get initial candidates
-    query_vec = embeddings[query_idx]
-    cand_indices, cand_sims = knn_search(
-        query_vec, embeddings,
-        k=candidates,
-        exclude_idx=query_idx
-    )
+    with stage(pipeline="cli", stage="knn_search"):
+        query_vec = rows(embeddings, query_idx)
+        index = get_search_index(search_backend or SEARCH_BACKEND, embeddings)
+        pool, pool_sims = approximate_knn_search(
+            query_vec, embeddings,
+            k=candidates,
+            index=index,
+            exclude_idx=query_idx
+        )
+        cand_indices = pool
 
     # 3. Filter same series
     if filter_series:
-        cand_indices = filter_same_series(cand_indices, query_idx, metadata)
+        with stage(pipeline="cli", stage="filter_same_series"):
+            cand_indices = filter_same_series(cand_indices, query_idx, metadata)
         if len(cand_indices) == 0:
             print("⚠️  All candidates filtered out, using top results without filtering")
-            cand_indices, _ = knn_search(query_vec, embeddings, k=k, exclude_idx=query_idx)
+            pool, pool_sims = knn_search(query_vec, embeddings, k=k, exclude_idx=query_idx)
+            cand_indices = pool
 
     # 4. MMR re-ranking
     if use_mmr and len(cand_indices) > k:
-        cand_emb = embeddings[cand_indices]
-        mmr_order = mmr_rerank(cand_emb, query_vec, lambda_mult, top_n=k*3)
-        cand_indices = cand_indices[mmr_order]
+        with stage(pipeline="cli", stage="mmr_rerank"):
+            cand_emb = rows(embeddings, cand_indices)
+            mmr_order = mmr_rerank(cand_emb, query_vec, lambda_mult, top_n=k*3)
+            cand_indices = cand_indices[mmr_order]
 
     # 5. Genre diversity
     if diversify_genres:
-        cand_indices = diversify_by_genre(cand_indices[:k*2], metadata, max_per_genre=3)
+        with stage(pipeline="cli", stage="diversify_by_genre"):
+            cand_indices = diversify_by_genre(cand_indices[:k*2], metadata, max_per_genre=3)
 
     # 6. Final selection
-    final_indices = cand_indices[:k]
+    final_indices = np.asarray(cand_indices[:k], dtype=np.intp)
+    final_sims = gather_similarities(final_indices, pool, pool_sims)
 
-    # 7. Prepare results with lookups
+    # 7. Prepare results from the display store
+    with stage(pipeline="cli", stage="response_build"):
+        records = get_display_store(metadata, raw_data).records(final_indices, final_sims)
     results = []
-    for rank, idx in enumerate(final_indices, 1):
-        anime_id = metadata.iloc[idx].get('anime_id')
-        sim_score = cosine_similarity_batch(query_vec, embeddings[idx:idx+1])[0]
-
-        # Lookup in raw_data
-        info = raw_data[raw_data['anime_id'] == anime_id]
-        if not info.empty:
-            name = info.iloc[0].get('name', 'Unknown')
-            score = info.iloc[0].get('score', 'N/A')
-            episodes = info.iloc[0].get('episodes', 'N/A')
-            genres = info.iloc[0].get('genres', 'N/A')
-        else:
-            name = metadata.iloc[idx].get('name', 'Unknown')
-            score = metadata.iloc[idx].get('score', 'N/A')
-            episodes = metadata.iloc[idx].get('episodes', 'N/A')
-            genres = 'N/A'
-
+    for rank, rec in enumerate(records, 1):
         result = {
             'rank': rank,
-            'anime_id': anime_id,
-            'name': name,
-            'similarity': float(sim_score),
-            'score': score,
-            'episodes': episodes,
-            'genres': genres
+            'anime_id': rec['anime_id'],
+            'name': rec['name'],
+            'similarity': rec['similarity'],
+            'score': rec['score'],
+            'episodes': rec['episodes'],
+            'genres': rec['genres']
         }
         results.append(result)
 
         if verbose:
-            print(f"{rank:2d}. [{anime_id:6d}] {name[:50]:50s} | sim={sim_score:.4f} | score={score} | eps={episodes}")
+            print(f"{rank:2d}. [{result['anime_id']:6d}] {str(result['name'])[:50]:50s} | "
+                  f"sim={result['similarity']:.4f} | score={result['score']} | eps={result['episodes']}")
 
     elapsed = time.time() - start_time
     if verbose:
@@ -419,7 +946,7 @@ def test_series_filtering(query_name: str,
         print(f"   Series Key: {query_row.get('series_key', 'N/A')}")
 
     # Get candidates without filtering
-    query_vec = embeddings[query_idx]
+    query_vec = rows(embeddings, query_idx)
     cand_indices, cand_sims = knn_search(
         query_vec, embeddings,
         k=top_n,
@@ -471,15 +998,105 @@ def test_series_filtering(query_name: str,
 
 """# BATCH QUERY"""
 
-def batch_recommend(anime_names: List[str], **kwargs) -> Dict[str, List[Dict]]:
+def recommend_batch(query_indices: List[int],
+                    embeddings: np.ndarray,
+                    metadata: pd.DataFrame,
+                    k: int = 10,
+                    candidates: int = 100,
+                    use_mmr: bool = True,
+                    lambda_mult: float = 0.7,
+                    filter_series: bool = True,
+                    diversify_genres: bool = True,
+                    max_per_genre: int = 3,
+                    genre_codes: Optional[np.ndarray] = None) -> List[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Batched version of the recommend_anime pipeline for catalog rows.
+
+    All candidate pools come from one knn_search_batch call, series
+    filtering is one SeriesIndex mask over the (Q, C) pools, MMR runs as one
+    mmr_rerank_batch call, and genre diversity uses precomputed integer codes.
+
+    Returns:
+        One (indices, similarities) pair per query, at most k long.
+    """
+    query_indices = np.asarray(query_indices, dtype=np.intp)
+    if len(query_indices) == 0:
+        return []
+    if genre_codes is None and diversify_genres:
+        genre_codes, _ = main_genre_codes(metadata)
+
+    query_vecs = rows(embeddings, query_indices)
+    pools, pool_sims = knn_search_batch(query_vecs, embeddings, k=candidates,
+                                        exclude_idx=query_indices)
+
+    if filter_series:
+        keep = ~get_series_index(metadata).same_series_mask_batch(pools, query_indices)
+        filtered = [pools[q, keep[q]] if keep[q].any() else pools[q, :k] for q in range(len(pools))]
+    else:
+        filtered = list(pools)
+
+    # MMR for every pool larger than k, padded into one (Q, C) batch
+    if use_mmr:
+        rerank = [q for q, c in enumerate(filtered) if len(c) > k]
+        if rerank:
+            width = max(len(filtered[q]) for q in rerank)
+            padded = np.zeros((len(rerank), width), dtype=np.intp)
+            valid = np.zeros((len(rerank), width), dtype=bool)
+            for row, q in enumerate(rerank):
+                padded[row, :len(filtered[q])] = filtered[q]
+                valid[row, :len(filtered[q])] = True
+
+            order = mmr_rerank_batch(rows(embeddings, padded), query_vecs[rerank],
+                                     lambda_mult, top_n=k*3, valid=valid)
+            for row, q in enumerate(rerank):
+                picks = order[row][order[row] >= 0]
+                filtered[q] = padded[row, picks]
+
+    results = []
+    for q, cand_indices in enumerate(filtered):
+        query_vec = query_vecs[q]
+        if diversify_genres:
+            cand_indices = diversify_by_genre_codes(cand_indices[:k*2], genre_codes, max_per_genre)
+
+        final = np.asarray(cand_indices[:k], dtype=np.intp)
+        results.append((final, rows(embeddings, final) @ query_vec))
+
+    return results
+
+
+def batch_recommend(anime_names: List[str], verbose: bool = False, **kwargs) -> Dict[str, List[Dict]]:
     """
     Get recommendations for multiple anime at once.
+    Names are resolved in one pass, scored by recommend_batch and filled in
+    from the display store.
     """
-    results = {}
-    for name in anime_names:
-        print(f"\n{'='*80}")
-        results[name] = recommend_anime(name, embeddings, metadata, raw_data,
-                                       verbose=True, **kwargs)
+    start_time = time.time()
+
+    embeddings, metadata, raw_data = engine.embeddings, engine.metadata, engine.raw_data
+
+    resolved = find_anime_by_names(anime_names, metadata)
+    found = [(name, idx) for name, idx in zip(anime_names, resolved) if idx is not None]
+    batches = recommend_batch([idx for _, idx in found], embeddings, metadata, **kwargs)
+
+    store = get_display_store(metadata, raw_data)
+    results = {name: [] for name in anime_names}
+    for (name, _), (idx, sims) in zip(found, batches):
+        results[name] = [
+            {
+                'rank': rank,
+                'anime_id': rec['anime_id'],
+                'name': rec['name'],
+                'similarity': rec['similarity'],
+                'score': rec['score'],
+                'episodes': rec['episodes'],
+                'genres': rec['genres'],
+            }
+            for rank, rec in enumerate(store.records(idx, sims), 1)
+        ]
+
+    if verbose:
+        missing = len(anime_names) - len(found)
+        print(f"⏱️  {len(found)} queries in {time.time() - start_time:.3f}s ({missing} not found)")
     return results
 
 #Example batch usage:
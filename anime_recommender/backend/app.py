@@ -1,50 +1,261 @@
-from flask import Flask, jsonify, request, send_from_directory
+from flask import Flask, Response, jsonify, request, send_from_directory
 from flask_cors import CORS
-from recommender_knn import AnimeKNNRecommender
-from gemini_client import chat_with_gemini
+from recommender_knn import BATCH_BLOCK, LazyRecommender, SEED_MODES
+from response_cache import cache_from_env, make_key
+from response_formats import JSON, encode_columns, negotiate
+from gemini_client import ChatBusy, GEMINI_MODEL, SYSTEM_PROMPT, chat_with_gemini, stream_chat_with_gemini
+from chat_cache import ChatCache
+from metrics import CONTENT_TYPE, REGISTRY, REQUESTS, REQUEST_SECONDS, cache_collector
+import json
 import os
+import time
+import zlib
 from dotenv import load_dotenv
 
 load_dotenv()
 
-app = Flask(__name__, static_folder='../frontend/public', static_url_path='')
-CORS(app)
-
-recommender = AnimeKNNRecommender()
-
-# Serve the frontend
-@app.route("/")
-def index():
-    return send_from_directory(app.static_folder, 'index.html')
-
-@app.route("/<path:path>")
-def serve_static(path):
-    return send_from_directory(app.static_folder, path)
-
-@app.route("/api/search", methods=["GET"])
-def search():
-    q = request.args.get("q", "")
-    return jsonify(recommender.search(q))
-
-@app.route("/api/recommend", methods=["POST"])
-def recommend():
-    data = request.get_json()
-    anime_ids = data.get("anime_ids", [])
-    k = int(data.get("k", 20))
-    results = recommender.recommend(anime_ids, k=k)
-    return jsonify({"recommendations": results})
-
-@app.route("/api/chat", methods=["POST"])
-def chat():
-    user_message = request.json.get("message", "")
-    if not user_message:
-        return jsonify({"error": "Message required"}), 400
-
-    try:
-        response = chat_with_gemini(user_message)
-        return jsonify({"reply": response})
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+MAX_BATCH = int(os.getenv("RECOMMEND_MAX_BATCH", "5000"))
+
+
+def _negotiated(response: Response) -> Response:
+    """Mark a response whose format depends on Accept, so caches key on it."""
+    response.vary.add("Accept")
+    return response
+
+
+def _is_anime_id(value) -> bool:
+    # JSON true/false decode to bool, a subclass of int
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def create_app(preload: bool = False) -> Flask:
+    """
+    Build the Flask app.
+
+    With preload, the recommender is loaded before returning; gunicorn (see
+    gunicorn.conf.py) does this once in the master so workers inherit the
+    data copy-on-write. Otherwise data loads in a background warm-up thread
+    and /readyz reports progress; requests arriving earlier wait for it.
+    """
+    app = Flask(__name__, static_folder='../frontend/public', static_url_path='')
+    CORS(app)
+
+    recommender = LazyRecommender()
+    response_cache = cache_from_env()
+    chat_cache = ChatCache(
+        cache_from_env("CHAT_CACHE"),
+        # Resolve titles once the title index is built; don't block chat on it
+        title_index=lambda: (recommender.get().title_index
+                             if recommender.ready and recommender.get().title_index_loaded else None),
+        namespace=f"{GEMINI_MODEL}/{zlib.crc32(SYSTEM_PROMPT.encode('utf-8')):08x}",
+    )
+    REGISTRY.add_collector("recommend_cache", cache_collector("recommend", response_cache.stats))
+    REGISTRY.add_collector("chat_cache", cache_collector("chat", chat_cache.stats))
+
+    if preload:
+        recommender.get()
+    else:
+        recommender.warm_up()
+
+    @app.before_request
+    def start_timer():
+        request.start_time = time.perf_counter()
+
+    @app.after_request
+    def record_request(response):
+        # Label by route pattern, not raw path, to keep cardinality bounded
+        endpoint = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        REQUEST_SECONDS.observe(time.perf_counter() - request.start_time, endpoint=endpoint)
+        REQUESTS.inc(endpoint=endpoint, method=request.method, status=response.status_code)
+        return response
+
+    @app.route("/metrics", methods=["GET"])
+    def metrics():
+        return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
+
+    # Serve the frontend
+    @app.route("/")
+    def index():
+        return send_from_directory(app.static_folder, 'index.html')
+
+    @app.route("/<path:path>")
+    def serve_static(path):
+        return send_from_directory(app.static_folder, path)
+
+    @app.route("/healthz", methods=["GET"])
+    def healthz():
+        return jsonify({"status": "ok"})
+
+    @app.route("/readyz", methods=["GET"])
+    def readyz():
+        status = recommender.status()
+        return jsonify(status), (200 if status["recommender_ready"] else 503)
+
+    @app.route("/api/search", methods=["GET"])
+    def search():
+        q = request.args.get("q", "")
+        fuzzy = request.args.get("fuzzy", "").lower() in ("1", "true", "yes")
+        fmt = negotiate(request.accept_mimetypes)
+        if fmt != JSON:
+            columns = recommender.get().search_columns(q, fuzzy=fuzzy)
+            return _negotiated(Response(encode_columns(columns, fmt), mimetype=fmt))
+        return _negotiated(jsonify(recommender.get().search(q, fuzzy=fuzzy)))
+
+    @app.route("/api/recommend", methods=["POST"])
+    def recommend():
+        data = request.get_json()
+        anime_ids = data.get("anime_ids", [])
+        k = int(data.get("k", 20))
+        lambda_mult = float(data.get("lambda_mult", 0.7))
+        mode = data.get("mode", "centroid")
+        if mode not in SEED_MODES:
+            return jsonify({"error": f"mode must be one of {list(SEED_MODES)}"}), 400
+
+        # Multi-seed scoring doesn't depend on seed order
+        rec = recommender.get()
+        seeds = rec.resolve_seeds(anime_ids)
+        key = make_key(tuple(sorted(seeds)), k, lambda_mult, mode, rec.dataset_version)
+
+        # Binary formats are built from display store columns, cached per format
+        fmt = negotiate(request.accept_mimetypes)
+        if fmt != JSON:
+            body = response_cache.get_or_compute(
+                make_key(key, fmt),
+                lambda: encode_columns(rec.recommend_columns(seeds, k=k, lambda_mult=lambda_mult, mode=mode), fmt)
+            )
+            return _negotiated(Response(body, mimetype=fmt))
+
+        body = response_cache.get_or_compute(
+            key, lambda: rec.recommend_json(seeds, k=k, lambda_mult=lambda_mult, mode=mode)
+        )
+        return _negotiated(Response('{"recommendations": ' + body + '}', mimetype="application/json"))
+
+    @app.route("/api/recommend/batch", methods=["POST"])
+    def recommend_batch():
+        """
+        Recommendations for many seed lists in one call.
+
+        Body: {"seeds": {key: [anime_id, ...], ...} or [[anime_id, ...], ...],
+               "k", "lambda_mult", "mode", "stream"}
+        List seeds are keyed by their comma-joined ids (identical lists are
+        answered once). Every entry is validated before any output, so a bad
+        id is a 400, never an error mid-stream. With "stream" (or Accept:
+        application/x-ndjson) results are sent as NDJSON lines,
+        {"key": ..., "recommendations": [...]}, as each block is scored.
+        """
+        data = request.get_json(silent=True) or {}
+        seeds = data.get("seeds")
+        if isinstance(seeds, dict):
+            keys, seed_lists = [str(key) for key in seeds], list(seeds.values())
+        elif isinstance(seeds, list):
+            keys, seed_lists = None, seeds
+        else:
+            return jsonify({"error": "seeds must be an object or a list of anime_id lists"}), 400
+        if not all(isinstance(ids, list) and all(_is_anime_id(aid) for aid in ids) for ids in seed_lists):
+            return jsonify({"error": "each seed entry must be a list of integer anime_ids"}), 400
+        if len(seed_lists) > MAX_BATCH:
+            return jsonify({"error": f"at most {MAX_BATCH} seed lists per batch"}), 413
+        if keys is None:
+            keys = [",".join(str(aid) for aid in ids) for ids in seed_lists]
+            # Identical lists would repeat a key in the response object: answer each once
+            unique = dict(zip(keys, seed_lists))
+            keys, seed_lists = list(unique), list(unique.values())
+
+        k = int(data.get("k", 20))
+        lambda_mult = float(data.get("lambda_mult", 0.7))
+        mode = data.get("mode", "centroid")
+        if mode not in SEED_MODES:
+            return jsonify({"error": f"mode must be one of {list(SEED_MODES)}"}), 400
+
+        rec = recommender.get()
+        # Resolved up front, so nothing about the input can fail mid-stream
+        resolved = [rec.resolve_seeds(ids) for ids in seed_lists]
+
+        def results():
+            # Entries already cached by /api/recommend (or earlier batches) are
+            # served from the cache; only the misses in a block are scored
+            for start in range(0, len(resolved), BATCH_BLOCK):
+                block = resolved[start:start + BATCH_BLOCK]
+                cache_keys = [make_key(tuple(sorted(s)), k, lambda_mult, mode, rec.dataset_version)
+                              for s in block]
+                bodies = [response_cache.get(key) for key in cache_keys]
+                missing = [i for i, body in enumerate(bodies) if body is None]
+                if missing:
+                    computed = rec.recommend_json_batch([block[i] for i in missing], k=k,
+                                                        lambda_mult=lambda_mult, mode=mode)
+                    for i, body in zip(missing, computed):
+                        response_cache.set(cache_keys[i], body)
+                        bodies[i] = body
+                for i, body in enumerate(bodies):
+                    yield keys[start + i], body
+
+        stream = data.get("stream") or "application/x-ndjson" in request.headers.get("Accept", "")
+        if stream:
+            lines = (f'{{"key": {json.dumps(key)}, "recommendations": {body}}}\n' for key, body in results())
+            return _negotiated(Response(lines, mimetype="application/x-ndjson"))
+
+        body = ", ".join(f"{json.dumps(key)}: {body}" for key, body in results())
+        return _negotiated(Response('{"recommendations": {' + body + '}}', mimetype="application/json"))
+
+    @app.route("/api/cache/stats", methods=["GET"])
+    def cache_stats():
+        return jsonify(response_cache.stats())
+
+    @app.route("/api/chat", methods=["POST"])
+    def chat():
+        user_message = request.json.get("message", "")
+        if not user_message:
+            return jsonify({"error": "Message required"}), 400
+
+        try:
+            response = chat_cache.reply(user_message, chat_with_gemini)
+            return jsonify({"reply": response})
+        except ChatBusy as e:
+            return jsonify({"error": str(e)}), 429
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
+
+    @app.route("/api/chat/stream", methods=["POST"])
+    def chat_stream():
+        """Server-sent events: one `data: {"text": ...}` per chunk, then `event: done`."""
+        user_message = (request.get_json(silent=True) or {}).get("message", "")
+        if not user_message:
+            return jsonify({"error": "Message required"}), 400
+
+        sse_headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        cached = chat_cache.get(user_message)
+        if cached is not None:
+            body = f"data: {json.dumps({'text': cached})}\n\nevent: done\ndata: {{}}\n\n"
+            return Response(body, mimetype="text/event-stream", headers=sse_headers)
+
+        try:
+            # Identical messages already streaming share that upstream call
+            chunks = chat_cache.stream(user_message, stream_chat_with_gemini)
+        except ChatBusy as e:
+            return jsonify({"error": str(e)}), 429
+        except Exception as e:
+            return jsonify({"error": str(e)}), 500
+
+        def events():
+            try:
+                for text in chunks:
+                    yield f"data: {json.dumps({'text': text})}\n\n"
+                yield "event: done\ndata: {}\n\n"
+            except Exception as e:
+                yield f"event: error\ndata: {json.dumps({'error': str(e)})}\n\n"
+
+        response = Response(events(), mimetype="text/event-stream", headers=sse_headers)
+        # Frees the chat slot (once no reader is left) even if the client goes
+        # away before the first chunk
+        response.call_on_close(chunks.close)
+        return response
+
+    @app.route("/api/chat/cache/stats", methods=["GET"])
+    def chat_cache_stats():
+        return jsonify(chat_cache.stats())
+
+    return app
+
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=5000, debug=False)
\ No newline at end of file
+    create_app().run(host="0.0.0.0", port=5000, debug=False)
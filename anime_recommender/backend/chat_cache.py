@@ -0,0 +1,248 @@
+# chat_cache.py
+"""
+Cache in front of the Gemini chat.
+
+Messages are normalized before keying: case, whitespace and punctuation
+are folded, and anime titles are resolved through the catalog's
+TitleIndex, so "What should I watch after Naruto?" and "what should i
+watch after naruto" share one reply. Replies live in a ResponseCache
+(bounded LRU + TTL, single-flight, optional shared SQLite tier), so
+concurrent identical messages make one upstream call.
+
+Streamed replies are single-flight too: concurrent identical messages
+share one upstream stream (SharedStream), later readers replaying the
+chunks already received, and the joined text is cached when it ends.
+
+stats() adds upstream latency and the time saved by hits to the cache
+counters.
+"""
+from __future__ import annotations
+from typing import Callable, Dict, Iterator, List, Optional
+import threading
+import time
+from response_cache import ResponseCache, make_key
+from title_index import TitleIndex, strip_punctuation
+
+
+class SharedStream:
+    """
+    One upstream chunk iterator read by any number of StreamReaders.
+
+    Chunks are kept, so a reader that joins late starts from the first one.
+    Whichever reader runs out of buffered chunks pulls the next one from
+    upstream; the others wait for it. When the last reader closes before
+    the end, the upstream is closed (freeing its chat slot).
+
+    on_finish(text) is called once: the joined text when upstream is
+    exhausted, None when it fails or is abandoned.
+    """
+
+    def __init__(self, chunks: Iterator[str], on_finish: Callable[[Optional[str]], None]):
+        self._chunks = chunks
+        self._on_finish = on_finish
+        self._parts: List[str] = []
+        self._done = False
+        self._error: Optional[BaseException] = None
+        self._pulling = False
+        self._readers = 0
+        self._cond = threading.Condition()
+
+    def subscribe(self) -> Optional["StreamReader"]:
+        """A reader from the first chunk, or None once the stream has ended."""
+        with self._cond:
+            if self._done:
+                return None
+            self._readers += 1
+        return StreamReader(self)
+
+    def _chunk(self, i: int) -> str:
+        while True:
+            with self._cond:
+                while i >= len(self._parts) and not self._done and self._pulling:
+                    self._cond.wait()
+                if i < len(self._parts):
+                    return self._parts[i]
+                if self._done:
+                    if self._error is not None:
+                        raise self._error
+                    raise StopIteration
+                self._pulling = True
+            self._pull()
+
+    def _pull(self):
+        try:
+            text = next(self._chunks)
+        except StopIteration:
+            self._finish(None)
+        except BaseException as e:
+            self._finish(e)
+        else:
+            with self._cond:
+                self._parts.append(text)
+                self._pulling = False
+                self._cond.notify_all()
+
+    def _finish(self, error: Optional[BaseException]):
+        with self._cond:
+            if self._done:
+                return
+            self._done, self._error, self._pulling = True, error, False
+            self._cond.notify_all()
+        self._on_finish(None if error is not None else "".join(self._parts))
+
+    def _leave(self):
+        with self._cond:
+            self._readers -= 1
+            abandoned = self._readers == 0 and not self._done
+        if abandoned:
+            close = getattr(self._chunks, "close", None)
+            if close is not None:
+                close()
+            self._finish(RuntimeError("Stream closed by every reader"))
+
+
+class StreamReader:
+    """Iterator over a SharedStream's chunks; close() when done (safe before the first chunk)."""
+
+    def __init__(self, stream: SharedStream):
+        self._stream = stream
+        self._pos = 0
+        self._closed = False
+
+    def __iter__(self) -> Iterator[str]:
+        return self
+
+    def __next__(self) -> str:
+        if self._closed:
+            raise StopIteration
+        try:
+            text = self._stream._chunk(self._pos)
+        except BaseException:
+            self.close()
+            raise
+        self._pos += 1
+        return text
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self._stream._leave()
+
+
+class ChatCache:
+    """
+    Args:
+        cache: storage for replies, e.g. cache_from_env("CHAT_CACHE")
+        title_index: returns the catalog TitleIndex, or None while it is not
+            loaded yet (messages are then keyed without title resolution)
+        namespace: folded into every key; include the model and prompt version
+    """
+
+    def __init__(self,
+                 cache: ResponseCache,
+                 title_index: Optional[Callable[[], Optional[TitleIndex]]] = None,
+                 namespace: str = ""):
+        self.cache = cache
+        self.title_index = title_index
+        self.namespace = namespace
+
+        self._lock = threading.Lock()
+        self._streams: Dict[str, SharedStream] = {}
+        self.upstream_calls = 0
+        self.upstream_seconds = 0.0
+        self.saved_seconds = 0.0
+
+    def normalize(self, message: str) -> str:
+        index = self.title_index() if self.title_index is not None else None
+        if index is not None:
+            return index.canonicalize(message)
+        return strip_punctuation(message)
+
+    def key(self, message: str) -> str:
+        return make_key("chat", self.namespace, self.normalize(message))
+
+    def get(self, message: str) -> Optional[str]:
+        """Cached reply or None; hits are credited with the mean upstream latency."""
+        reply = self.cache.get(self.key(message))
+        if reply is not None:
+            self._credit(0.0)
+        return reply
+
+    def set(self, message: str, reply: str, upstream_seconds: Optional[float] = None):
+        """Store a reply computed elsewhere (e.g. assembled from a stream)."""
+        if upstream_seconds is not None:
+            self._record(upstream_seconds)
+        self.cache.set(self.key(message), reply)
+
+    def reply(self, message: str, compute: Callable[[str], str]) -> str:
+        """Cached reply for message, calling compute(message) once on a miss."""
+        start = time.perf_counter()
+        computed = False
+
+        def run() -> str:
+            nonlocal computed
+            computed = True
+            value = compute(message)
+            self._record(time.perf_counter() - start)
+            return value
+
+        value = self.cache.get_or_compute(self.key(message), run)
+        if not computed:
+            self._credit(time.perf_counter() - start)
+        return value
+
+    def stream(self, message: str, start: Callable[[str], Iterator[str]]) -> StreamReader:
+        """
+        Reader over the streamed reply for message. Joins the in-flight
+        stream for an identical message, else calls start(message) (which
+        may raise, e.g. ChatBusy). The full reply is cached when it ends.
+        """
+        key = self.key(message)
+        with self._lock:
+            shared = self._streams.get(key)
+            reader = shared.subscribe() if shared is not None else None
+            if reader is not None:
+                self._credit_locked(0.0)
+                return reader
+
+            began = time.perf_counter()
+
+            def on_finish(text: Optional[str]):
+                with self._lock:
+                    if self._streams.get(key) is shared:
+                        del self._streams[key]
+                if text is not None:
+                    self.set(message, text.strip(), time.perf_counter() - began)
+
+            # Started under the lock, so a concurrent identical message can't start a second one
+            shared = SharedStream(start(message), on_finish)
+            self._streams[key] = shared
+            return shared.subscribe()
+
+    def _record(self, seconds: float):
+        with self._lock:
+            self.upstream_calls += 1
+            self.upstream_seconds += seconds
+
+    def _credit(self, waited: float):
+        # A hit (or a request coalesced onto another's call) saves roughly
+        # one average upstream round trip, minus any time spent waiting
+        with self._lock:
+            self._credit_locked(waited)
+
+    def _credit_locked(self, waited: float):
+        if self.upstream_calls:
+            mean = self.upstream_seconds / self.upstream_calls
+            self.saved_seconds += max(0.0, mean - waited)
+
+    def stats(self) -> Dict[str, float]:
+        stats = self.cache.stats()
+        with self._lock:
+            stats.update({
+                "upstream_calls": self.upstream_calls,
+                "upstream_seconds": round(self.upstream_seconds, 3),
+                "mean_upstream_seconds": round(self.upstream_seconds / self.upstream_calls, 3)
+                if self.upstream_calls else 0.0,
+                "saved_seconds": round(self.saved_seconds, 3),
+            })
+        return stats
@@ -0,0 +1,138 @@
+# display_store.py
+"""
+Columnar display data for building recommendation responses.
+
+Joins raw_data onto metadata once, row-aligned with `embeddings`, so a
+response for k results is k array gathers instead of k boolean scans of
+raw_data. Values are sanitized up front (NaN/inf → None, NumPy scalars →
+Python types), and each row can carry a pre-serialized JSON fragment.
+
+The fragments live in one UTF-8 bytes blob indexed by an int64 offsets
+array rather than as millions of small str objects, so serving them from
+a forked worker doesn't write refcounts into shared pages.
+"""
+from __future__ import annotations
+from typing import Dict, List, Optional
+import json
+import math
+import numpy as np
+import pandas as pd
+
+FIELDS = ("anime_id", "name", "score", "episodes", "genres", "image_url", "anime_url")
+
+# Fallbacks when a column is missing from metadata
+META_DEFAULTS = {"name": "Unknown", "score": "N/A", "episodes": "N/A", "genres": "N/A"}
+
+
+def clean_json_value(value):
+    if isinstance(value, float) and (math.isnan(value) or math.isinf(value)):
+        return None
+    if pd.isna(value):
+        return None
+    return value
+
+
+def _python_value(value):
+    """NumPy scalars → Python, then sanitize for JSON."""
+    if isinstance(value, np.generic):
+        value = value.item()
+    return clean_json_value(value)
+
+
+class DisplayStore:
+    """
+    Per-row display fields aligned with `metadata` positions.
+    Prefers raw_data values, falling back to metadata when the id has no
+    raw_data row.
+    """
+
+    def __init__(self, metadata: pd.DataFrame, raw_data: pd.DataFrame, with_json: bool = True):
+        n = len(metadata)
+        meta_ids = pd.to_numeric(metadata["anime_id"], errors="coerce").to_numpy()
+
+        raw = raw_data.drop_duplicates(subset="anime_id", keep="first")
+        raw_pos = pd.Index(raw["anime_id"]).get_indexer(meta_ids)
+        in_raw = raw_pos >= 0
+
+        self.columns: Dict[str, np.ndarray] = {}
+        self.columns["anime_id"] = np.array([None if pd.isna(a) else int(a) for a in meta_ids], dtype=object)
+
+        for field in FIELDS[1:]:
+            if field in metadata.columns:
+                meta_vals = metadata[field].to_numpy(dtype=object)
+            else:
+                meta_vals = np.full(n, META_DEFAULTS.get(field), dtype=object)
+            if field in ("image_url", "anime_url"):
+                meta_vals = np.full(n, None, dtype=object)
+
+            if field in raw.columns:
+                raw_vals = raw[field].to_numpy(dtype=object)[raw_pos]
+            else:
+                raw_vals = meta_vals if field in META_DEFAULTS else np.full(n, None, dtype=object)
+
+            merged = np.where(in_raw, raw_vals, meta_vals)
+            self.columns[field] = np.array([_python_value(v) for v in merged], dtype=object)
+
+        self.json_blob: Optional[bytes] = None
+        self.json_offsets: Optional[np.ndarray] = None
+        if with_json:
+            encoded = [
+                json.dumps({f: self.columns[f][i] for f in FIELDS})[:-1].encode("utf-8")
+                for i in range(n)
+            ]
+            self.json_offsets = np.zeros(n + 1, dtype=np.int64)
+            np.cumsum([len(e) for e in encoded], out=self.json_offsets[1:])
+            self.json_blob = b"".join(encoded)
+
+    def __len__(self) -> int:
+        return len(self.columns["anime_id"])
+
+    def column(self, field: str, indices: np.ndarray) -> np.ndarray:
+        return self.columns[field][indices]
+
+    def records(self, indices: np.ndarray, similarities: np.ndarray) -> List[Dict]:
+        """Response objects for the given rows, in order."""
+        cols = {f: self.columns[f][indices].tolist() for f in FIELDS}
+        sims = [_python_value(float(s)) for s in similarities]
+        return [
+            {
+                "anime_id": cols["anime_id"][i],
+                "name": cols["name"][i],
+                "similarity": sims[i],
+                "score": cols["score"][i],
+                "episodes": cols["episodes"][i],
+                "genres": cols["genres"][i],
+                "image_url": cols["image_url"][i],
+                "anime_url": cols["anime_url"][i],
+            }
+            for i in range(len(sims))
+        ]
+
+    def column_batch(self, indices: np.ndarray, similarities: np.ndarray) -> Dict[str, list]:
+        """Response fields as columns (field -> list), for binary encoders."""
+        batch = {f: self.columns[f][indices].tolist() for f in FIELDS}
+        batch["similarity"] = [_python_value(float(s)) for s in similarities]
+        return batch
+
+    def to_json(self, indices: np.ndarray, similarities: np.ndarray) -> str:
+        """JSON array of the response objects, joined from prebuilt fragments."""
+        if self.json_blob is None:
+            return json.dumps(self.records(indices, similarities))
+        blob, offsets = self.json_blob, self.json_offsets
+        parts = [
+            blob[offsets[i]:offsets[i + 1]].decode("utf-8")
+            + f', "similarity": {json.dumps(_python_value(float(s)))}}}'
+            for i, s in zip(np.asarray(indices).tolist(), similarities)
+        ]
+        return "[" + ",".join(parts) + "]"
+
+
+_display_stores = {}
+
+
+def get_display_store(metadata: pd.DataFrame, raw_data: pd.DataFrame) -> DisplayStore:
+    """Build the store for a (metadata, raw_data) pair once and reuse it."""
+    key = (id(metadata), id(raw_data))
+    if key not in _display_stores:
+        _display_stores[key] = DisplayStore(metadata, raw_data)
+    return _display_stores[key]
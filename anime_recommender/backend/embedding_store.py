@@ -0,0 +1,154 @@
+# embedding_store.py
+"""
+Raw, memory-mappable copy of the embeddings.
+
+embeddings.parquet stores one Python list per row, so every process has to
+decode and vstack it into a private matrix. This module exports the matrix
+once to a contiguous .npy file (standard NumPy header + raw float32 or
+float16 rows) with the row-aligned anime_ids next to it. The backend opens
+it with np.load(mmap_mode="r"): startup is just an mmap, and every gunicorn
+worker reads the same page-cache pages instead of holding its own copy.
+
+A small JSON sidecar records the fingerprint of the float32 source matrix,
+so index artifacts built from either copy match, whatever the export dtype.
+float16 rows are only a storage format: scan_scores() and rows() upcast
+them to float32 (one block at a time for full scans) before any matmul.
+
+Export with:
+    python embedding_store.py [float32|float16]
+"""
+from __future__ import annotations
+from typing import Optional, Tuple
+from pathlib import Path
+import json
+import os
+import numpy as np
+import pandas as pd
+
+from neighbor_table import embeddings_fingerprint
+
+# Rows upcast per step when scanning a float16 store (4096 × 768 float32 ≈ 12 MB)
+SCAN_BLOCK_ROWS = 4096
+
+
+def ids_path_for(npy_path: Path) -> Path:
+    """Sidecar file holding the anime_id of every row."""
+    npy_path = Path(npy_path)
+    return npy_path.with_name(npy_path.stem + "_ids.npy")
+
+
+def meta_path_for(npy_path: Path) -> Path:
+    """Sidecar file holding the source fingerprint and export dtype."""
+    npy_path = Path(npy_path)
+    return npy_path.with_name(npy_path.stem + "_meta.json")
+
+
+def _atomic_save(path: Path, array: np.ndarray):
+    # Write next to the target and rename, so workers never map a half-written file
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        np.save(f, array)
+    os.replace(tmp, path)
+
+
+def export_embeddings(emb_df: pd.DataFrame, npy_path: Path, dtype: str = "float32") -> np.ndarray:
+    """Write the parquet embeddings table to a contiguous .npy plus its sidecars."""
+    npy_path = Path(npy_path)
+    source = np.vstack(emb_df["embedding"].values)
+    embeddings = np.ascontiguousarray(source, dtype=dtype)
+    ids = pd.to_numeric(emb_df["anime_id"], errors="coerce").to_numpy(dtype=np.int64)
+    meta = {"fingerprint": embeddings_fingerprint(source), "dtype": str(embeddings.dtype)}
+
+    _atomic_save(ids_path_for(npy_path), ids)
+    _atomic_save(npy_path, embeddings)
+    # Written last: an export without it is never considered fresh
+    tmp = meta_path_for(npy_path).with_suffix(".json.tmp")
+    tmp.write_text(json.dumps(meta))
+    os.replace(tmp, meta_path_for(npy_path))
+    return embeddings
+
+
+def is_fresh(npy_path: Path, source_path: Path) -> bool:
+    """True if the export and its sidecars exist and are not older than the parquet source."""
+    npy_path = Path(npy_path)
+    if not all(p.exists() for p in (npy_path, ids_path_for(npy_path), meta_path_for(npy_path))):
+        return False
+    source_path = Path(source_path)
+    return not source_path.exists() or npy_path.stat().st_mtime >= source_path.stat().st_mtime
+
+
+def open_embeddings(npy_path: Path) -> Tuple[np.ndarray, np.ndarray, int]:
+    """
+    Memory-map the exported matrix read-only.
+
+    Returns:
+        embeddings: (N, dim) np.memmap backed by the shared page cache
+        anime_ids: (N,) anime_id per row
+        fingerprint: embeddings_fingerprint of the float32 source
+    """
+    npy_path = Path(npy_path)
+    embeddings = np.load(npy_path, mmap_mode="r")
+    anime_ids = np.load(ids_path_for(npy_path))
+    if len(anime_ids) != len(embeddings):
+        raise ValueError(f"{npy_path.name} and its ids sidecar disagree on row count")
+    meta = json.loads(meta_path_for(npy_path).read_text())
+    return embeddings, anime_ids, int(meta["fingerprint"])
+
+
+def load_embeddings(npy_path: Path,
+                    parquet_path: Path,
+                    anime_ids: Optional[np.ndarray] = None) -> Tuple[np.ndarray, pd.DataFrame, bool, int]:
+    """
+    Prefer a fresh memory-mapped export; otherwise decode the parquet file.
+
+    Args:
+        anime_ids: expected row order (metadata.anime_id). An export whose ids
+                   differ is stale, even if its mtime looks fine.
+
+    Returns:
+        embeddings, emb_df, mapped (True when served from the .npy export),
+        fingerprint (embeddings_fingerprint of the float32 source, computed once).
+        emb_df only has anime_id when mapped.
+    """
+    if is_fresh(npy_path, parquet_path):
+        embeddings, ids, fingerprint = open_embeddings(npy_path)
+        if anime_ids is None or np.array_equal(ids, np.asarray(anime_ids, dtype=np.int64)):
+            return embeddings, pd.DataFrame({"anime_id": ids}), True, fingerprint
+        print(f"⚠️  {Path(npy_path).name} rows don't match the metadata ids, decoding {Path(parquet_path).name}")
+
+    emb_df = pd.read_parquet(parquet_path)
+    embeddings = np.vstack(emb_df["embedding"].values)
+    return embeddings, emb_df, False, embeddings_fingerprint(embeddings)
+
+
+def rows(embeddings: np.ndarray, idx) -> np.ndarray:
+    """embeddings[idx], upcast to float32 when the store is float16."""
+    out = embeddings[idx]
+    return out.astype(np.float32) if out.dtype == np.float16 else out
+
+
+def scan_scores(queries: np.ndarray, embeddings: np.ndarray) -> np.ndarray:
+    """
+    queries @ embeddings.T: (N,) for one query, (Q, N) for several.
+    A float16 store is upcast SCAN_BLOCK_ROWS rows at a time.
+    """
+    if embeddings.dtype != np.float16:
+        return queries @ embeddings.T
+    queries = np.asarray(queries, dtype=np.float32)
+    out = np.empty(queries.shape[:-1] + (len(embeddings),), dtype=np.float32)
+    for start in range(0, len(embeddings), SCAN_BLOCK_ROWS):
+        block = embeddings[start:start + SCAN_BLOCK_ROWS].astype(np.float32)
+        out[..., start:start + len(block)] = queries @ block.T
+    return out
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+    from animeknn import EMBEDDINGS_PATH, EMBEDDINGS_NPY_PATH
+
+    dtype = sys.argv[1] if len(sys.argv) > 1 else "float32"
+    start = time.time()
+    emb = export_embeddings(pd.read_parquet(EMBEDDINGS_PATH), EMBEDDINGS_NPY_PATH, dtype=dtype)
+    print(f"Saved {emb.shape} {emb.dtype} ({emb.nbytes / 1e6:.1f} MB) → {EMBEDDINGS_NPY_PATH} "
+          f"in {time.time() - start:.1f}s")
@@ -0,0 +1,63 @@
+# fake_gemini_server.py
+"""
+Local stand-in for the Gemini REST API, for exercising /api/chat and
+/api/chat/stream without a key or network access.
+
+    python fake_gemini_server.py [port]
+    GEMINI_API_KEY=fake GEMINI_BASE_URL=http://127.0.0.1:8765 python app.py
+
+Answers generateContent with a canned reply and streamGenerateContent with
+the same reply as SSE chunks, one word each. FAKE_GEMINI_DELAY adds a
+per-chunk delay in seconds, to exercise timeouts and the concurrency limit.
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import os
+import sys
+import time
+
+REPLY = "You might enjoy Fullmetal Alchemist: Brotherhood, Steins;Gate and Mob Psycho 100."
+CHUNK_DELAY = float(os.getenv("FAKE_GEMINI_DELAY", "0.05"))
+
+
+def _response(text: str) -> bytes:
+    return json.dumps({
+        "candidates": [{"content": {"role": "model", "parts": [{"text": text}]}, "index": 0}],
+    }).encode("utf-8")
+
+
+class FakeGeminiHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        path = self.path.split("?")[0]
+
+        if path.endswith(":streamGenerateContent"):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            for word in REPLY.split(" "):
+                time.sleep(CHUNK_DELAY)
+                self.wfile.write(b"data: " + _response(word + " ") + b"\r\n\r\n")
+                self.wfile.flush()
+            self.close_connection = True
+        elif path.endswith(":generateContent"):
+            body = _response(REPLY)
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            self.send_error(404)
+
+    def log_message(self, format, *args):
+        pass
+
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8765
+    print(f"✓ Fake Gemini listening on http://127.0.0.1:{port}")
+    ThreadingHTTPServer(("127.0.0.1", port), FakeGeminiHandler).serve_forever()
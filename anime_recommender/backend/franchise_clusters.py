@@ -0,0 +1,157 @@
+# franchise_clusters.py
+"""
+Offline franchise clustering of catalog titles.
+
+Every title is reduced to a franchise key (sequel words, ordinals and
+numbering dropped), then titles are linked when:
+
+- their keys are equal ("shin captain tsubasa", "captain tsubasa 2018")
+- one key is a token prefix of the other's ("kyoukai no kanata" →
+  "kyoukai no kanata i ll be here mirai hen")
+- their keys are near-identical spellings (rapidfuzz ratio), scored only
+  for pairs blocked together by a shared title token
+
+Links are merged with union-find into one int32 franchise id per title,
+saved with the anime_ids next to the data. At query time "same franchise"
+is then an integer comparison (SeriesIndex / filter_same_series).
+
+Tokens shared by more than MAX_TOKEN_DF titles ("love", "pokemon") are too
+generic to block on or to act as a one-word prefix. One-word titles below
+that limit ("captain") can still pull unrelated series into one cluster.
+
+Build it with:
+    python franchise_clusters.py
+"""
+from __future__ import annotations
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+import re
+import unicodedata
+import numpy as np
+from rapidfuzz import fuzz, process
+
+SEQUEL_WORDS = {
+    'season', 'seasons', 'part', 'parts', 'cour', 'movie', 'movies', 'film', 'gekijouban',
+    'ova', 'ovas', 'ona', 'special', 'specials', 'final', 'chapter', 'arc', 'tv',
+    'the', 'shin', 'zoku',
+}
+# Ordinals, plain numbers and roman numerals up to x
+NUMBERING = re.compile(r'^(?:\d+(?:st|nd|rd|th)?|i{1,3}|iv|vi{0,3}|ix|x)$')
+
+MIN_PREFIX_CHARS = 4      # shorter keys never act as a prefix
+MIN_BLOCK_TOKEN_CHARS = 3
+MAX_TOKEN_DF = 20         # see module docstring
+FUZZY_THRESHOLD = 90      # rapidfuzz ratio (0-100) for near-identical keys
+
+
+def franchise_key(name: str) -> str:
+    """Lowercased title tokens without sequel words, ordinals or numbering."""
+    text = re.sub(r'[^\w\s]+', ' ', unicodedata.normalize('NFKC', str(name)).lower())
+    return ' '.join(t for t in text.split() if t not in SEQUEL_WORDS and not NUMBERING.match(t))
+
+
+class _UnionFind:
+    def __init__(self, n: int):
+        self.parent = list(range(n))
+
+    def find(self, a: int) -> int:
+        parent = self.parent
+        while parent[a] != a:
+            parent[a] = parent[parent[a]]
+            a = parent[a]
+        return a
+
+    def union(self, a: int, b: int):
+        a, b = self.find(a), self.find(b)
+        if a != b:
+            self.parent[max(a, b)] = min(a, b)
+
+
+def build_franchise_ids(names: Sequence[str]) -> np.ndarray:
+    """
+    Cluster titles into franchises.
+
+    Returns:
+        (N,) int32 franchise ids, numbered 0.. in order of first appearance
+    """
+    # Work on distinct keys; rows with the same key share a franchise
+    keys: Dict[str, int] = {}
+    row_keys = np.array([keys.setdefault(franchise_key(x), len(keys)) for x in names], dtype=np.int64)
+    key_list = list(keys)
+    uf = _UnionFind(len(key_list))
+
+    df = Counter(t for k in key_list for t in set(k.split()))
+
+    # Token prefixes that are themselves keys
+    for j, key in enumerate(key_list):
+        tokens = key.split()
+        for length in range(1, len(tokens)):
+            prefix = ' '.join(tokens[:length])
+            if (prefix in keys and len(prefix) >= MIN_PREFIX_CHARS
+                    and (length > 1 or df[prefix] <= MAX_TOKEN_DF)):
+                uf.union(j, keys[prefix])
+
+    # Near-identical spellings, scored only within token blocks
+    blocks: Dict[str, List[int]] = defaultdict(list)
+    for j, key in enumerate(key_list):
+        for token in set(key.split()):
+            if len(token) >= MIN_BLOCK_TOKEN_CHARS and df[token] <= MAX_TOKEN_DF:
+                blocks[token].append(j)
+    for members in blocks.values():
+        if len(members) < 2:
+            continue
+        choices = [key_list[j] for j in members]
+        scores = process.cdist(choices, choices, scorer=fuzz.ratio, score_cutoff=FUZZY_THRESHOLD)
+        for a, b in zip(*np.nonzero(np.triu(scores, 1))):
+            uf.union(members[a], members[b])
+
+    roots = np.array([uf.find(j) for j in range(len(key_list))], dtype=np.int64)[row_keys]
+    # Rows with a blank key (no usable name) each stay on their own
+    blank = np.flatnonzero(row_keys == keys.get('', -1))
+    roots[blank] = -1 - blank
+    _, first, ids = np.unique(roots, return_index=True, return_inverse=True)
+    # Renumber in order of first appearance
+    rank = np.empty(len(first), dtype=np.int32)
+    rank[np.argsort(first, kind='stable')] = np.arange(len(first), dtype=np.int32)
+    return rank[ids.ravel()]
+
+
+def save_franchises(path: Path, anime_ids: np.ndarray, franchise_ids: np.ndarray):
+    np.savez(path, anime_ids=np.asarray(anime_ids, dtype=np.int64),
+             franchise_ids=np.asarray(franchise_ids, dtype=np.int32))
+
+
+def load_franchise_ids(path: Path, anime_ids: Sequence[int]) -> Optional[np.ndarray]:
+    """
+    Franchise ids aligned with anime_ids, -1 for titles added since the build.
+    Returns None when the file is missing.
+    """
+    path = Path(path)
+    if not path.exists():
+        return None
+
+    with np.load(path) as f:
+        lookup = dict(zip(f["anime_ids"].tolist(), f["franchise_ids"].tolist()))
+    ids = np.array([lookup.get(int(a), -1) for a in anime_ids], dtype=np.int32)
+
+    missing = int((ids < 0).sum())
+    print(f"✓ Franchise ids loaded: {ids.max(initial=-1) + 1} franchises"
+          + (f" ({missing} titles not clustered yet)" if missing else ""))
+    return ids
+
+
+if __name__ == "__main__":
+    import time
+    import pandas as pd
+    import animeknn
+
+    start = time.time()
+    metadata = pd.read_parquet(animeknn.CLEANED_DATA_PATH, columns=["anime_id", "name"])
+    franchise_ids = build_franchise_ids(metadata["name"].fillna("").tolist())
+    save_franchises(animeknn.FRANCHISES_PATH, metadata["anime_id"].to_numpy(), franchise_ids)
+
+    sizes = np.bincount(franchise_ids)
+    print(f"Saved {len(franchise_ids)} titles in {len(sizes)} franchises "
+          f"({int((sizes > 1).sum())} with sequels/related entries) → {animeknn.FRANCHISES_PATH} "
+          f"in {time.time() - start:.1f}s")
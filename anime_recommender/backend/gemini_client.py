@@ -1,28 +1,158 @@
 import os
+import threading
+import time
+from typing import Iterator, Optional
+import httpx
 from google import genai
+from google.genai import errors, types
+
+# ---------------------------------------------------
+# Config
+# ---------------------------------------------------
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.0-flash")
+GEMINI_BASE_URL = os.getenv("GEMINI_BASE_URL")   # e.g. a local fake_gemini_server.py
+CHAT_TIMEOUT = float(os.getenv("GEMINI_TIMEOUT", "30"))            # seconds per request
+STREAM_READ_TIMEOUT = float(os.getenv("GEMINI_STREAM_READ_TIMEOUT", "10"))  # max stall between chunks
+CHAT_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "4"))
+
+SYSTEM_PROMPT = (
+    "You are a concise, friendly anime recommendation assistant. "
+    "Respond in short, clear paragraphs or bullet points. "
+    "Limit your response to roughly 4–6 sentences. "
+    "Do NOT ramble or provide overly detailed explanations."
+)
+
+
+class ChatBusy(RuntimeError):
+    """Raised when CHAT_MAX_CONCURRENCY chats are already in flight."""
+
+
+def _is_timeout(e: BaseException) -> bool:
+    """
+    Read timeouts as raised by the SDK's transport: httpx today, any
+    TimeoutError subclass (sockets, aiohttp) otherwise, or the API's own
+    408 / 504 DEADLINE_EXCEEDED.
+    """
+    if isinstance(e, (httpx.TimeoutException, TimeoutError)):
+        return True
+    return isinstance(e, errors.APIError) and (e.code in (408, 504) or e.status == "DEADLINE_EXCEEDED")
+
+
+class ChatTimeout(TimeoutError):
+    """Raised when a chat runs past CHAT_TIMEOUT."""
+
+
+# One client per process: it owns an HTTP connection pool, so building it
+# per request paid a fresh TLS handshake every time. Tracked by pid because
+# gunicorn forks after preload and sockets must not be shared across workers.
+_client: Optional[genai.Client] = None
+_client_pid: Optional[int] = None
+_client_lock = threading.Lock()
+
+# Chat slots. Under gthread workers each chat holds a thread for the whole
+# generation; capping them leaves threads free for /api/recommend.
+_slots = threading.BoundedSemaphore(CHAT_MAX_CONCURRENCY)
+
+
+def get_client() -> genai.Client:
+    """Shared Gemini client for this process, built on first use."""
+    global _client, _client_pid
+    with _client_lock:
+        if _client is None or _client_pid != os.getpid():
+            api_key = os.getenv("GEMINI_API_KEY")
+            if not api_key:
+                raise ValueError("Missing GEMINI_API_KEY in environment")
+            http_options = types.HttpOptions(
+                timeout=int(CHAT_TIMEOUT * 1000),
+                base_url=GEMINI_BASE_URL,
+            )
+            _client = genai.Client(api_key=api_key, http_options=http_options)
+            _client_pid = os.getpid()
+        return _client
+
+
+def _acquire_slot():
+    if not _slots.acquire(blocking=False):
+        raise ChatBusy("Too many chats in progress, try again shortly")
+
+
+def _contents(message: str):
+    return [{"role": "user", "parts": [{"text": f"{SYSTEM_PROMPT}\n\nUser: {message}"}]}]
+
 
 def chat_with_gemini(message: str) -> str:
     """
     Sends a message to the Gemini API and returns a concise, formatted response.
     """
-    api_key = os.getenv("GEMINI_API_KEY")
-    if not api_key:
-        raise ValueError("Missing GEMINI_API_KEY in environment")
-
-    client = genai.Client(api_key=api_key)
-
-    system_prompt = (
-        "You are a concise, friendly anime recommendation assistant. "
-        "Respond in short, clear paragraphs or bullet points. "
-        "Limit your response to roughly 4–6 sentences. "
-        "Do NOT ramble or provide overly detailed explanations."
-    )
-
-    response = client.models.generate_content(
-        model="gemini-2.0-flash",
-        contents=[
-            {"role": "user", "parts": [{"text": f"{system_prompt}\n\nUser: {message}"}]}
-        ]
-    )
-
-    return response.text.strip() if hasattr(response, "text") else str(response)
+    client = get_client()
+    _acquire_slot()
+    try:
+        response = client.models.generate_content(model=GEMINI_MODEL, contents=_contents(message))
+    finally:
+        _slots.release()
+
+    return response.text.strip() if hasattr(response, "text") and response.text else str(response)
+
+
+class ChatStream:
+    """
+    Iterator over text chunks of a streamed reply.
+
+    The concurrency slot is taken on construction (so callers can answer
+    429 before sending headers) and released once the stream is exhausted,
+    fails, or is closed by the server when the client disconnects.
+
+    CHAT_TIMEOUT is checked between chunks; a stalled connection is cut by
+    the socket read timeout (STREAM_READ_TIMEOUT, capped at CHAT_TIMEOUT),
+    so a reply overruns the deadline by at most one read timeout.
+    """
+
+    def __init__(self, message: str):
+        client = get_client()
+        _acquire_slot()
+        self._released = False
+        self._deadline = time.monotonic() + CHAT_TIMEOUT
+        try:
+            read_timeout = min(STREAM_READ_TIMEOUT, CHAT_TIMEOUT)
+            self._chunks = iter(client.models.generate_content_stream(
+                model=GEMINI_MODEL, contents=_contents(message),
+                config=types.GenerateContentConfig(
+                    http_options=types.HttpOptions(timeout=int(read_timeout * 1000))
+                ),
+            ))
+        except BaseException:
+            self.close()
+            raise
+
+    def __iter__(self) -> Iterator[str]:
+        return self
+
+    def __next__(self) -> str:
+        try:
+            while True:
+                if time.monotonic() > self._deadline:
+                    raise ChatTimeout(f"Chat exceeded {CHAT_TIMEOUT:g}s")
+                try:
+                    chunk = next(self._chunks)
+                except Exception as e:
+                    if _is_timeout(e):
+                        raise ChatTimeout(f"No reply chunk within {min(STREAM_READ_TIMEOUT, CHAT_TIMEOUT):g}s") from e
+                    raise
+                if chunk.text:
+                    return chunk.text
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self):
+        if not self._released:
+            self._released = True
+            _slots.release()
+            close = getattr(self._chunks, "close", None) if hasattr(self, "_chunks") else None
+            if close is not None:
+                close()
+
+
+def stream_chat_with_gemini(message: str) -> ChatStream:
+    """Start a streamed reply; iterate the result for text chunks."""
+    return ChatStream(message)
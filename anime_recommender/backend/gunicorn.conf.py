@@ -0,0 +1,40 @@
+# gunicorn.conf.py
+"""
+Production gunicorn settings.
+
+    cd anime_recommender/backend
+    gunicorn -c gunicorn.conf.py
+
+The app is preloaded in the master, so data is read once and shared with
+every worker copy-on-write. Right before forking, the garbage collector is
+run and everything still alive is frozen into the permanent generation,
+so the workers' collections never traverse those objects (which would
+write their GC headers and copy the pages).
+
+gc.freeze() does not stop reference counting: every Python object a
+request reads (an element of an object-dtype DataFrame column, a display
+store field, a title string) gets its refcount written, and the page
+holding it is copied into that worker. What stays shared is data without
+per-element Python objects: the embeddings (memory-mapped when exported),
+the neighbor table and index arrays, numeric columns, and the display
+store's JSON blob. Object columns are still copied gradually as they are
+read.
+"""
+import gc
+import multiprocessing
+import os
+
+wsgi_app = "app:create_app(preload=True)"
+bind = os.getenv("BIND", "0.0.0.0:5000")
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", "4"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "60"))
+preload_app = True
+
+
+def when_ready(server):
+    # Runs in the master after the preloaded app is built, before any fork
+    gc.collect()
+    gc.freeze()
+    server.log.info("Froze %d objects before forking workers", gc.get_freeze_count())
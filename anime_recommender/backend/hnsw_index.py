@@ -0,0 +1,230 @@
+# hnsw_index.py
+"""
+HNSW (hierarchical navigable small world) graph index in pure NumPy/Python.
+
+Every row is a node on layer 0; a geometrically shrinking subset also lives on
+higher layers. A query greedily descends from the sparse top layer and runs a
+best-first beam search (width ef_search) on layer 0, so it touches a roughly
+constant number of nodes no matter how large the catalog gets.
+
+Build it with:
+    python hnsw_index.py
+"""
+from __future__ import annotations
+from typing import Dict, List, Optional, Tuple
+from pathlib import Path
+import heapq
+import numpy as np
+
+from embedding_store import rows
+from neighbor_table import embeddings_fingerprint
+
+DEFAULT_M = 16
+DEFAULT_EF_CONSTRUCTION = 100
+DEFAULT_EF_SEARCH = 64
+
+
+class HNSWIndex:
+    """
+    Graph layers are stored CSR-style: on layer l the neighbors of node i are
+    neighbors[l][offsets[l][i]:offsets[l][i + 1]]. Nodes that don't reach
+    layer l have an empty slice there.
+    """
+
+    def __init__(self,
+                 embeddings: np.ndarray,
+                 offsets: List[np.ndarray],
+                 neighbors: List[np.ndarray],
+                 entry_point: int,
+                 fingerprint: int,
+                 M: int = DEFAULT_M,
+                 ef_construction: int = DEFAULT_EF_CONSTRUCTION,
+                 ef_search: int = DEFAULT_EF_SEARCH):
+        self.embeddings = embeddings
+        self.offsets = offsets
+        self.neighbors = neighbors
+        self.entry_point = int(entry_point)
+        self.fingerprint = int(fingerprint)
+        self.M = M
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+
+    @property
+    def max_level(self) -> int:
+        return len(self.offsets) - 1
+
+    # -------------------- SEARCH --------------------
+
+    def _links(self, level: int, node: int) -> np.ndarray:
+        off = self.offsets[level]
+        return self.neighbors[level][off[node]:off[node + 1]]
+
+    def search(self,
+               query_vec: np.ndarray,
+               k: int = 10,
+               exclude_idx: Optional[int] = None,
+               ef_search: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Same (indices, similarities) contract as animeknn.knn_search."""
+        ef = max(ef_search or self.ef_search, k + 1)
+
+        ep = self.entry_point
+        ep_sim = float(rows(self.embeddings, ep) @ query_vec)
+        for level in range(self.max_level, 0, -1):
+            ep, ep_sim = _greedy(self.embeddings, query_vec, ep, ep_sim,
+                                 lambda n, lv=level: self._links(lv, n))
+
+        found = _search_layer(self.embeddings, query_vec, [(ep_sim, ep)], ef,
+                              lambda n: self._links(0, n))
+        found = [(s, n) for s, n in found if n != exclude_idx][:k]
+
+        indices = np.array([n for _, n in found], dtype=np.intp)
+        sims = np.array([s for s, _ in found], dtype=np.float32)
+        return indices, sims
+
+    # -------------------- BUILD --------------------
+
+    @classmethod
+    def build(cls,
+              embeddings: np.ndarray,
+              M: int = DEFAULT_M,
+              ef_construction: int = DEFAULT_EF_CONSTRUCTION,
+              ef_search: int = DEFAULT_EF_SEARCH,
+              seed: int = 0,
+              fingerprint: Optional[int] = None) -> "HNSWIndex":
+        emb = np.ascontiguousarray(embeddings, dtype=np.float32)
+        n = len(emb)
+        rng = np.random.default_rng(seed)
+        levels = np.floor(-np.log(rng.random(n)) / np.log(M)).astype(np.int64)
+        max_links = [2 * M] + [M] * int(levels.max())
+
+        graph: List[Dict[int, List[int]]] = [{} for _ in range(int(levels.max()) + 1)]
+        entry_point, top_level = 0, int(levels[0])
+        for level in range(top_level + 1):
+            graph[level][0] = []
+
+        for node in range(1, n):
+            q = emb[node]
+            node_level = int(levels[node])
+
+            ep = entry_point
+            ep_sim = float(emb[ep] @ q)
+            for level in range(top_level, node_level, -1):
+                ep, ep_sim = _greedy(emb, q, ep, ep_sim, lambda x, lv=level: graph[lv][x])
+
+            entry = [(ep_sim, ep)]
+            for level in range(min(top_level, node_level), -1, -1):
+                found = _search_layer(emb, q, entry, ef_construction, lambda x, lv=level: graph[lv][x])
+                links = [x for _, x in found[:M]]
+                graph[level][node] = links
+
+                # Add reverse links, pruning to the closest max_links
+                for other in links:
+                    other_links = graph[level][other]
+                    other_links.append(node)
+                    if len(other_links) > max_links[level]:
+                        sims = emb[other_links] @ emb[other]
+                        keep = np.argsort(-sims)[:max_links[level]]
+                        graph[level][other] = [other_links[i] for i in keep]
+                entry = found
+
+            for level in range(top_level + 1, node_level + 1):
+                graph[level][node] = []
+            if node_level > top_level:
+                entry_point, top_level = node, node_level
+
+        offsets, neighbors = [], []
+        for layer in graph:
+            counts = np.zeros(n, dtype=np.int64)
+            for node, links in layer.items():
+                counts[node] = len(links)
+            offsets.append(np.concatenate([[0], np.cumsum(counts)]).astype(np.int64))
+            flat = [x for node in sorted(layer) for x in layer[node]]
+            neighbors.append(np.asarray(flat, dtype=np.int32))
+
+        return cls(embeddings, offsets, neighbors, entry_point,
+                   embeddings_fingerprint(embeddings) if fingerprint is None else fingerprint,
+                   M=M, ef_construction=ef_construction, ef_search=ef_search)
+
+    # -------------------- PERSISTENCE --------------------
+
+    def save(self, path: Path):
+        arrays = {
+            "entry_point": np.int64(self.entry_point),
+            "fingerprint": np.int64(self.fingerprint),
+            "params": np.array([self.M, self.ef_construction, self.ef_search], dtype=np.int64),
+        }
+        for level, (off, nbrs) in enumerate(zip(self.offsets, self.neighbors)):
+            arrays[f"offsets_{level}"] = off
+            arrays[f"neighbors_{level}"] = nbrs
+        np.savez(path, **arrays)
+
+    @classmethod
+    def load(cls, path: Path, embeddings: np.ndarray) -> "HNSWIndex":
+        with np.load(path) as f:
+            n_levels = sum(1 for name in f.files if name.startswith("offsets_"))
+            offsets = [f[f"offsets_{lv}"] for lv in range(n_levels)]
+            neighbors = [f[f"neighbors_{lv}"] for lv in range(n_levels)]
+            M, ef_construction, ef_search = (int(x) for x in f["params"])
+            return cls(embeddings, offsets, neighbors, int(f["entry_point"]),
+                       int(f["fingerprint"]), M=M,
+                       ef_construction=ef_construction, ef_search=ef_search)
+
+
+def _greedy(emb: np.ndarray, q: np.ndarray, ep: int, ep_sim: float, links) -> Tuple[int, float]:
+    """Hill-climb on one layer until no neighbor is closer to q."""
+    changed = True
+    while changed:
+        changed = False
+        nbrs = links(ep)
+        if len(nbrs) == 0:
+            break
+        sims = rows(emb, nbrs) @ q
+        best = int(np.argmax(sims))
+        if sims[best] > ep_sim:
+            ep, ep_sim = int(nbrs[best]), float(sims[best])
+            changed = True
+    return ep, ep_sim
+
+
+def _search_layer(emb: np.ndarray, q: np.ndarray, entry: List[Tuple[float, int]],
+                  ef: int, links) -> List[Tuple[float, int]]:
+    """
+    Best-first beam search on one layer.
+    Returns up to ef (similarity, node) pairs, best first.
+    """
+    visited = {n for _, n in entry}
+    candidates = [(-s, n) for s, n in entry]      # max-heap on similarity
+    results = [(s, n) for s, n in entry]          # min-heap on similarity
+    heapq.heapify(candidates)
+    heapq.heapify(results)
+
+    while candidates:
+        neg_sim, node = heapq.heappop(candidates)
+        if len(results) >= ef and -neg_sim < results[0][0]:
+            break
+
+        nbrs = [x for x in links(node) if x not in visited]
+        if not nbrs:
+            continue
+        visited.update(nbrs)
+        sims = rows(emb, nbrs) @ q
+
+        for s, x in zip(sims.tolist(), nbrs):
+            if len(results) < ef or s > results[0][0]:
+                heapq.heappush(candidates, (-s, int(x)))
+                heapq.heappush(results, (s, int(x)))
+                if len(results) > ef:
+                    heapq.heappop(results)
+
+    return sorted(results, reverse=True)
+
+
+if __name__ == "__main__":
+    import time
+    import animeknn
+
+    start = time.time()
+    index = HNSWIndex.build(animeknn.embeddings, fingerprint=animeknn.fingerprint)
+    index.save(animeknn.HNSW_INDEX_PATH)
+    print(f"Saved HNSW index (levels={index.max_level + 1}) → {animeknn.HNSW_INDEX_PATH} "
+          f"in {time.time() - start:.1f}s")
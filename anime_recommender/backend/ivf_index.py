@@ -0,0 +1,169 @@
+# ivf_index.py
+"""
+Inverted-file (IVF) approximate nearest-neighbor index.
+
+A spherical k-means coarse quantizer splits the catalog into `nlist` cells;
+each cell keeps an inverted list of its member rows. A query only scores the
+members of its `nprobe` closest cells, so search cost grows with
+nprobe * N / nlist instead of N.
+
+Build it with:
+    python ivf_index.py
+"""
+from __future__ import annotations
+from typing import Optional, Tuple
+from pathlib import Path
+import numpy as np
+
+from embedding_store import rows
+from neighbor_table import embeddings_fingerprint
+
+DEFAULT_NPROBE = 8
+KMEANS_ITERS = 20
+KMEANS_SAMPLE = 50_000
+ASSIGN_BLOCK_SIZE = 4096
+
+
+def default_nlist(n: int) -> int:
+    """Rule of thumb: about 4 * sqrt(N) cells."""
+    return max(1, min(n, int(4 * np.sqrt(n))))
+
+
+def _assign(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Nearest centroid (by cosine) for each row, computed in blocks."""
+    out = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), ASSIGN_BLOCK_SIZE):
+        block = vectors[start:start + ASSIGN_BLOCK_SIZE] @ centroids.T
+        out[start:start + ASSIGN_BLOCK_SIZE] = np.argmax(block, axis=1)
+    return out
+
+
+def train_kmeans(vectors: np.ndarray,
+                 nlist: int,
+                 iters: int = KMEANS_ITERS,
+                 seed: int = 0) -> np.ndarray:
+    """
+    Spherical k-means: centroids are re-normalized after every update so
+    they stay comparable to L2-normalized embeddings.
+    """
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), size=nlist, replace=False)].copy()
+
+    for _ in range(iters):
+        assign = _assign(vectors, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, vectors)
+        counts = np.bincount(assign, minlength=nlist)
+
+        # Re-seed empty cells with random points
+        empty = counts == 0
+        if empty.any():
+            sums[empty] = vectors[rng.choice(len(vectors), size=int(empty.sum()), replace=False)]
+
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        centroids = (sums / norms).astype(np.float32)
+
+    return centroids
+
+
+class IVFIndex:
+    """
+    Coarse-quantizer index with inverted lists stored CSR-style:
+    members of cell c are list_ids[list_offsets[c]:list_offsets[c + 1]].
+    """
+
+    def __init__(self,
+                 embeddings: np.ndarray,
+                 centroids: np.ndarray,
+                 list_offsets: np.ndarray,
+                 list_ids: np.ndarray,
+                 fingerprint: int,
+                 nprobe: int = DEFAULT_NPROBE):
+        self.embeddings = embeddings
+        self.centroids = centroids
+        self.list_offsets = list_offsets
+        self.list_ids = list_ids
+        self.fingerprint = int(fingerprint)
+        self.nprobe = nprobe
+
+    @property
+    def nlist(self) -> int:
+        return len(self.centroids)
+
+    @classmethod
+    def build(cls,
+              embeddings: np.ndarray,
+              nlist: Optional[int] = None,
+              iters: int = KMEANS_ITERS,
+              nprobe: int = DEFAULT_NPROBE,
+              seed: int = 0,
+              fingerprint: Optional[int] = None) -> "IVFIndex":
+        emb = np.ascontiguousarray(embeddings, dtype=np.float32)
+        nlist = nlist or default_nlist(len(emb))
+
+        # Train on a sample, then assign every row
+        rng = np.random.default_rng(seed)
+        sample = emb
+        if len(emb) > KMEANS_SAMPLE:
+            sample = emb[rng.choice(len(emb), size=KMEANS_SAMPLE, replace=False)]
+        centroids = train_kmeans(sample, nlist, iters=iters, seed=seed)
+
+        assign = _assign(emb, centroids)
+        list_ids = np.argsort(assign, kind="stable").astype(np.int32)
+        counts = np.bincount(assign, minlength=nlist)
+        list_offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+
+        return cls(embeddings, centroids, list_offsets, list_ids,
+                   embeddings_fingerprint(embeddings) if fingerprint is None else fingerprint, nprobe=nprobe)
+
+    def search(self,
+               query_vec: np.ndarray,
+               k: int = 10,
+               exclude_idx: Optional[int] = None,
+               nprobe: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Same (indices, similarities) contract as animeknn.knn_search,
+        restricted to the members of the nprobe closest cells.
+        """
+        nprobe = min(nprobe or self.nprobe, self.nlist)
+
+        cell_sims = self.centroids @ query_vec
+        probe = np.argpartition(-cell_sims, nprobe - 1)[:nprobe]
+
+        ids = np.concatenate([
+            self.list_ids[self.list_offsets[c]:self.list_offsets[c + 1]] for c in probe
+        ])
+        if exclude_idx is not None:
+            ids = ids[ids != exclude_idx]
+        if len(ids) == 0:
+            return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.float32)
+
+        sims = rows(self.embeddings, ids) @ query_vec
+
+        K = min(k, len(ids))
+        top = np.argpartition(-sims, K - 1)[:K]
+        top = top[np.argsort(-sims[top])]
+        return ids[top].astype(np.intp), sims[top]
+
+    def save(self, path: Path):
+        np.savez(path, centroids=self.centroids, list_offsets=self.list_offsets,
+                 list_ids=self.list_ids, fingerprint=np.int64(self.fingerprint),
+                 nprobe=np.int64(self.nprobe))
+
+    @classmethod
+    def load(cls, path: Path, embeddings: np.ndarray) -> "IVFIndex":
+        with np.load(path) as f:
+            return cls(embeddings, f["centroids"], f["list_offsets"], f["list_ids"],
+                       int(f["fingerprint"]), nprobe=int(f["nprobe"]))
+
+
+if __name__ == "__main__":
+    import time
+    import animeknn
+
+    start = time.time()
+    index = IVFIndex.build(animeknn.embeddings, fingerprint=animeknn.fingerprint)
+    index.save(animeknn.IVF_INDEX_PATH)
+    print(f"Saved IVF index (nlist={index.nlist}) → {animeknn.IVF_INDEX_PATH} "
+          f"in {time.time() - start:.1f}s")
@@ -0,0 +1,187 @@
+# metrics.py
+"""
+Minimal in-process metrics with Prometheus text exposition.
+
+Counters and histograms are kept per label set behind a lock; collectors
+are callables that report values owned elsewhere (cache counters) at
+scrape time. render() produces the text format served on /metrics.
+
+Values are per process: under gunicorn each worker reports its own, so
+scrape every worker or aggregate by the `pid` label.
+
+    with STAGE_SECONDS.time(pipeline="single", stage="knn_search"):
+        ...
+"""
+from __future__ import annotations
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+from contextlib import contextmanager
+import bisect
+import os
+import threading
+import time
+
+# Seconds, from sub-millisecond numpy work up to slow upstream calls
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+                   0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (0, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+Sample = Tuple[str, Dict[str, str], float]
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for v in labels.values())
+    return "{" + ",".join(f'{k}="{v}"' for k, v in zip(labels, escaped)) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic counter per label set."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels[n]) for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> List[Sample]:
+        with self._lock:
+            items = list(self._values.items())
+        return [(self.name, dict(zip(self.labelnames, key)), value) for key, value in items]
+
+
+class Histogram:
+    """Cumulative-bucket histogram per label set."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values: Dict[tuple, list] = {}   # key -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels[n]) for n in self.labelnames)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            row = self._values.get(key)
+            if row is None:
+                row = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            row[i] += 1
+            row[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self) -> List[Sample]:
+        with self._lock:
+            items = [(key, list(row)) for key, row in self._values.items()]
+        out = []
+        for key, row in items:
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), row[:-1]):
+                cumulative += count
+                out.append((self.name + "_bucket", {**labels, "le": _format_value(float(bound))}, cumulative))
+            out.append((self.name + "_count", labels, cumulative))
+            out.append((self.name + "_sum", labels, row[-1]))
+        return out
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List = []
+        self._collectors: Dict[str, Callable[[], Iterable[Tuple[str, str, str, List[Sample]]]]] = {}
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, key: str, collect: Callable[[], Iterable[Tuple[str, str, str, List[Sample]]]]):
+        """
+        collect() yields (name, kind, help, samples) at scrape time.
+        Re-adding a key replaces the previous collector.
+        """
+        self._collectors[key] = collect
+
+    def render(self) -> str:
+        # Merge samples of same-named families (e.g. one cache_hits_total per cache)
+        families: Dict[str, Tuple[str, str, List[Sample]]] = {}
+        sources = [[(m.name, m.kind, m.help, m.samples()) for m in self._metrics]]
+        sources += [collect() for collect in self._collectors.values()]
+        for source in sources:
+            for name, kind, help, samples in source:
+                families.setdefault(name, (kind, help, []))[2].extend(samples)
+
+        pid = str(os.getpid())
+        lines = []
+        for name, (kind, help, samples) in families.items():
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for sample_name, labels, value in samples:
+                lines.append(f"{sample_name}{_format_labels({**labels, 'pid': pid})} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "recommend_stage_seconds", "Time spent in each recommendation pipeline stage.",
+    ("pipeline", "stage"),
+))
+CANDIDATE_POOL_SIZE = REGISTRY.register(Histogram(
+    "recommend_candidate_pool_size", "Candidates per request before and after series filtering.",
+    ("pipeline", "step"), buckets=SIZE_BUCKETS,
+))
+REQUESTS = REGISTRY.register(Counter(
+    "http_requests_total", "HTTP requests by endpoint and status.", ("endpoint", "method", "status"),
+))
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "http_request_duration_seconds", "HTTP request latency by endpoint.", ("endpoint",),
+))
+
+
+def cache_collector(name: str, stats: Callable[[], Dict[str, float]]):
+    """Expose a ResponseCache/ChatCache stats() dict as labeled metrics."""
+    counters = ("hits", "misses", "evictions", "expirations", "coalesced", "shared_hits",
+                "upstream_calls", "upstream_seconds", "saved_seconds")
+    gauges = ("entries", "bytes", "max_bytes")
+
+    def collect():
+        values = stats()
+        labels = {"cache": name}
+        for field in counters:
+            if field in values:
+                yield (f"cache_{field}_total", "counter", f"Cache {field.replace('_', ' ')}.",
+                       [(f"cache_{field}_total", labels, values[field])])
+        for field in gauges:
+            if field in values:
+                yield (f"cache_{field}", "gauge", f"Cache {field.replace('_', ' ')}.",
+                       [(f"cache_{field}", labels, values[field])])
+
+    return collect
@@ -0,0 +1,136 @@
+# neighbor_table.py
+"""
+Precomputed top-N neighbor table for every catalog item.
+
+Queries from /api/recommend are always existing catalog rows, so their
+candidate pools can be computed once offline instead of scanning the whole
+embeddings matrix per request. The table is stored as int32 indices and
+float16 similarities next to embeddings.parquet. The float16 scores only
+rank the pool; the recommender re-scores the rows it returns exactly.
+
+Build it with:
+    python neighbor_table.py
+"""
+from __future__ import annotations
+from typing import Optional, Tuple
+from pathlib import Path
+import zlib
+import numpy as np
+
+DEFAULT_TOP_N = 200
+DEFAULT_BLOCK_SIZE = 1024
+
+
+def embeddings_fingerprint(embeddings: np.ndarray) -> int:
+    """Cheap checksum of the embeddings matrix, used to detect stale artifacts."""
+    data = np.ascontiguousarray(embeddings, dtype=np.float32)
+    crc = zlib.crc32(np.asarray(data.shape, dtype=np.int64).tobytes())
+    return zlib.crc32(memoryview(data).cast("B") if data.size else b"", crc)
+
+
+def build_neighbor_table(embeddings: np.ndarray,
+                         top_n: int = DEFAULT_TOP_N,
+                         block_size: int = DEFAULT_BLOCK_SIZE) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Compute each row's top-N neighbors with blocked matrix multiplies.
+
+    Assumes embeddings are L2-normalized. The row itself is never included.
+
+    Returns:
+        indices: (N, top_n) int32 neighbor indices, best first
+        similarities: (N, top_n) float16 similarity scores
+    """
+    emb = np.ascontiguousarray(embeddings, dtype=np.float32)
+    n = len(emb)
+    top_n = max(0, min(top_n, n - 1))
+
+    indices = np.empty((n, top_n), dtype=np.int32)
+    sims = np.empty((n, top_n), dtype=np.float16)
+    if top_n == 0:
+        # Zero or one row: nobody has a neighbor
+        return indices, sims
+
+    for start in range(0, n, block_size):
+        stop = min(start + block_size, n)
+        rows = np.arange(start, stop)
+
+        block = emb[start:stop] @ emb.T            # (B, N)
+        block[rows - start, rows] = -np.inf         # drop self-matches
+
+        top = np.argpartition(-block, top_n - 1, axis=1)[:, :top_n]
+        top_sims = np.take_along_axis(block, top, axis=1)
+        order = np.argsort(-top_sims, axis=1)
+
+        indices[start:stop] = np.take_along_axis(top, order, axis=1)
+        sims[start:stop] = np.take_along_axis(top_sims, order, axis=1)
+
+    return indices, sims
+
+
+class NeighborTable:
+    """
+    In-memory neighbor table with the same (indices, similarities) contract
+    as animeknn.knn_search.
+    """
+
+    def __init__(self, indices: np.ndarray, similarities: np.ndarray, fingerprint: int):
+        self.indices = indices
+        self.similarities = similarities
+        self.fingerprint = int(fingerprint)
+
+    @property
+    def top_n(self) -> int:
+        return self.indices.shape[1]
+
+    @classmethod
+    def build(cls, embeddings: np.ndarray, top_n: int = DEFAULT_TOP_N,
+              block_size: int = DEFAULT_BLOCK_SIZE, fingerprint: Optional[int] = None) -> "NeighborTable":
+        indices, sims = build_neighbor_table(embeddings, top_n=top_n, block_size=block_size)
+        return cls(indices, sims, embeddings_fingerprint(embeddings) if fingerprint is None else fingerprint)
+
+    def lookup(self, query_idx: int, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Return the k best neighbors of a catalog row (k <= top_n)."""
+        k = min(k, self.top_n)
+        return (self.indices[query_idx, :k].astype(np.intp),
+                self.similarities[query_idx, :k].astype(np.float32))
+
+    def save(self, path: Path):
+        np.savez(path, indices=self.indices, similarities=self.similarities,
+                 fingerprint=np.int64(self.fingerprint))
+
+    @classmethod
+    def load(cls, path: Path) -> "NeighborTable":
+        with np.load(path) as f:
+            return cls(f["indices"], f["similarities"], int(f["fingerprint"]))
+
+
+def load_neighbor_table(path: Path, embeddings: np.ndarray,
+                        fingerprint: Optional[int] = None) -> Optional[NeighborTable]:
+    """
+    Load the table if it exists and matches the current embeddings.
+    Returns None when it is missing or stale, so callers fall back to a live scan.
+    Pass the embeddings' fingerprint when known to skip recomputing it.
+    """
+    path = Path(path)
+    if not path.exists():
+        return None
+
+    table = NeighborTable.load(path)
+    if (len(table.indices) != len(embeddings)
+            or table.fingerprint != (embeddings_fingerprint(embeddings) if fingerprint is None else fingerprint)):
+        print(f"⚠️  Neighbor table {path.name} is stale, using live search")
+        return None
+
+    print(f"✓ Neighbor table loaded: {table.indices.shape}")
+    return table
+
+
+if __name__ == "__main__":
+    import time
+    import animeknn
+
+    start = time.time()
+    table = NeighborTable.build(animeknn.embeddings, fingerprint=animeknn.fingerprint)
+    table.save(animeknn.NEIGHBORS_PATH)
+    print(f"Saved {table.indices.shape} neighbors → {animeknn.NEIGHBORS_PATH} "
+          f"in {time.time() - start:.1f}s")
@@ -0,0 +1,251 @@
+# quantization.py
+"""
+Compressed embedding stores for the candidate scan.
+
+Two codecs:
+  - ScalarQuantizer: per-dimension int8 codes (4x smaller than float32)
+  - ProductQuantizer: m sub-vectors, each coded as one byte against a
+    256-entry codebook (dim*4/m times smaller), scored through a per-query
+    lookup table
+
+QuantizedStore scans the codes to build a candidate pool and re-ranks only
+that pool against the full-precision vectors.
+
+Build with:
+    python quantization.py sq8
+    python quantization.py pq
+"""
+from __future__ import annotations
+from typing import Optional, Tuple
+from pathlib import Path
+import numpy as np
+
+from embedding_store import rows
+from neighbor_table import embeddings_fingerprint
+
+SCAN_BLOCK_SIZE = 4096
+DEFAULT_RERANK = 200
+PQ_SUBVECTORS = 16
+PQ_CENTROIDS = 256
+PQ_TRAIN_ITERS = 15
+PQ_TRAIN_SAMPLE = 50_000
+
+
+class ScalarQuantizer:
+    """Maps each dimension's [min, max] range linearly onto int8."""
+
+    name = "sq8"
+
+    def __init__(self, offset: np.ndarray, scale: np.ndarray):
+        self.offset = offset.astype(np.float32)
+        self.scale = scale.astype(np.float32)
+
+    @classmethod
+    def train(cls, vectors: np.ndarray) -> "ScalarQuantizer":
+        lo = vectors.min(axis=0)
+        hi = vectors.max(axis=0)
+        scale = (hi - lo) / 255.0
+        scale[scale == 0] = 1.0
+        return cls(lo, scale)
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        q = np.rint((vectors - self.offset) / self.scale) - 128
+        return np.clip(q, -128, 127).astype(np.int8)
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        return (codes.astype(np.float32) + 128) * self.scale + self.offset
+
+    def scores(self, codes: np.ndarray, query_vec: np.ndarray) -> np.ndarray:
+        """
+        Approximate dot products without decoding:
+        x·q = (c + 128)·(scale*q) + offset·q
+        """
+        qs = (self.scale * query_vec).astype(np.float32)
+        bias = float((128 * qs).sum() + self.offset @ query_vec)
+        out = np.empty(len(codes), dtype=np.float32)
+        for start in range(0, len(codes), SCAN_BLOCK_SIZE):
+            block = codes[start:start + SCAN_BLOCK_SIZE]
+            out[start:start + SCAN_BLOCK_SIZE] = block.astype(np.float32) @ qs
+        return out + bias
+
+    def state(self) -> dict:
+        return {"offset": self.offset, "scale": self.scale}
+
+    @classmethod
+    def from_state(cls, f) -> "ScalarQuantizer":
+        return cls(f["offset"], f["scale"])
+
+
+class ProductQuantizer:
+    """
+    Splits vectors into m equal sub-vectors and codes each one as the id of
+    its nearest sub-codebook centroid.
+    """
+
+    name = "pq"
+
+    def __init__(self, codebooks: np.ndarray):
+        self.codebooks = codebooks.astype(np.float32)      # (m, 256, dsub)
+
+    @property
+    def m(self) -> int:
+        return self.codebooks.shape[0]
+
+    @property
+    def dsub(self) -> int:
+        return self.codebooks.shape[2]
+
+    @classmethod
+    def train(cls, vectors: np.ndarray,
+              m: int = PQ_SUBVECTORS,
+              n_centroids: int = PQ_CENTROIDS,
+              iters: int = PQ_TRAIN_ITERS,
+              seed: int = 0) -> "ProductQuantizer":
+        n, dim = vectors.shape
+        if dim % m:
+            raise ValueError(f"Embedding dim {dim} is not divisible by m={m}")
+        rng = np.random.default_rng(seed)
+        if n > PQ_TRAIN_SAMPLE:
+            vectors = vectors[rng.choice(n, size=PQ_TRAIN_SAMPLE, replace=False)]
+        n_centroids = min(n_centroids, len(vectors))
+
+        dsub = dim // m
+        codebooks = np.empty((m, n_centroids, dsub), dtype=np.float32)
+        for j in range(m):
+            sub = vectors[:, j * dsub:(j + 1) * dsub]
+            codebooks[j] = _kmeans_l2(sub, n_centroids, iters, rng)
+        return cls(codebooks)
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        codes = np.empty((len(vectors), self.m), dtype=np.uint8)
+        for j in range(self.m):
+            sub = vectors[:, j * self.dsub:(j + 1) * self.dsub]
+            codes[:, j] = _nearest_l2(sub, self.codebooks[j])
+        return codes
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        parts = [self.codebooks[j][codes[:, j]] for j in range(self.m)]
+        return np.hstack(parts)
+
+    def lookup_table(self, query_vec: np.ndarray) -> np.ndarray:
+        """(m, 256) table of sub-vector dot products for one query."""
+        q = query_vec.reshape(self.m, 1, self.dsub).astype(np.float32)
+        return (self.codebooks * q).sum(axis=2)
+
+    def scores(self, codes: np.ndarray, query_vec: np.ndarray) -> np.ndarray:
+        """Asymmetric distance computation: sum of table lookups per row."""
+        lut = self.lookup_table(query_vec)
+        cols = np.arange(self.m)
+        out = np.empty(len(codes), dtype=np.float32)
+        for start in range(0, len(codes), SCAN_BLOCK_SIZE):
+            block = codes[start:start + SCAN_BLOCK_SIZE]
+            out[start:start + SCAN_BLOCK_SIZE] = lut[cols, block].sum(axis=1)
+        return out
+
+    def state(self) -> dict:
+        return {"codebooks": self.codebooks}
+
+    @classmethod
+    def from_state(cls, f) -> "ProductQuantizer":
+        return cls(f["codebooks"])
+
+
+QUANTIZERS = {cls.name: cls for cls in (ScalarQuantizer, ProductQuantizer)}
+
+
+class QuantizedStore:
+    """
+    Candidate scan over compressed codes with exact re-ranking.
+    Exposes the same search() contract as the other index backends.
+    """
+
+    def __init__(self, embeddings: np.ndarray, quantizer, codes: np.ndarray,
+                 fingerprint: int, rerank: int = DEFAULT_RERANK):
+        self.embeddings = embeddings
+        self.quantizer = quantizer
+        self.codes = codes
+        self.fingerprint = int(fingerprint)
+        self.rerank = rerank
+
+    @classmethod
+    def build(cls, embeddings: np.ndarray, kind: str = "sq8",
+              fingerprint: Optional[int] = None, **train_kwargs) -> "QuantizedStore":
+        emb = np.ascontiguousarray(embeddings, dtype=np.float32)
+        quantizer = QUANTIZERS[kind].train(emb, **train_kwargs)
+        return cls(embeddings, quantizer, quantizer.encode(emb),
+                   embeddings_fingerprint(embeddings) if fingerprint is None else fingerprint)
+
+    def search(self,
+               query_vec: np.ndarray,
+               k: int = 10,
+               exclude_idx: Optional[int] = None,
+               rerank: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Score all codes, keep the best `rerank` rows, then re-score those with
+        the full-precision vectors.
+        """
+        approx = self.quantizer.scores(self.codes, query_vec)
+        if exclude_idx is not None:
+            approx[exclude_idx] = -np.inf
+
+        pool = min(max(rerank or self.rerank, k), len(approx))
+        cand = np.sort(np.argpartition(-approx, pool - 1)[:pool])
+        if exclude_idx is not None:
+            cand = cand[cand != exclude_idx]
+
+        # Exact re-rank touches only the pool rows
+        sims = rows(self.embeddings, cand) @ query_vec
+        K = min(k, len(cand))
+        top = np.argpartition(-sims, K - 1)[:K]
+        top = top[np.argsort(-sims[top])]
+        return cand[top].astype(np.intp), sims[top]
+
+    def save(self, path: Path):
+        np.savez(path, kind=np.array(self.quantizer.name), codes=self.codes,
+                 fingerprint=np.int64(self.fingerprint), rerank=np.int64(self.rerank),
+                 **self.quantizer.state())
+
+    @classmethod
+    def load(cls, path: Path, embeddings: np.ndarray) -> "QuantizedStore":
+        with np.load(path) as f:
+            quantizer = QUANTIZERS[str(f["kind"])].from_state(f)
+            return cls(embeddings, quantizer, f["codes"], int(f["fingerprint"]),
+                       rerank=int(f["rerank"]))
+
+
+def _nearest_l2(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Index of the nearest centroid by squared L2, computed in blocks."""
+    c_sq = (centroids ** 2).sum(axis=1)
+    out = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), SCAN_BLOCK_SIZE):
+        block = vectors[start:start + SCAN_BLOCK_SIZE]
+        out[start:start + SCAN_BLOCK_SIZE] = np.argmin(c_sq - 2 * block @ centroids.T, axis=1)
+    return out
+
+
+def _kmeans_l2(vectors: np.ndarray, n_centroids: int, iters: int, rng) -> np.ndarray:
+    """Plain Lloyd's k-means for PQ codebooks."""
+    centroids = vectors[rng.choice(len(vectors), size=n_centroids, replace=False)].copy()
+    for _ in range(iters):
+        assign = _nearest_l2(vectors, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, vectors)
+        counts = np.bincount(assign, minlength=n_centroids)
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+    return centroids
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+    import animeknn
+
+    kind = sys.argv[1] if len(sys.argv) > 1 else "sq8"
+    path = animeknn.QUANTIZED_PATHS[kind]
+
+    start = time.time()
+    store = QuantizedStore.build(animeknn.embeddings, kind=kind, fingerprint=animeknn.fingerprint)
+    store.save(path)
+    print(f"Saved {kind} codes {store.codes.shape} ({store.codes.nbytes / 1e6:.1f} MB) → {path} "
+          f"in {time.time() - start:.1f}s")
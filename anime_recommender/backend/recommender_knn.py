@@ -1,12 +1,18 @@
 # recommender_knn.py
 from __future__ import annotations
-from typing import List, Dict, Optional
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+import os
+import threading
 import numpy as np
 import pandas as pd
-import math
 
 # Direct import since animeknn.py is in the same folder
 import animeknn
+from display_store import get_display_store
+from embedding_store import rows
+from metrics import CANDIDATE_POOL_SIZE, STAGE_SECONDS
+from neighbor_table import load_neighbor_table
+from title_index import TitleIndex
 
 
 def _build_id_index_map(metadata: pd.DataFrame) -> Dict[int, int]:
@@ -14,15 +20,9 @@ def _build_id_index_map(metadata: pd.DataFrame) -> Dict[int, int]:
     ids = pd.to_numeric(metadata.get("anime_id"), errors="coerce")
     return {int(aid): idx for idx, aid in ids.dropna().items()}
 
-def clean_json_value(value):
-    if isinstance(value, float) and (math.isnan(value) or math.isinf(value)):
-        return None
-    if pd.isna(value):
-        return None
-    return value
-
-
-_ID_TO_IDX = _build_id_index_map(animeknn.metadata)
+MAX_SEEDS = 10
+SEED_MODES = ("centroid", "max")
+BATCH_BLOCK = 256
 
 
 class AnimeKNNRecommender:
@@ -33,128 +33,328 @@ class AnimeKNNRecommender:
       - recommend(anime_ids)
     """
 
-    def __init__(self):
+    def __init__(self, search_backend: Optional[str] = None):
         self.embeddings = animeknn.embeddings
+        self.fingerprint = animeknn.fingerprint
         self.metadata = animeknn.metadata
-        self.raw_data = animeknn.raw_data
+        self.id_to_idx = _build_id_index_map(self.metadata)
         self.default_candidates = getattr(animeknn, "DEFAULT_CANDIDATES", 100)
+        self.neighbor_table = load_neighbor_table(animeknn.NEIGHBORS_PATH, self.embeddings, self.fingerprint)
+        self.search_backend = search_backend or animeknn.SEARCH_BACKEND
+        self.search_index = animeknn.get_search_index(self.search_backend, self.embeddings, self.fingerprint)
+        self.genre_codes, _ = animeknn.main_genre_codes(self.metadata)
+        self.series_index = animeknn.get_series_index(self.metadata)
+        # Changes whenever the embeddings or the display file change; read
+        # from the file's stat so it doesn't load the display table
+        display_file = os.stat(animeknn.RAW_DATA_PATH)
+        self.dataset_version = f"{self.fingerprint:08x}-{display_file.st_mtime_ns:x}-{display_file.st_size:x}"
+
+        # Built from raw_data on first search / response build (see ANIME_LAZY_DISPLAY)
+        self._display_lock = threading.Lock()
+        self._title_index: Optional[TitleIndex] = None
+        self._display = None
+        if not animeknn.engine.lazy_display:
+            # raw_data is loaded with the core data anyway: build them now
+            self.title_index, self.display
+
+    @property
+    def raw_data(self) -> pd.DataFrame:
+        return animeknn.raw_data
+
+    @property
+    def title_index(self) -> TitleIndex:
+        if self._title_index is None:
+            with self._display_lock:
+                if self._title_index is None:
+                    self._title_index = TitleIndex(self.raw_data, self.metadata)
+        return self._title_index
+
+    @property
+    def title_index_loaded(self) -> bool:
+        return self._title_index is not None
+
+    @property
+    def display(self):
+        if self._display is None:
+            with self._display_lock:
+                if self._display is None:
+                    self._display = get_display_store(self.metadata, self.raw_data)
+        return self._display
+
+    def _needs_scan(self, seed_idx: np.ndarray, k: int) -> bool:
+        """
+        True when a seed list's pool comes from an exact scan: several
+        seeds, or one seed with neither a usable neighbor table nor an ANN
+        index. Shared by the single and batch paths so both pick the same
+        source.
+        """
+        if len(seed_idx) > 1:
+            return True
+        table = self.neighbor_table
+        return not (table is not None and k <= table.top_n) and self.search_index is None
+
+    def _candidate_pool(self, query_idx: int, k: int):
+        """
+        Serve neighbors from the precomputed table, else from the configured
+        ANN index, else with an exact scan.
+        """
+        table = self.neighbor_table
+        if table is not None and k <= table.top_n:
+            return table.lookup(query_idx, k)
+        return animeknn.approximate_knn_search(
+            rows(self.embeddings, query_idx), self.embeddings,
+            k=k,
+            index=self.search_index,
+            exclude_idx=query_idx
+        )
 
     # -------------------- SEARCH --------------------
 
-    def search(self, q: str, limit: int = 10) -> List[Dict]:
+    def search(self, q: str, limit: int = 10, fuzzy: bool = False) -> List[Dict]:
         if not q:
             return []
+        if fuzzy:
+            return self.title_index.fuzzy_search(q, limit)
+        return self.title_index.search(q, limit)
 
-        q_lower = q.lower()
-
-        # --- We'll search directly in raw_data ---
-        cols = [
-            c for c in ["english_name", "name"]
-            if c in self.raw_data.columns
-        ]
-        if not cols:
-            return []
-
-        # --- Build mask: look for the query in any name column ---
-        mask = False
-        for c in cols:
-            mask = mask | self.raw_data[c].astype(str).str.lower().str.contains(q_lower, na=False)
-
-        hits = self.raw_data[mask].head(limit)
-
-        # --- Helper to sanitize bad strings ---
-        def safe_str(value, fallback="Unknown"):
-            if pd.isna(value) or value is None:
-                return fallback
-            s = str(value).strip()
-            return fallback if not s or s.lower() == "nan" else s
-
-        # --- Build results ---
-        results = []
-        for _, row in hits.iterrows():
-            anime_id = int(row.get("anime_id", -1))
-            if anime_id == -1:
-                continue
-
-            # Prefer English name if available
-            display_name = row.get("english_name") or row.get("name")
-            clean_name = safe_str(display_name)
-
-            results.append({
-                "anime_id": anime_id,
-                "name": clean_name,
-                "image_url": safe_str(row.get("image_url"), None)
-            })
-
-        return results
+    def search_columns(self, q: str, limit: int = 10, fuzzy: bool = False) -> Dict[str, list]:
+        """search() as columns (field -> list), for binary responses."""
+        if not q:
+            return self.title_index.rows_to_columns([])
+        hits = self.title_index.fuzzy_search_rows(q, limit) if fuzzy else self.title_index.search_rows(q, limit)
+        return self.title_index.rows_to_columns(hits)
 
     # ----------------- RECOMMENDATIONS -----------------
 
-    def recommend(self, anime_ids: List[int], k: int = 20, lambda_mult: float = 0.7) -> List[Dict]:
-        if not anime_ids:
-            return []
-
-        # Resolve first valid id
-        query_idx = next((_ID_TO_IDX[aid] for aid in anime_ids if aid in _ID_TO_IDX), None)
-        if query_idx is None:
-            return []
-
-        query_vec = self.embeddings[query_idx]
+    def resolve_seeds(self, anime_ids: List[int]) -> List[int]:
+        """The anime ids a request will actually be scored with (valid, deduplicated)."""
+        seeds = []
+        for aid in anime_ids:
+            if aid in self.id_to_idx and aid not in seeds:
+                seeds.append(aid)
+        return seeds[:MAX_SEEDS]
+
+    def _recommend_indices(self, anime_ids: List[int], k: int, lambda_mult: float,
+                           mode: str = "centroid"):
+        """
+        Run the pipeline; returns (row indices, similarities) or None.
+
+        One seed uses the neighbor table / search backend when available
+        (_needs_scan). Otherwise the seeds are scored together in one exact
+        pass ("centroid" or "max" mode), with every seed and every seed's
+        franchise excluded.
+        """
+        stage = STAGE_SECONDS.time
+        with stage(pipeline="single", stage="resolve_ids"):
+            seeds = self.resolve_seeds(anime_ids or [])
+            if not seeds:
+                return None
+            seed_idx = np.array([self.id_to_idx[aid] for aid in seeds], dtype=np.intp)
 
         # 1) Get candidate pool
-        cand_indices, _ = animeknn.knn_search(
-            query_vec, self.embeddings,
-            k=self.default_candidates,
-            exclude_idx=query_idx
-        )
+        relevance = None
+        with stage(pipeline="single", stage="knn_search"):
+            C = self.default_candidates
+            if len(seed_idx) == 1:
+                query_vec = rows(self.embeddings, seed_idx[0])
+            else:
+                query_vec = animeknn.seed_centroid(rows(self.embeddings, seed_idx))
+            scanned = self._needs_scan(seed_idx, C)
+            if scanned:
+                pool, pool_sims = animeknn.multi_seed_knn_search(seed_idx, self.embeddings, k=C, mode=mode)
+            else:
+                pool, pool_sims = self._candidate_pool(seed_idx[0], C)
 
         # 2) Filter same-series results
-        cand_indices = animeknn.filter_same_series(cand_indices, query_idx, self.metadata)
-        if not len(cand_indices):
-            cand_indices, _ = animeknn.knn_search(query_vec, self.embeddings, k=k, exclude_idx=query_idx)
+        with stage(pipeline="single", stage="filter_same_series"):
+            cand_indices = self._filter_series(pool, seed_idx, k)
+        CANDIDATE_POOL_SIZE.observe(len(pool), pipeline="single", step="knn")
+        CANDIDATE_POOL_SIZE.observe(len(cand_indices), pipeline="single", step="filtered")
 
         # 3) Re-rank using MMR (diversity)
-        if len(cand_indices) > k:
-            cand_emb = self.embeddings[cand_indices]
-            order = animeknn.mmr_rerank(cand_emb, query_vec, lambda_mult=lambda_mult, top_n=k * 3)
-            cand_indices = cand_indices[order]
+        with stage(pipeline="single", stage="mmr_rerank"):
+            if len(cand_indices) > k:
+                cand_emb = rows(self.embeddings, cand_indices)
+                if mode == "max" and len(seed_idx) > 1:
+                    relevance = animeknn.gather_similarities(cand_indices, pool, pool_sims)
+                order = animeknn.mmr_rerank(cand_emb, query_vec, lambda_mult=lambda_mult,
+                                            top_n=k * 3, relevance=relevance)
+                cand_indices = cand_indices[order]
 
         # 4) Genre diversity
-        cand_indices = animeknn.diversify_by_genre(cand_indices[:k * 2], self.metadata, max_per_genre=20)
-
-        # 5) Build response objects
-        results = []
-        for idx in cand_indices[:k]:
-            meta = self.metadata.iloc[idx]
-            aid = int(meta.get("anime_id"))
-            sim = float(animeknn.cosine_similarity_batch(query_vec, self.embeddings[idx:idx + 1])[0])
-
-            # Prefer info from raw_data
-            r = self.raw_data[self.raw_data["anime_id"] == aid]
-            if not r.empty:
-                row = r.iloc[0]
-                name = row.get("name", meta.get("name", "Unknown"))
-                score = row.get("score", meta.get("score", "N/A"))
-                episodes = row.get("episodes", meta.get("episodes", "N/A"))
-                genres = row.get("genres", meta.get("genres", "N/A"))
-                image_url = row.get("image_url") if "image_url" in r.columns else None
-                anime_url = row.get("anime_url") if "anime_url" in r.columns else None
-            else:
-                name = meta.get("name", "Unknown")
-                score = meta.get("score", "N/A")
-                episodes = meta.get("episodes", "N/A")
-                genres = meta.get("genres", "N/A")
-                image_url = anime_url = None
-
-            results.append({
-                "anime_id": clean_json_value(aid),
-                "name": clean_json_value(name),
-                "similarity": clean_json_value(sim),
-                "score": clean_json_value(score),
-                "episodes": clean_json_value(episodes),
-                "genres": clean_json_value(genres),
-                "image_url": clean_json_value(image_url),
-                "anime_url": clean_json_value(anime_url),
-            })
-
-        return results
\ No newline at end of file
+        with stage(pipeline="single", stage="diversify_by_genre"):
+            cand_indices = animeknn.diversify_by_genre_codes(cand_indices[:k * 2], self.genre_codes, max_per_genre=20)
+
+        final = np.asarray(cand_indices[:k], dtype=np.intp)
+        return final, self._final_similarities(final, pool, pool_sims, query_vec, scanned)
+
+    def _final_similarities(self, final: np.ndarray, pool: np.ndarray, pool_sims: np.ndarray,
+                            query_vec: np.ndarray, scanned: bool) -> np.ndarray:
+        """
+        Similarities reported for the final rows. Pools from the neighbor
+        table (float16) or an ANN index are re-scored exactly, k dot
+        products, so the response doesn't depend on which backend answered.
+        """
+        if scanned:
+            return animeknn.gather_similarities(final, pool, pool_sims)
+        return (rows(self.embeddings, final) @ query_vec).astype(np.float32)
+
+    def _filter_series(self, pool: np.ndarray, seed_idx: np.ndarray, k: int) -> np.ndarray:
+        """Drop every seed's franchise from the pool; fall back to the pool head if nothing is left."""
+        pool = np.asarray(pool, dtype=np.intp)
+        pools = np.broadcast_to(pool, (len(seed_idx), len(pool)))
+        drop = self.series_index.same_series_mask_batch(pools, seed_idx).any(axis=0)
+        cand_indices = pool[~drop]
+        return cand_indices if len(cand_indices) else pool[:k]
+
+    def _recommend_indices_batch(self, seed_lists: Sequence[List[int]], k: int, lambda_mult: float,
+                                 mode: str = "centroid") -> List[Optional[Tuple[np.ndarray, np.ndarray]]]:
+        """
+        _recommend_indices for many seed lists at once.
+
+        Pools come from the same source as the single path (_needs_scan):
+        single seeds from the neighbor table or ANN index, every list that
+        needs an exact scan from one multi_seed_knn_search_batch product.
+        MMR runs as one mmr_rerank_batch call over the padded pools.
+        """
+        results: List[Optional[Tuple[np.ndarray, np.ndarray]]] = [None] * len(seed_lists)
+        stage = STAGE_SECONDS.time
+        with stage(pipeline="batch", stage="resolve_ids"):
+            live = []
+            for i, anime_ids in enumerate(seed_lists):
+                seeds = self.resolve_seeds(anime_ids or [])
+                if seeds:
+                    live.append((i, np.array([self.id_to_idx[aid] for aid in seeds], dtype=np.intp)))
+            if not live:
+                return results
+
+        # 1) Candidate pools
+        with stage(pipeline="batch", stage="knn_search"):
+            C = self.default_candidates
+            pools: List[np.ndarray] = [None] * len(live)
+            pool_sims: List[np.ndarray] = [None] * len(live)
+            scan = []
+            for j, (_, seed_idx) in enumerate(live):
+                if self._needs_scan(seed_idx, C):
+                    scan.append(j)
+                else:
+                    pools[j], pool_sims[j] = self._candidate_pool(seed_idx[0], C)
+            scanned = set(scan)
+            if scan:
+                idx, sims = animeknn.multi_seed_knn_search_batch(
+                    [live[j][1] for j in scan], self.embeddings, k=C, mode=mode
+                )
+                for row, j in enumerate(scan):
+                    pools[j], pool_sims[j] = idx[row], sims[row]
+
+        # 2) Filter same-series results
+        with stage(pipeline="batch", stage="filter_same_series"):
+            filtered = [self._filter_series(pools[j], seed_idx, k) for j, (_, seed_idx) in enumerate(live)]
+        for j, cands in enumerate(filtered):
+            CANDIDATE_POOL_SIZE.observe(len(pools[j]), pipeline="batch", step="knn")
+            CANDIDATE_POOL_SIZE.observe(len(cands), pipeline="batch", step="filtered")
+        query_vecs = np.stack([animeknn.seed_centroid(rows(self.embeddings, seed_idx)) for _, seed_idx in live])
+
+        # 3) MMR for every pool larger than k, padded into one (Q, C) batch
+        with stage(pipeline="batch", stage="mmr_rerank"):
+            rerank = [j for j, cands in enumerate(filtered) if len(cands) > k]
+            if rerank:
+                width = max(len(filtered[j]) for j in rerank)
+                padded = np.zeros((len(rerank), width), dtype=np.intp)
+                valid = np.zeros((len(rerank), width), dtype=bool)
+                for row, j in enumerate(rerank):
+                    padded[row, :len(filtered[j])] = filtered[j]
+                    valid[row, :len(filtered[j])] = True
+
+                cand_emb = rows(self.embeddings, padded)
+                relevance = np.einsum('qcd,qd->qc', cand_emb, query_vecs[rerank])
+                if mode == "max":
+                    for row, j in enumerate(rerank):
+                        if len(live[j][1]) > 1:
+                            relevance[row, :len(filtered[j])] = animeknn.gather_similarities(
+                                filtered[j], pools[j], pool_sims[j])
+
+                order = animeknn.mmr_rerank_batch(cand_emb, query_vecs[rerank], lambda_mult,
+                                                  top_n=k * 3, valid=valid, relevance=relevance)
+                for row, j in enumerate(rerank):
+                    filtered[j] = padded[row, order[row][order[row] >= 0]]
+
+        # 4) Genre diversity
+        with stage(pipeline="batch", stage="diversify_by_genre"):
+            for j, (i, _) in enumerate(live):
+                cand_indices = animeknn.diversify_by_genre_codes(filtered[j][:k * 2], self.genre_codes, max_per_genre=20)
+                final = np.asarray(cand_indices[:k], dtype=np.intp)
+                results[i] = final, self._final_similarities(final, pools[j], pool_sims[j],
+                                                             query_vecs[j], j in scanned)
+        return results
+
+    def recommend(self, anime_ids: List[int], k: int = 20, lambda_mult: float = 0.7,
+                  mode: str = "centroid") -> List[Dict]:
+        found = self._recommend_indices(anime_ids, k, lambda_mult, mode)
+        if found is None:
+            return []
+        with STAGE_SECONDS.time(pipeline="single", stage="response_build"):
+            return self.display.records(*found)
+
+    def recommend_json(self, anime_ids: List[int], k: int = 20, lambda_mult: float = 0.7,
+                       mode: str = "centroid") -> str:
+        """Same as recommend(), serialized from the display store's JSON fragments."""
+        found = self._recommend_indices(anime_ids, k, lambda_mult, mode)
+        if found is None:
+            return "[]"
+        with STAGE_SECONDS.time(pipeline="single", stage="response_build"):
+            return self.display.to_json(*found)
+
+    def recommend_columns(self, anime_ids: List[int], k: int = 20, lambda_mult: float = 0.7,
+                          mode: str = "centroid") -> Dict[str, list]:
+        """Same as recommend(), as display store columns (field -> list)."""
+        found = self._recommend_indices(anime_ids, k, lambda_mult, mode)
+        if found is None:
+            found = np.empty(0, dtype=np.intp), np.empty(0, dtype=np.float32)
+        with STAGE_SECONDS.time(pipeline="single", stage="response_build"):
+            return self.display.column_batch(*found)
+
+    def recommend_json_batch(self, seed_lists: Sequence[List[int]], k: int = 20,
+                             lambda_mult: float = 0.7, mode: str = "centroid",
+                             block_size: int = BATCH_BLOCK) -> Iterator[str]:
+        """
+        recommend_json() for each seed list, in order. Lists are scored
+        block_size at a time, so results stream out as each block finishes.
+        """
+        for start in range(0, len(seed_lists), block_size):
+            block = self._recommend_indices_batch(seed_lists[start:start + block_size], k, lambda_mult, mode)
+            with STAGE_SECONDS.time(pipeline="batch", stage="response_build"):
+                bodies = ["[]" if found is None else self.display.to_json(*found) for found in block]
+            yield from bodies
+
+
+class LazyRecommender:
+    """
+    Builds AnimeKNNRecommender on first use, or ahead of time in a
+    background warm-up thread, and reports load progress.
+    """
+
+    def __init__(self, **kwargs):
+        self._kwargs = kwargs
+        self._lock = threading.Lock()
+        self._recommender: Optional[AnimeKNNRecommender] = None
+
+    @property
+    def ready(self) -> bool:
+        return self._recommender is not None
+
+    def get(self) -> AnimeKNNRecommender:
+        """Return the recommender, loading it (once) if needed."""
+        if self._recommender is None:
+            with self._lock:
+                if self._recommender is None:
+                    self._recommender = AnimeKNNRecommender(**self._kwargs)
+        return self._recommender
+
+    def warm_up(self) -> threading.Thread:
+        return animeknn.engine.warm_up(then=self.get)
+
+    def status(self) -> Dict:
+        status = animeknn.engine.status()
+        status["recommender_ready"] = self.ready
+        return status
@@ -0,0 +1,268 @@
+# response_cache.py
+"""
+Bounded LRU/TTL cache for serialized API responses.
+
+- Memory-bounded: entries are evicted least-recently-used once the total
+  size of cached values passes max_bytes.
+- TTL: entries older than ttl seconds are treated as misses and dropped.
+- Single-flight: concurrent misses for the same key wait for one
+  computation instead of all running the pipeline.
+- Optional shared tier: a SQLite file that every gunicorn worker on the
+  box reads and writes, so a response computed by one worker serves all.
+
+Counters (hits, misses, evictions, expirations, coalesced, shared_hits)
+are exposed through stats().
+"""
+from __future__ import annotations
+from typing import Callable, Dict, Optional
+from collections import OrderedDict
+from pathlib import Path
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_TTL = 15 * 60
+DEFAULT_SHARED_MAX_ENTRIES = 100_000
+
+
+def make_key(*parts) -> str:
+    """Stable string key from hashable parts (tuples, numbers, strings)."""
+    return "|".join(repr(p) for p in parts)
+
+
+def _sizeof(value) -> int:
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    return sys.getsizeof(value)
+
+
+class SQLiteBackend:
+    """
+    On-disk tier shared across processes. One connection per thread and
+    per process, so it stays valid after gunicorn forks.
+    """
+
+    def __init__(self, path: Path, ttl: float = DEFAULT_TTL,
+                 max_entries: int = DEFAULT_SHARED_MAX_ENTRIES):
+        self.path = str(path)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._writes = 0
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                " key TEXT PRIMARY KEY, value BLOB, expires REAL, accessed REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache(accessed)")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def get(self, key: str):
+        now = time.time()
+        conn = self._connect()
+        row = conn.execute("SELECT value, expires FROM cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        if row[1] < now:
+            conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+            return None
+        conn.execute("UPDATE cache SET accessed = ? WHERE key = ?", (now, key))
+        return row[0]
+
+    def set(self, key: str, value):
+        now = time.time()
+        conn = self._connect()
+        conn.execute("INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?)",
+                     (key, value, now + self.ttl, now))
+
+        # Trim occasionally rather than on every write
+        with self._lock:
+            self._writes += 1
+            trim = self._writes % 256 == 0
+        if trim:
+            conn.execute("DELETE FROM cache WHERE expires < ?", (now,))
+            conn.execute(
+                "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY accessed DESC "
+                "LIMIT -1 OFFSET ?)", (self.max_entries,)
+            )
+
+    def clear(self):
+        self._connect().execute("DELETE FROM cache")
+
+
+class _Flight:
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error: Optional[BaseException] = None
+
+
+class ResponseCache:
+    """
+    Thread-safe in-process LRU with TTL, single-flight misses and an
+    optional shared backend consulted on local misses.
+    """
+
+    def __init__(self,
+                 max_bytes: int = DEFAULT_MAX_BYTES,
+                 ttl: float = DEFAULT_TTL,
+                 shared: Optional[SQLiteBackend] = None):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.shared = shared
+
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()   # key -> (value, size, expires)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, _Flight] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.coalesced = 0
+        self.shared_hits = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _get_local(self, key: str):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, size, expires = entry
+        if expires < time.monotonic():
+            del self._entries[key]
+            self._bytes -= size
+            self.expirations += 1
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def _set_local(self, key: str, value):
+        size = _sizeof(value)
+        if size > self.max_bytes:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= old[1]
+        self._entries[key] = (value, size, time.monotonic() + self.ttl)
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            _, (_, old_size, _) = self._entries.popitem(last=False)
+            self._bytes -= old_size
+            self.evictions += 1
+
+    def get(self, key: str):
+        with self._lock:
+            value = self._get_local(key)
+            if value is not None:
+                self.hits += 1
+                return value
+
+        if self.shared is not None:
+            value = self.shared.get(key)
+            if value is not None:
+                with self._lock:
+                    self._set_local(key, value)
+                    self.hits += 1
+                    self.shared_hits += 1
+                return value
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key: str, value):
+        with self._lock:
+            self._set_local(key, value)
+        if self.shared is not None:
+            self.shared.set(key, value)
+
+    def get_or_compute(self, key: str, compute: Callable[[], object]):
+        """
+        Return the cached value, or compute it once for all concurrent
+        callers asking for the same key.
+        """
+        value = self.get(key)
+        if value is not None:
+            return value
+
+        with self._lock:
+            value = self._get_local(key)
+            if value is not None:
+                return value
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _Flight()
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            value = compute()
+            self.set(key, value)
+            flight.value = value
+            return value
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            flight.event.set()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+        if self.shared is not None:
+            self.shared.clear()
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "coalesced": self.coalesced,
+                "shared_hits": self.shared_hits,
+            }
+
+
+def cache_from_env(prefix: str = "RESPONSE_CACHE") -> ResponseCache:
+    """
+    Build a cache from environment settings:
+      {prefix}_MB    memory bound in megabytes (default 64)
+      {prefix}_TTL   seconds to keep entries (default 900)
+      {prefix}_PATH  SQLite file for the shared tier (disabled when unset)
+    """
+    max_bytes = int(float(os.getenv(f"{prefix}_MB", DEFAULT_MAX_BYTES / 2**20)) * 2**20)
+    ttl = float(os.getenv(f"{prefix}_TTL", DEFAULT_TTL))
+    path = os.getenv(f"{prefix}_PATH")
+    shared = SQLiteBackend(Path(path), ttl=ttl) if path else None
+    return ResponseCache(max_bytes=max_bytes, ttl=ttl, shared=shared)
@@ -0,0 +1,128 @@
+# response_formats.py
+"""
+Binary, columnar encodings for API responses.
+
+Service-to-service callers can ask for MessagePack or Arrow IPC through the
+Accept header instead of JSON. Both carry one array per field rather than
+one object per result, so keys aren't repeated per item and the columns
+come straight out of the display store / title index.
+
+- MessagePack (application/msgpack): a map of field -> list. Needs the
+  `msgpack` package (in requirements.txt); without it the format is simply
+  not offered and such clients get JSON.
+- Arrow IPC stream (application/vnd.apache.arrow.stream): one record batch
+  with a fixed schema (COLUMN_TYPES).
+
+Both binary formats use typed columns: the "N/A" placeholders the JSON
+responses carry for missing scores/episodes become nulls.
+
+JSON stays the default when the client doesn't ask for either.
+"""
+from __future__ import annotations
+from typing import Dict, List, Optional
+import math
+import pyarrow as pa
+
+try:
+    import msgpack
+except ImportError:  # optional dependency
+    msgpack = None
+
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+ARROW = "application/vnd.apache.arrow.stream"
+
+# Alternative spellings clients send for the same formats
+ALIASES = {
+    "application/x-msgpack": MSGPACK,
+    "application/vnd.msgpack": MSGPACK,
+    "application/vnd.apache.arrow.file": ARROW,
+}
+
+# Column types of the binary formats; other fields fall back to inference
+COLUMN_TYPES = {
+    "anime_id": pa.int64(),
+    "name": pa.string(),
+    "english_name": pa.string(),
+    "score": pa.float64(),
+    "episodes": pa.float64(),
+    "genres": pa.string(),
+    "image_url": pa.string(),
+    "anime_url": pa.string(),
+    "similarity": pa.float64(),
+}
+
+
+def _number(value) -> Optional[float]:
+    # Missing, placeholder ("N/A") or non-finite values are nulls
+    if isinstance(value, bool) or value is None:
+        return None
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return value if math.isfinite(value) else None
+
+
+def typed_columns(columns: Dict[str, list]) -> Dict[str, list]:
+    """Coerce known fields to their COLUMN_TYPES, with nulls for missing values."""
+    out = {}
+    for field, values in columns.items():
+        kind = COLUMN_TYPES.get(field)
+        if kind is None:
+            out[field] = list(values)
+        elif pa.types.is_string(kind):
+            out[field] = [None if v is None else str(v) for v in values]
+        elif pa.types.is_integer(kind):
+            nums = [_number(v) for v in values]
+            out[field] = [None if v is None else int(v) for v in nums]
+        else:
+            out[field] = [_number(v) for v in values]
+    return out
+
+
+def schema_for(columns: Dict[str, list]) -> pa.Schema:
+    return pa.schema([
+        (field, COLUMN_TYPES.get(field) or pa.array(values).type) for field, values in columns.items()
+    ])
+
+
+def available_formats() -> List[str]:
+    formats = [JSON, ARROW]
+    if msgpack is not None:
+        formats.append(MSGPACK)
+    return formats
+
+
+def negotiate(accept_mimetypes, default: str = JSON) -> str:
+    """
+    Pick the response format from a werkzeug MIMEAccept (request.accept_mimetypes).
+    Browsers send */* and get JSON.
+    """
+    offers = available_formats() + [m for m, fmt in ALIASES.items() if fmt in available_formats()]
+    best: Optional[str] = None
+    best_quality = 0
+    for mimetype in offers:
+        # Exact matches only, so */* never selects a binary format
+        quality = max((q for value, q in accept_mimetypes if value == mimetype), default=0)
+        if quality > best_quality:
+            best, best_quality = mimetype, quality
+    if best is None:
+        return default
+    return ALIASES.get(best, best)
+
+
+def encode_columns(columns: Dict[str, list], mimetype: str) -> bytes:
+    """Serialize field -> values columns in a binary format."""
+    columns = typed_columns(columns)
+    if mimetype == MSGPACK:
+        if msgpack is None:
+            raise RuntimeError("msgpack is not installed")
+        return msgpack.packb(columns, use_bin_type=True)
+    if mimetype == ARROW:
+        batch = pa.RecordBatch.from_pydict(columns, schema=schema_for(columns))
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, batch.schema) as writer:
+            writer.write_batch(batch)
+        return sink.getvalue().to_pybytes()
+    raise ValueError(f"Unsupported response format: {mimetype!r}")
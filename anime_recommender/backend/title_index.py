@@ -0,0 +1,282 @@
+# title_index.py
+"""
+In-memory title index for /api/search typeahead.
+
+Built once at startup from the display table: every title (english_name,
+name, japanese_names) is lowercased, broken into character trigrams and
+posted into an inverted index. A query intersects the posting lists of its
+trigrams and verifies the few surviving rows, so it never scans the catalog.
+Queries shorter than a trigram have no trigrams to intersect; they scan the
+flat title array with one vectorized substring match instead.
+
+Hits are ranked exact > prefix > substring, then by members (most popular
+first).
+
+fuzzy_search() tolerates typos: the trigram postings act as a blocking
+index that shortlists rows sharing the most trigrams with the query, and
+only that shortlist is scored with rapidfuzz.
+
+canonicalize() rewrites free text (chat messages) with every catalog title
+it mentions replaced by an `anime:<id>` token, so different spellings of
+one show ("Attack on Titan", "shingeki no kyojin") compare equal.
+"""
+from __future__ import annotations
+from typing import Dict, List, Optional
+import re
+import threading
+import unicodedata
+import numpy as np
+import pandas as pd
+from rapidfuzz import fuzz, process
+
+NAME_COLUMNS = ["english_name", "name", "japanese_names"]
+NGRAM = 3
+FUZZY_SHORTLIST = 64
+FUZZY_MIN_SCORE = 70
+ALIAS_MAX_WORDS = 8
+ALIAS_MIN_CHARS = 3
+
+_PUNCT = re.compile(r"[^\w\s]+")
+
+
+def normalize_title(value) -> str:
+    """Lowercase and collapse whitespace; missing values become ''."""
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return ""
+    return " ".join(str(value).lower().split())
+
+
+def strip_punctuation(text: str) -> str:
+    """NFKC-fold, lowercase, turn punctuation into spaces and collapse whitespace."""
+    text = unicodedata.normalize("NFKC", str(text)).lower()
+    return " ".join(_PUNCT.sub(" ", text).split())
+
+
+def trigrams(text: str) -> set:
+    return {text[i:i + NGRAM] for i in range(len(text) - NGRAM + 1)}
+
+
+def _safe_str(value, fallback="Unknown"):
+    if value is None or pd.isna(value):
+        return fallback
+    s = str(value).strip()
+    return fallback if not s or s.lower() == "nan" else s
+
+
+class TitleIndex:
+    """
+    Trigram index over catalog titles, with a substring scan for short queries.
+
+    Attributes:
+        titles: per row, the normalized titles it can be found by
+        items: per row, the prebuilt search result payload
+        popularity: per row, the members count used for ranking
+    """
+
+    def __init__(self, raw_data: pd.DataFrame, metadata: Optional[pd.DataFrame] = None):
+        data = raw_data
+        ids = pd.to_numeric(data.get("anime_id"), errors="coerce")
+        data = data[ids.notna()].reset_index(drop=True)
+        ids = ids.dropna().astype(int).to_numpy()
+
+        # Pick up japanese_names from metadata when the display table lacks it
+        if metadata is not None and "japanese_names" not in data.columns and "japanese_names" in metadata.columns:
+            jp = metadata.drop_duplicates("anime_id").set_index("anime_id")["japanese_names"]
+            data = data.assign(japanese_names=jp.reindex(ids).to_numpy())
+
+        cols = [c for c in NAME_COLUMNS if c in data.columns]
+        columns = {c: data[c].tolist() for c in cols + ["image_url"] if c in data.columns}
+
+        missing = [None] * len(ids)
+        english_names = columns.get("english_name", missing)
+        names = columns.get("name", missing)
+        images = columns.get("image_url", missing)
+
+        self.titles: List[List[str]] = []
+        self.items: List[Dict] = []
+        for r, aid in enumerate(ids):
+            titles = []
+            for c in cols:
+                t = normalize_title(columns[c][r])
+                if t and t != "nan" and t not in titles:
+                    titles.append(t)
+            self.titles.append(titles)
+
+            # Prefer English name if available
+            name = english_names[r] if _safe_str(english_names[r], None) else names[r]
+            self.items.append({
+                "anime_id": int(aid),
+                "name": _safe_str(name),
+                "image_url": _safe_str(images[r], None),
+            })
+
+        if "members" in data.columns:
+            self.popularity = pd.to_numeric(data["members"], errors="coerce").fillna(0).to_numpy(dtype=np.float64)
+        elif "popularity" in data.columns:
+            # MAL popularity is a rank: lower is more popular
+            self.popularity = -pd.to_numeric(data["popularity"], errors="coerce").fillna(np.inf).to_numpy(dtype=np.float64)
+        else:
+            self.popularity = np.zeros(len(ids))
+
+        # Trigram → sorted row ids
+        postings: Dict[str, List[int]] = {}
+        for r, titles in enumerate(self.titles):
+            grams = set()
+            for t in titles:
+                grams |= trigrams(t)
+            for g in grams:
+                postings.setdefault(g, []).append(r)
+        self.postings = {g: np.asarray(rows, dtype=np.int32) for g, rows in postings.items()}
+
+        # Every title with its row, for short-query substring scans
+        self.flat_titles = pd.Series([t for titles in self.titles for t in titles], dtype=object)
+        self.flat_rows = np.asarray([r for r, titles in enumerate(self.titles) for _ in titles], dtype=np.int32)
+
+        # Punctuation-free title → anime_id, built on first canonicalize()
+        self._aliases: Optional[Dict[str, int]] = None
+        self._aliases_lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def _build_aliases(self) -> Dict[str, int]:
+        aliases: Dict[str, int] = {}
+        # Most popular row first, so it owns titles shared by several rows
+        for r in np.argsort(-self.popularity, kind="stable").tolist():
+            for t in self.titles[r]:
+                key = strip_punctuation(t)
+                if len(key) >= ALIAS_MIN_CHARS and key.count(" ") < ALIAS_MAX_WORDS:
+                    aliases.setdefault(key, self.items[r]["anime_id"])
+        return aliases
+
+    def canonicalize(self, text: str) -> str:
+        """
+        Normalized text with title mentions replaced by `anime:<id>` tokens.
+        Matches whole words, longest title first.
+        """
+        if self._aliases is None:
+            with self._aliases_lock:
+                if self._aliases is None:
+                    self._aliases = self._build_aliases()
+        aliases = self._aliases
+
+        words = strip_punctuation(text).split()
+        out, i = [], 0
+        while i < len(words):
+            for n in range(min(ALIAS_MAX_WORDS, len(words) - i), 0, -1):
+                anime_id = aliases.get(" ".join(words[i:i + n]))
+                if anime_id is not None:
+                    out.append(f"anime:{anime_id}")
+                    i += n
+                    break
+            else:
+                out.append(words[i])
+                i += 1
+        return " ".join(out)
+
+    def _candidates(self, q: str) -> np.ndarray:
+        if len(q) < NGRAM:
+            hits = self.flat_titles.str.contains(q, regex=False).to_numpy(dtype=bool)
+            return np.unique(self.flat_rows[hits])
+
+        lists = []
+        for g in trigrams(q):
+            rows = self.postings.get(g)
+            if rows is None:
+                return np.empty(0, dtype=np.int32)
+            lists.append(rows)
+        lists.sort(key=len)
+        cand = lists[0]
+        for rows in lists[1:]:
+            cand = np.intersect1d(cand, rows, assume_unique=True)
+            if len(cand) == 0:
+                break
+        return cand
+
+    def rows_to_items(self, rows: np.ndarray) -> List[Dict]:
+        return [dict(self.items[r]) for r in rows]
+
+    def rows_to_columns(self, rows: np.ndarray) -> Dict[str, list]:
+        """Search results as columns (field -> list), for binary encoders."""
+        items = [self.items[r] for r in rows]
+        return {f: [item[f] for item in items] for f in ("anime_id", "name", "image_url")}
+
+    def search(self, q: str, limit: int = 10) -> List[Dict]:
+        """Typeahead lookup: rows whose titles contain q, best first."""
+        return self.rows_to_items(self.search_rows(q, limit))
+
+    def search_rows(self, q: str, limit: int = 10) -> np.ndarray:
+        """Row numbers for search()."""
+        q = normalize_title(q)
+        if not q:
+            return np.empty(0, dtype=np.int64)
+
+        hits, tiers = [], []
+        for r in self._candidates(q).tolist():
+            tier = None
+            for t in self.titles[r]:
+                if t == q:
+                    tier = 0
+                    break
+                if t.startswith(q):
+                    tier = 1 if tier is None else min(tier, 1)
+                elif q in t and tier is None:
+                    tier = 2
+            if tier is not None:
+                hits.append(r)
+                tiers.append(tier)
+
+        if not hits:
+            return np.empty(0, dtype=np.int64)
+        hits = np.asarray(hits)
+        order = np.lexsort((-self.popularity[hits], np.asarray(tiers)))[:limit]
+        return hits[order]
+
+    def fuzzy_search(self, q: str, limit: int = 10,
+                     shortlist: int = FUZZY_SHORTLIST,
+                     min_score: float = FUZZY_MIN_SCORE) -> List[Dict]:
+        """
+        Typo-tolerant lookup. Rows are blocked by how many query trigrams they
+        share, and only the best `shortlist` rows are scored with rapidfuzz.
+        """
+        return self.rows_to_items(self.fuzzy_search_rows(q, limit, shortlist, min_score))
+
+    def fuzzy_search_rows(self, q: str, limit: int = 10,
+                          shortlist: int = FUZZY_SHORTLIST,
+                          min_score: float = FUZZY_MIN_SCORE) -> np.ndarray:
+        """Row numbers for fuzzy_search()."""
+        q = normalize_title(q)
+        if len(q) < NGRAM:
+            return self.search_rows(q, limit)
+
+        lists = [self.postings[g] for g in trigrams(q) if g in self.postings]
+        if not lists:
+            return np.empty(0, dtype=np.int64)
+        overlap = np.bincount(np.concatenate(lists), minlength=len(self.items))
+
+        # Require at least a couple of shared trigrams for longer queries
+        min_overlap = 1 if len(lists) < 4 else 2
+        cand = np.flatnonzero(overlap >= min_overlap)
+        if len(cand) > shortlist:
+            # Most shared trigrams first, popularity breaks ties
+            cand = cand[np.lexsort((-self.popularity[cand], -overlap[cand]))[:shortlist]]
+
+        choices, owners = [], []
+        for r in cand.tolist():
+            for t in self.titles[r]:
+                choices.append(t)
+                owners.append(r)
+
+        best: Dict[int, float] = {}
+        for _, score, i in process.extract(q, choices, scorer=fuzz.WRatio,
+                                           limit=None, score_cutoff=min_score):
+            r = owners[i]
+            if score > best.get(r, 0):
+                best[r] = score
+        if not best:
+            return np.empty(0, dtype=np.int64)
+
+        rows = np.fromiter(best.keys(), dtype=np.int64)
+        scores = np.fromiter(best.values(), dtype=np.float64)
+        order = np.lexsort((-self.popularity[rows], -scores))[:limit]
+        return rows[order]
@@ -126,9 +126,16 @@ drive.mount('/content/drive')
 import pandas as pd
 import numpy as np
 import re
-from rapidfuzz import fuzz
+import sys
+from pathlib import Path
 from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+from sparse_neighbors import SparseNeighbors  # sparse_neighbors.py next to this notebook
+
+# franchise_clusters.py is shared with the backend rather than copied here:
+# put anime_recommender/backend (two levels up from models/pyth) on the path
+_HERE = Path(__file__).resolve().parent if "__file__" in globals() else Path.cwd()
+sys.path.insert(0, str(_HERE.parents[1] / "anime_recommender" / "backend"))
+from franchise_clusters import build_franchise_ids, save_franchises
 from sklearn.preprocessing import normalize
 from scipy.sparse import hstack
 
@@ -171,43 +178,21 @@ combined_matrix = hstack([
     W_STUDIOS * tfidf_studios
 ])
 
-def extract_core_name(title: str) -> str:
-    """
-    Extracts a normalized franchise/base title.
-    This removes sequel indicators, subtitles, punctuation, and numbers.
-    """
-    if pd.isna(title):
-        return ''
-    title = title.lower()
-
-    # Cut at common subtitle separators
-    title = re.split(r'[:\-–—\(\)\[\]]', title)[0]
-
-    # Remove sequel indicators
-    title = re.sub(r'\b(season|part|special|movie|ova|final|chapter|edition|arc|remake|rebuild|stage|act|sequel|prequel|series)\b', '', title)
-
-    # Remove ordinal indicators like 1st, 2nd, 3rd, etc.
-    title = re.sub(r'\b(\d+(st|nd|rd|th))\b', '', title)
-
-    # Remove standalone digits and roman numerals (I, II, III, IV, etc.)
-    title = re.sub(r'\b(\d+|i{1,3}|iv|v|vi{0,3}|vii{0,3}|ix|x)\b', '', title)
+# Offline franchise clusters: titles linked by token prefixes / near-identical
+# keys, merged with union-find (anime_recommender/backend/franchise_clusters.py)
+df["franchise_id"] = build_franchise_ids(df["name"].fillna("").tolist())
+franchise_ids = df["franchise_id"].to_numpy()
+save_franchises("franchises.npz", df["anime_id"].to_numpy(), franchise_ids)
+# Title prefixes (first two words) back the clusters up for sequels they missed
+titles = df["name"].fillna("").str.lower().to_numpy(dtype=str)
+title_roots = np.array([" ".join(t.split()[:2]) for t in titles], dtype=str)
 
-    # Remove extra words like "hyouketsu no kizuna", "divide by zero"
-    # (They are post-subtitle phrases in many MAL entries)
-    title = re.sub(r'(no|by|kizuna|link|divide|zero|hyouketsu)', '', title)
+# === 4️⃣ Compute top-k cosine neighbors ===
+# Blocked sparse top-k instead of a dense N×N matrix: memory is O(N·k)
+NEIGHBORS_K = 200
+neighbors = SparseNeighbors.build(combined_matrix, k=NEIGHBORS_K)
 
-    # Remove punctuation, normalize whitespace
-    title = re.sub(r'[^a-z0-9\s]', ' ', title)
-    title = re.sub(r'\s+', ' ', title).strip()
-
-    return title
-
-df["core_name"] = df["name"].apply(extract_core_name)
-
-# === 4️⃣ Compute cosine similarity ===
-cosine_sim = cosine_similarity(combined_matrix, combined_matrix)
-
-print("✅ Combined TF-IDF matrix and cosine similarity computed.")
+print("✅ Combined TF-IDF matrix and top-k cosine neighbors computed.")
 
 
 # === 5️⃣ Recommendation function ==
@@ -217,40 +202,23 @@ def recommend_anime_by_id(anime_id, top_n=5):
         return f"No anime found with id {anime_id}."
 
     idx = df.index[df['anime_id'] == anime_id][0]
-    base_name = df.loc[idx, 'name']
-    base_core = df.loc[idx, 'core_name']
-
-    sim_scores = list(enumerate(cosine_sim[idx]))
-    sim_scores = sorted(sim_scores, key=lambda x: x[1], reverse=True)
-
-    recs = []
-    for i, _ in sim_scores:
-        if i == idx:
-            continue
-
-        cand_core = df.loc[i, 'core_name']
-        cand_name = df.loc[i, 'name']
-
-        # Skip same or very similar franchises
-        if cand_core == base_core:
-            continue
-        if base_core in cand_core or cand_core in base_core:
-            continue
-        if fuzz.partial_ratio(base_core, cand_core) > 75:
-            continue
-        if re.search(r'(season|part|ova|special|movie|final|rebuild)', cand_name, re.I):
-            if base_core.split()[0] in cand_core:
-                continue
-
-        recs.append(i)
-        if len(recs) >= top_n * 3:  # collect a few extra to filter later
+    base_franchise = franchise_ids[idx]
+
+    # Stored neighbors first; the exact full row only if they hold too few other franchises
+    for n in (NEIGHBORS_K, len(df) - 1):
+        cand = neighbors.top(idx, n)[0]
+        same = franchise_ids[cand] == base_franchise
+        if title_roots[idx]:
+            same |= np.char.startswith(titles[cand], title_roots[idx])
+        cand = cand[~same]
+        # One title per franchise, best first
+        _, first = np.unique(franchise_ids[cand], return_index=True)
+        recs = cand[np.sort(first)][:top_n]
+        if len(recs) >= top_n:
             break
 
-    results = df.iloc[recs][['anime_id', 'name', 'core_name', 'score', 'genres', 'rating']]
-    results = results.drop_duplicates(subset='core_name', keep='first').head(top_n)
-
     # ✅ Return only the clean version too
-    return results[['anime_id', 'name', 'score']].reset_index(drop=True)
+    return df.iloc[recs][['anime_id', 'name', 'score']].reset_index(drop=True)
 
 print(recommend_anime_by_id(9253, top_n=5))
 
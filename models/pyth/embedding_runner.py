@@ -0,0 +1,356 @@
+# embedding_runner.py
+"""
+Concurrent, resumable batch embedding.
+
+Texts are packed into token-budgeted batches and sent through a pluggable
+backend by a bounded pool of in-flight requests. Two token buckets keep the
+job under the API's requests/min and tokens/min quotas. A failed batch is
+retried with exponential backoff and jitter, and does not hold up the
+others.
+
+Finished vectors are written to checkpoint parts (checkpoint_dir/part-*.parquet,
+keyed by the caller's content hash) every few batches and when the job
+stops, including on errors. A rerun skips every key already in a part, so a
+crash loses at most one checkpoint interval. The caller deletes the
+directory (clear_checkpoints) once the vectors are merged into its store.
+
+    runner = EmbeddingRunner(VertexBackend(model), checkpoint_dir="embed_ckpt")
+    vectors = runner.run(keys, texts)   # key -> float32 vector
+
+StubBackend is a deterministic local encoder (vectors seeded by the text
+hash), for tests and for timing the runner without network access:
+
+    python embedding_runner.py [rows] [--in-flight N] [--latency SECONDS]
+"""
+from __future__ import annotations
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Dict, List, Optional, Protocol, Sequence
+import argparse
+import hashlib
+import inspect
+import json
+import random
+import shutil
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+# Heuristic: ~4 characters ≈ 1 token (safe-ish). Use 18k to leave headroom under the 20k hard cap.
+CHARS_PER_TOKEN = 4
+MAX_TOKENS_PER_REQUEST = 18_000
+HARD_CAP_BATCH = 100  # never exceed this many rows per request even if token budget remains
+
+
+def estimate_tokens(text: str) -> int:
+    # Fast heuristic; Vertex CountTokens API exists, but we avoid extra round trips.
+    return max(1, len(text) // CHARS_PER_TOKEN)
+
+
+def pack_batches(texts: Sequence[str],
+                 max_tokens: int = MAX_TOKENS_PER_REQUEST,
+                 hard_cap: int = HARD_CAP_BATCH) -> List[List[int]]:
+    """Split texts into batches of positions under the token budget and row cap."""
+    batches, cur, cur_tokens = [], [], 0
+    for i, text in enumerate(texts):
+        est = estimate_tokens(text)
+        if cur and (cur_tokens + est > max_tokens or len(cur) >= hard_cap):
+            batches.append(cur)
+            cur, cur_tokens = [], 0
+        # A single huge text still goes alone (the SDK can auto-truncate per item)
+        cur.append(i)
+        cur_tokens += est
+    if cur:
+        batches.append(cur)
+    return batches
+
+
+def content_hash(fields: Sequence[str], params: Dict) -> str:
+    """
+    Cache key of one row's vector: its input fields plus every request
+    parameter that changes the output (model, task type, truncation, ...).
+    """
+    head = json.dumps(params, sort_keys=True)
+    return hashlib.sha256("\x1f".join([head, *fields]).encode("utf-8")).hexdigest()
+
+
+# ---------------------------------------------------
+# Backends
+# ---------------------------------------------------
+
+class EmbeddingBackend(Protocol):
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """One float32 row per text; must be safe to call from several threads."""
+        ...
+
+
+class VertexBackend:
+    """
+    Vertex AI TextEmbeddingModel, e.g. TextEmbeddingModel.from_pretrained("text-embedding-004").
+
+    task_type is sent with every text. auto_truncate is only requested when
+    this SDK's get_embeddings accepts it; params reports what is actually
+    sent, for the caller's content hash.
+    """
+
+    def __init__(self, model, task_type: Optional[str] = None, auto_truncate: bool = True):
+        self.model = model
+        self.task_type = task_type
+        try:
+            accepted = inspect.signature(model.get_embeddings).parameters
+        except (TypeError, ValueError):
+            accepted = {}
+        self.auto_truncate = auto_truncate and "auto_truncate" in accepted
+
+    @property
+    def params(self) -> Dict:
+        return {"task_type": self.task_type, "auto_truncate": self.auto_truncate}
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        inputs = texts
+        if self.task_type:
+            from vertexai.language_models import TextEmbeddingInput
+            inputs = [TextEmbeddingInput(text, self.task_type) for text in texts]
+        kwargs = {"auto_truncate": True} if self.auto_truncate else {}
+        resp = self.model.get_embeddings(inputs, **kwargs)
+        return np.vstack([np.asarray(e.values, dtype=np.float32) for e in resp])
+
+
+class StubBackend:
+    """
+    Deterministic local encoder: the same text always gets the same vector.
+    latency (seconds per call) simulates a network round trip.
+    """
+
+    def __init__(self, dim: int = 768, latency: float = 0.0):
+        self.dim = dim
+        self.latency = latency
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        with self._lock:
+            self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        rows = []
+        for text in texts:
+            seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+            rows.append(np.random.default_rng(seed).standard_normal(self.dim, dtype=np.float32))
+        return np.vstack(rows) if rows else np.zeros((0, self.dim), dtype=np.float32)
+
+
+# ---------------------------------------------------
+# Rate limiting
+# ---------------------------------------------------
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: `rate` tokens per second, bursts up to `capacity`.
+    acquire(n) reserves n tokens and blocks until they have all accrued, so
+    a request larger than the capacity simply waits longer, and concurrent
+    callers queue behind each other's reservations.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def per_minute(cls, amount: Optional[float]) -> Optional["TokenBucket"]:
+        # A minute's quota refills continuously; bursts are capped at one second's worth
+        return cls(amount / 60.0, capacity=max(1.0, amount / 60.0)) if amount else None
+
+    def acquire(self, n: float = 1.0):
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # Goes negative when the bucket can't cover n; the debt is waited out
+            self._tokens -= float(n)
+            wait_s = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait_s:
+            time.sleep(wait_s)
+
+
+# ---------------------------------------------------
+# Checkpoints
+# ---------------------------------------------------
+
+def load_checkpoints(checkpoint_dir) -> Dict[str, np.ndarray]:
+    """key -> vector from every part in checkpoint_dir (empty if there are none)."""
+    done: Dict[str, np.ndarray] = {}
+    for part in sorted(Path(checkpoint_dir).glob("part-*.parquet")):
+        table = pd.read_parquet(part)
+        done.update((k, np.asarray(v, dtype=np.float32)) for k, v in zip(table["key"], table["embedding"]))
+    return done
+
+
+def clear_checkpoints(checkpoint_dir):
+    shutil.rmtree(checkpoint_dir, ignore_errors=True)
+
+
+class _CheckpointWriter:
+    def __init__(self, checkpoint_dir):
+        self.dir = Path(checkpoint_dir)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        parts = [int(p.stem.split("-")[1]) for p in self.dir.glob("part-*.parquet")]
+        self._next = max(parts, default=-1) + 1
+        self._keys: List[str] = []
+        self._vectors: List[np.ndarray] = []
+
+    def add(self, keys: List[str], vectors: np.ndarray):
+        self._keys.extend(keys)
+        self._vectors.extend(vectors)
+
+    def flush(self):
+        if not self._keys:
+            return
+        path = self.dir / f"part-{self._next:05d}.parquet"
+        tmp = path.with_suffix(".tmp")
+        # Written then renamed, so a crash mid-write never leaves a torn part
+        pd.DataFrame({"key": self._keys, "embedding": self._vectors}).to_parquet(tmp, index=False)
+        tmp.replace(path)
+        self._next += 1
+        self._keys, self._vectors = [], []
+
+
+# ---------------------------------------------------
+# Runner
+# ---------------------------------------------------
+
+class EmbeddingRunner:
+    """
+    Args:
+        backend: anything with embed(texts) -> (n, dim) float32
+        max_in_flight: concurrent requests
+        requests_per_minute / tokens_per_minute: quotas, None for unlimited
+        checkpoint_dir: where progress parts go; None disables checkpoints
+        checkpoint_every: batches between checkpoint parts
+        max_retries / base_sleep: per-batch exponential backoff
+    """
+
+    def __init__(self,
+                 backend: EmbeddingBackend,
+                 max_in_flight: int = 8,
+                 requests_per_minute: Optional[float] = None,
+                 tokens_per_minute: Optional[float] = None,
+                 checkpoint_dir: Optional[str] = None,
+                 checkpoint_every: int = 20,
+                 max_retries: int = 6,
+                 base_sleep: float = 1.2,
+                 max_tokens: int = MAX_TOKENS_PER_REQUEST,
+                 hard_cap: int = HARD_CAP_BATCH):
+        self.backend = backend
+        self.max_in_flight = max(1, max_in_flight)
+        self.request_bucket = TokenBucket.per_minute(requests_per_minute)
+        self.token_bucket = TokenBucket.per_minute(tokens_per_minute)
+        self.checkpoint_dir = checkpoint_dir
+        self.checkpoint_every = max(1, checkpoint_every)
+        self.max_retries = max_retries
+        self.base_sleep = base_sleep
+        self.max_tokens = max_tokens
+        self.hard_cap = hard_cap
+
+    def _embed_batch(self, i: int, texts: List[str]) -> np.ndarray:
+        tokens = sum(estimate_tokens(t) for t in texts)
+        attempt = 0
+        while True:
+            if self.request_bucket is not None:
+                self.request_bucket.acquire()
+            if self.token_bucket is not None:
+                self.token_bucket.acquire(tokens)
+            try:
+                vectors = np.asarray(self.backend.embed(texts), dtype=np.float32)
+                if len(vectors) != len(texts):
+                    raise RuntimeError(f"backend returned {len(vectors)} vectors for {len(texts)} texts")
+                return vectors
+            except Exception as e:
+                if attempt >= self.max_retries:
+                    raise RuntimeError(f"Failed after {self.max_retries} retries on batch {i} (size={len(texts)}): {e}") from e
+                wait_s = self.base_sleep * (2 ** attempt) * random.uniform(0.5, 1.5)
+                print(f"⚠️ Retrying batch {i} (size={len(texts)}) in {wait_s:.1f}s due to: {e}")
+                time.sleep(wait_s)
+                attempt += 1
+
+    def run(self, keys: Sequence[str], texts: Sequence[str]) -> Dict[str, np.ndarray]:
+        """
+        Embed texts (keys[i] names texts[i]); keys found in checkpoints are
+        not sent again. Returns key -> vector for every key.
+        """
+        if len(keys) != len(texts):
+            raise ValueError("keys and texts must have the same length")
+
+        done = load_checkpoints(self.checkpoint_dir) if self.checkpoint_dir else {}
+        todo: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in done:
+                todo.setdefault(key, text)
+        todo_keys = list(todo)
+        todo_texts = [todo[k] for k in todo_keys]
+        batches = pack_batches(todo_texts, self.max_tokens, self.hard_cap)
+        print(f"✓ {len(done)} resumed from checkpoints | {len(todo_keys)} to embed in {len(batches)} batches")
+
+        writer = _CheckpointWriter(self.checkpoint_dir) if self.checkpoint_dir else None
+        pending: Dict[Future, List[int]] = {}
+        finished = 0
+        start = time.perf_counter()
+        pool = ThreadPoolExecutor(max_workers=self.max_in_flight)
+        try:
+            queue = iter(enumerate(batches))
+            while True:
+                # Keep at most max_in_flight batches submitted; the rest wait in the iterator
+                for i, batch in queue:
+                    pending[pool.submit(self._embed_batch, i, [todo_texts[j] for j in batch])] = batch
+                    if len(pending) >= self.max_in_flight:
+                        break
+                if not pending:
+                    break
+                completed, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in completed:
+                    batch = pending.pop(future)
+                    vectors = future.result()
+                    batch_keys = [todo_keys[j] for j in batch]
+                    done.update(zip(batch_keys, vectors))
+                    if writer is not None:
+                        writer.add(batch_keys, vectors)
+                    finished += 1
+                    if writer is not None and finished % self.checkpoint_every == 0:
+                        writer.flush()
+        finally:
+            for future in pending:
+                future.cancel()
+            pool.shutdown(wait=True)
+            # Keep whatever finished, including batches that completed after a failure
+            for future, batch in pending.items():
+                if writer is not None and future.done() and not future.cancelled() and future.exception() is None:
+                    batch_keys = [todo_keys[j] for j in batch]
+                    done.update(zip(batch_keys, future.result()))
+                    writer.add(batch_keys, future.result())
+            if writer is not None:
+                writer.flush()
+
+        elapsed = time.perf_counter() - start
+        print(f"✓ Embedded {len(todo_keys)} texts in {finished} batches ({elapsed:.1f}s)")
+        return done
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time the runner against the stub encoder.")
+    parser.add_argument("rows", nargs="?", type=int, default=5000)
+    parser.add_argument("--in-flight", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.2, help="stub seconds per request")
+    args = parser.parse_args()
+
+    texts = [f"Genres: action drama. Synopsis number {i} " + "words " * 150 for i in range(args.rows)]
+    keys = [hashlib.sha256(t.encode("utf-8")).hexdigest() for t in texts]
+    for in_flight in (1, args.in_flight):
+        backend = StubBackend(latency=args.latency)
+        t = time.perf_counter()
+        EmbeddingRunner(backend, max_in_flight=in_flight).run(keys, texts)
+        print(f"in_flight={in_flight}: {backend.calls} calls, {time.perf_counter() - t:.2f}s")
@@ -19,18 +19,23 @@ LOCATION  = "us-central1"            # recommended
 vertexai.init(project=PROJECT_ID, location=LOCATION)
 
 from vertexai.language_models import TextEmbeddingModel
-model = TextEmbeddingModel.from_pretrained("text-embedding-004")  # Vertex text embeddings
+EMBED_MODEL = "text-embedding-004"
+model = TextEmbeddingModel.from_pretrained(EMBED_MODEL)  # Vertex text embeddings
 print("Vertex ready:", PROJECT_ID, LOCATION)
 
 import pandas as pd
 import numpy as np
-import math, time, random
-from typing import List
-from tqdm import tqdm
+import os
+from pathlib import Path
 
 # IO paths
 DATA_IN  = "/content/cleaned_data.parquet"   # change if CSV
 EMB_OUT  = "embeddings.parquet"
+EMB_CACHE = "embedding_cache.parquet"        # content_hash -> embedding, kept between runs
+
+# Incremental refresh: only rows whose content hash isn't in EMB_CACHE are
+# sent to the API. Set False to re-embed the whole catalog.
+INCREMENTAL = True
 
 # Embedding config
 BATCH_SIZE   = 100       # Vertex handles ~100 nicely
@@ -80,63 +85,64 @@ display(df[["anime_id", "genre_theme_set", "embed_text"]].head(3))
 df.to_parquet("cleaned_data2.parquet", index=False)
 print("Saved the current DataFrame to cleaned_data2.parquet")
 
-import math, time
-from tqdm import tqdm
-import numpy as np
-
-# Heuristic: ~4 characters ≈ 1 token (safe-ish). Use 18k to leave headroom under the 20k hard cap.
-CHARS_PER_TOKEN = 4
-MAX_TOKENS_PER_REQUEST = 18_000
-HARD_CAP_BATCH = 100  # never exceed this many rows per request even if token budget remains
-
-def _estimate_tokens(text: str) -> int:
-    # Fast heuristic; Vertex CountTokens API exists, but we avoid extra round trips.
-    return max(1, len(text) // CHARS_PER_TOKEN)
-
-def _pack_batches_by_budget(texts):
-    batches, cur, cur_tokens = [], [], 0
-    for t in texts:
-        est = _estimate_tokens(t)
-        # if adding this would exceed budget or hard cap, flush the batch
-        if cur and (cur_tokens + est > MAX_TOKENS_PER_REQUEST or len(cur) >= HARD_CAP_BATCH):
-            batches.append(cur)
-            cur, cur_tokens = [], 0
-        # if a single text is huge, still send it alone (SDK can auto-truncate per item)
-        cur.append(t)
-        cur_tokens += est
-    if cur:
-        batches.append(cur)
-    return batches
-
-def _call_get_embeddings(batch):
-    # Prefer auto_truncate=True if this SDK supports it
-    try:
-        return model.get_embeddings(batch, auto_truncate=True)
-    except TypeError:
-        return model.get_embeddings(batch)
-
-def get_embeddings_batched(texts, max_retries=6, base_sleep=1.2):
-    batches = _pack_batches_by_budget(texts)
-    print(f"Prepared {len(batches)} batches (token-budgeted).")
-    out = []
-    for i, batch in enumerate(tqdm(batches, total=len(batches))):
-        attempt = 0
-        while True:
-            try:
-                resp = _call_get_embeddings(batch)
-                out.extend([np.asarray(e.values, dtype=np.float32) for e in resp])
-                break
-            except Exception as e:
-                if attempt >= max_retries:
-                    raise RuntimeError(f"Failed after {max_retries} retries on batch {i} (size={len(batch)}): {e}")
-                wait = base_sleep * (2 ** attempt)
-                print(f"Retrying batch {i} (size={len(batch)}) in {wait:.1f}s due to: {e}")
-                time.sleep(wait)
-                attempt += 1
-    return np.vstack(out, dtype=np.float32)
-
-texts = df["embed_text"].fillna("").astype(str).tolist()
-emb = get_embeddings_batched(texts)
+# Concurrent, rate-limited and checkpointed batches (embedding_runner.py next to this notebook)
+from embedding_runner import EmbeddingRunner, VertexBackend, clear_checkpoints, content_hash
+
+CHECKPOINT_DIR      = "embed_checkpoints"   # progress of an interrupted run; resumed on rerun
+MAX_IN_FLIGHT       = 8                     # concurrent embedding requests
+REQUESTS_PER_MINUTE = 600                   # set to the project's quota
+TOKENS_PER_MINUTE   = None                  # e.g. 1_000_000; None for no token limit
+
+backend = VertexBackend(model, task_type=TASK_TYPE)
+runner = EmbeddingRunner(
+    backend,
+    max_in_flight=MAX_IN_FLIGHT,
+    requests_per_minute=REQUESTS_PER_MINUTE,
+    tokens_per_minute=TOKENS_PER_MINUTE,
+    checkpoint_dir=CHECKPOINT_DIR,
+    max_retries=MAX_RETRIES,
+    base_sleep=BASE_SLEEP_S,
+)
+
+# Everything about the request that changes the vectors, as the backend actually sends it;
+# part of every content hash, so changing the model, task type or truncation re-embeds the catalog
+EMBED_PARAMS = {"model": EMBED_MODEL, **backend.params}
+
+def row_content_hash(embed_text, genres, themes, demographics) -> str:
+    """Key of one row's vector: EMBED_PARAMS, its embed_text and the genre/theme/demographic inputs."""
+    fields = [embed_text] + [",".join(_to_list(v)) for v in (genres, themes, demographics)]
+    return content_hash(fields, EMBED_PARAMS)
+
+def load_embedding_cache(path) -> dict:
+    if not Path(path).exists():
+        return {}
+    cached = pd.read_parquet(path)
+    return {h: np.asarray(v, dtype=np.float32) for h, v in zip(cached["content_hash"], cached["embedding"])}
+
+def save_embedding_cache(cache: dict, hashes, path):
+    # Only the current catalog's hashes are kept, so edited/removed titles drop out
+    keep = list(dict.fromkeys(hashes))
+    tmp = path + ".tmp"
+    pd.DataFrame({"content_hash": keep, "embedding": [cache[h] for h in keep]}).to_parquet(tmp, index=False)
+    os.replace(tmp, path)
+
+df["content_hash"] = [
+    row_content_hash(*row) for row in zip(df["embed_text"], df["genres"], df["themes"], df["demographics"])
+]
+
+cache = load_embedding_cache(EMB_CACHE) if INCREMENTAL else {}
+cached = df["content_hash"].isin(list(cache))
+todo = df.loc[~cached, ["anime_id", "content_hash", "embed_text"]].drop_duplicates("content_hash")
+print(f"New or changed: {(~cached).sum()} rows | reused from {EMB_CACHE}: {cached.sum()}")
+
+if len(todo):
+    texts = todo["embed_text"].fillna("").astype(str).tolist()
+    cache.update(runner.run(todo["content_hash"].tolist(), texts))
+save_embedding_cache(cache, df["content_hash"], EMB_CACHE)
+clear_checkpoints(CHECKPOINT_DIR)  # merged into EMB_CACHE
+
+# Merge: every row of the catalog, in catalog order
+emb = np.vstack([cache[h] for h in df["content_hash"]]).astype(np.float32)
 
 print("Embedding shape:", emb.shape, "| dtype:", emb.dtype)
 print("First row norm (pre-norm):", float(np.linalg.norm(emb[0])))
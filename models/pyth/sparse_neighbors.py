@@ -0,0 +1,116 @@
+# sparse_neighbors.py
+"""
+Top-k cosine neighbors over a sparse feature matrix (e.g. the weighted TF-IDF
+hstack in animerec), without materializing the dense N×N similarity matrix.
+
+Rows are processed in blocks: each block's similarities to every row are
+computed with one sparse product, and the k best per row are kept with
+argpartition. The result is an N×N CSR matrix with at most k entries per
+row, sorted by descending similarity, so memory is O(N·k) plus one
+block × N scratch array.
+
+    neighbors = SparseNeighbors.build(combined_matrix, k=200)
+    idx, sims = neighbors.top(i, 10)
+
+top() asks for more than the stored k are answered exactly from the
+feature matrix for that one row.
+"""
+from __future__ import annotations
+from typing import Optional, Tuple
+
+import numpy as np
+from scipy import sparse
+from sklearn.preprocessing import normalize
+
+DEFAULT_K = 200
+# Scratch budget per block: block_size × N float64 similarities (~64 MB)
+BLOCK_ELEMENTS = 1 << 23
+
+
+def _top_k(sims: np.ndarray, k: int) -> np.ndarray:
+    """
+    Column ids of each row's k largest entries, best first. Ties (also at
+    the k-th place) go to the lower column, as a stable sort of the full
+    row would give.
+    """
+    kth = -np.partition(-sims, k - 1, axis=1)[:, k - 1:k]
+    above = sims > kth
+    ties = sims == kth
+    keep = above | ties
+    # Rows with more ties at the k-th place than free slots keep the lowest columns
+    need = k - above.sum(axis=1, keepdims=True)
+    crowded = np.flatnonzero(ties.sum(axis=1) > need.ravel())
+    if len(crowded):
+        first = np.cumsum(ties[crowded], axis=1) <= need[crowded]
+        keep[crowded] = above[crowded] | (ties[crowded] & first)
+    cand = np.nonzero(keep)[1].reshape(len(sims), k)
+    top = np.take_along_axis(sims, cand, axis=1)
+    return np.take_along_axis(cand, np.lexsort((cand, -top), axis=-1), axis=1)
+
+
+def topk_csr(X, k: int = DEFAULT_K, block_size: Optional[int] = None) -> sparse.csr_matrix:
+    """
+    Per-row top-k cosine neighbors of X's rows, excluding the row itself and
+    zero similarities. Rows of the returned CSR are sorted by similarity.
+    """
+    X = normalize(sparse.csr_matrix(X, dtype=np.float64))
+    n = X.shape[0]
+    k = min(k, n - 1)
+    if k <= 0:
+        return sparse.csr_matrix((n, n), dtype=np.float32)
+
+    block_size = block_size or max(1, BLOCK_ELEMENTS // n)
+    XT = X.T.tocsr()
+    indices, data, counts = [], [], []
+    for start in range(0, n, block_size):
+        stop = min(n, start + block_size)
+        sims = (X[start:stop] @ XT).toarray()
+        rows = np.arange(stop - start)
+        sims[rows, rows + start] = -np.inf
+
+        cand = _top_k(sims, k)
+        top = np.take_along_axis(sims, cand, axis=1)
+
+        keep = top > 0
+        indices.append(cand[keep].astype(np.int32))
+        data.append(top[keep].astype(np.float32))
+        counts.append(keep.sum(axis=1))
+
+    indptr = np.concatenate([[0], np.cumsum(np.concatenate(counts))])
+    # Built directly from the arrays, so each row keeps its similarity order
+    return sparse.csr_matrix((np.concatenate(data), np.concatenate(indices), indptr), shape=(n, n))
+
+
+class SparseNeighbors:
+    """Top-k neighbor table plus the normalized feature matrix for exact fallbacks."""
+
+    def __init__(self, X, table: sparse.csr_matrix):
+        self.X = normalize(sparse.csr_matrix(X, dtype=np.float64))
+        self.table = table
+
+    @classmethod
+    def build(cls, X, k: int = DEFAULT_K, block_size: Optional[int] = None) -> "SparseNeighbors":
+        return cls(X, topk_csr(X, k, block_size))
+
+    @classmethod
+    def load(cls, X, path: str) -> "SparseNeighbors":
+        """Table saved by save() for the same X."""
+        return cls(X, sparse.load_npz(path))
+
+    def save(self, path: str):
+        sparse.save_npz(path, self.table, compressed=False)
+
+    def top(self, idx: int, n: int) -> Tuple[np.ndarray, np.ndarray]:
+        """The n nearest rows to idx (excluding idx) and their similarities, best first."""
+        start, stop = self.table.indptr[idx], self.table.indptr[idx + 1]
+        if n <= stop - start:
+            return self.table.indices[start:start + n], self.table.data[start:start + n]
+
+        # Past the stored neighbors (or into zero similarities): one exact row
+        sims = (self.X @ self.X[idx].T).toarray().ravel()
+        sims[idx] = -np.inf
+        n = min(n, len(sims) - 1)
+        if n <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        cand = _top_k(sims[None], n)[0]
+        return cand, sims[cand].astype(np.float32)
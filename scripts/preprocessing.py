@@ -1,115 +1,285 @@
-import pandas as pd
+"""
+Clean the scraped anime dump into cleaned_data.pkl / cleaned_data.parquet.
+
+    python preprocessing.py [input] [--workers N] [--chunk-rows N]
+
+The input is raw_data.pkl (default) or a .parquet file. Parquet is streamed
+a few row groups at a time, so only the cleaned output has to fit in memory.
+
+The work is split into two passes over the chunks:
+  1. Parse only members, popularity, episodes and duration, to get the
+     1%/99% clipping quantiles and the fill-in medians over the whole
+     dataset.
+  2. Clean every chunk with vectorized string operations across a process
+     pool. Chunks are then deduplicated on anime_id in input order, with the
+     first occurrence winning.
+
+The output is identical to cleaning the whole frame at once.
+"""
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+
 import numpy as np
-import re
-import pickle
+import pandas as pd
+import pyarrow.parquet as pq
 
-# Load raw data from pickle into a dataframe
-df = pd.read_pickle('../anime_recommender/backend/data/raw_data.pkl')
+DEFAULT_INPUT = '../anime_recommender/backend/data/raw_data.pkl'
+DEFAULT_OUTPUT_DIR = '../data'
+DEFAULT_CHUNK_ROWS = 50_000
 
 # Remove useless columns: anime_url, image_url, scored_by, favorites, rank
-columns_to_drop = [
+COLUMNS_TO_DROP = [
     'anime_url',
     'image_url',
     'scored_by',
     'favorites',
     'rank',
 ]
-df = df.drop(columns=columns_to_drop, axis=1)
 
-# Remove Special Characters
-def clean_text(text):
-    if pd.isna(text):
-        return ''
-    text = text.lower()
-    text = re.sub(r'[^a-z0-9\s]', ' ', text)
-    text = re.sub(r'\s+', ' ', text).strip()
-    return text
+# Clipped at the 1st/99th percentile to stop outliers
+COLS_TO_CLIP = ['members', 'popularity', 'episodes']
+LIST_COLUMNS = ['genres', 'themes', 'demographics', 'studios']
+
+# Fill missing data with blanks (duration/episodes get their medians)
+FILL_BLANKS = {
+    'english_name': '',
+    'japanese_names': '',
+    'genres': '',
+    'themes': '',
+    'demographics': '',
+    'synopsis': '',
+    'studios': '',
+    'source': '',
+    'producers': '',
+    'premiered': 0,
+    'type': '',
+    'rating': '',
+}
 
 
-for col in df.select_dtypes(include='object').columns:
-    if col == 'synopsis':
-        continue
-    df[col] = df[col].astype(str).apply(clean_text)
+# ---------------------------------------------------
+# Vectorized cleaning steps
+# ---------------------------------------------------
 
-# Change premiered to just year
-def extract_year(premiered):
-    if pd.isna(premiered):
-        return np.nan
-    match = re.search(r'(19|20)\d{2}', str(premiered))
-    return int(match.group(0)) if match else np.nan
+def _int_if_complete(values: pd.Series) -> pd.Series:
+    # Row-wise parsers returned int or NaN, giving int64 when nothing was missing
+    return values.astype(np.int64) if len(values) and not values.isna().any() else values
 
 
-df['premiered'] = df['premiered'].apply(extract_year)
+def per_unique(step):
+    """
+    Run a Series -> Series step once per distinct value and broadcast back.
+    Scraped columns (genres, type, rating, studios, duration, ...) repeat a
+    handful of values, so this skips most of the regex work.
+    """
+    def run(col: pd.Series) -> pd.Series:
+        codes, uniques = pd.factorize(col)
+        values = pd.Series(uniques, dtype=col.dtype)
 
-# Change duration to an integer of total minutes
-def parse_duration(duration):
-    if pd.isna(duration):
-        return np.nan
-    duration = duration.lower()
+        # factorize folds None and NaN into one missing code, but str() tells
+        # them apart: give each kind of missing value its own slot
+        missing = np.flatnonzero(codes < 0)
+        if len(missing):
+            raw = col.to_numpy()
+            slots: Dict[type, int] = {}
+            reps = []
+            for row in missing:
+                kind = type(raw[row])
+                if kind not in slots:
+                    slots[kind] = len(values) + len(reps)
+                    reps.append(row)
+                codes[row] = slots[kind]
+            values = pd.concat([values, col.iloc[reps]], ignore_index=True)
 
-    hours = re.search(r'(\d+)\s*hr', duration)
-    mins = re.search(r'(\d+)\s*min', duration)
+        out = step(values).iloc[codes]
+        out.index = col.index
+        return out.rename(col.name)
+    run.__doc__ = step.__doc__
+    return run
 
-    total_minutes = 0
-    if hours:
-        total_minutes += int(hours.group(1)) * 60
-    if mins:
-        total_minutes += int(mins.group(1))
 
-    return total_minutes if total_minutes > 0 else np.nan
+@per_unique
+def clean_text(col: pd.Series) -> pd.Series:
+    """Lowercase, special characters to spaces, collapse whitespace; missing -> ''."""
+    text = col.astype(str)
+    # Every run of non-[a-z0-9] characters (specials and whitespace) becomes one space
+    cleaned = text.str.lower().str.replace(r'[^a-z0-9]+', ' ', regex=True).str.strip()
+    return cleaned.mask(text.isna(), '')
 
 
-df['duration'] = df['duration'].apply(parse_duration)
+@per_unique
+def extract_year(premiered: pd.Series) -> pd.Series:
+    """Premiered season -> year (first 19xx/20xx), NaN when absent."""
+    years = premiered.astype(str).str.extract(r'((?:19|20)\d{2})', expand=False)
+    years = pd.to_numeric(years.mask(premiered.isna()), errors='coerce')
+    return _int_if_complete(years.astype(np.float64))
 
-# Make numbers integers
-df['score'] = pd.to_numeric(df['score'], errors='coerce')
-df['episodes'] = pd.to_numeric(df['episodes'], errors='coerce')
 
-# Clipping data at the 99th percentile to stop outliers
-cols_to_clip = ['members', 'popularity', 'episodes']
+@per_unique
+def parse_duration(duration: pd.Series) -> pd.Series:
+    """Duration text -> total minutes, NaN when no positive hr/min amount is found."""
+    text = duration.astype(str).str.lower()
+    hours = pd.to_numeric(text.str.extract(r'(\d+)\s*hr', expand=False), errors='coerce').fillna(0)
+    mins = pd.to_numeric(text.str.extract(r'(\d+)\s*min', expand=False), errors='coerce').fillna(0)
+    total = (hours * 60 + mins).astype(np.float64)
+    total = total.where((total > 0) & duration.notna())
+    return _int_if_complete(total)
 
-for col in cols_to_clip:
-    upper = df[col].quantile(0.99)
-    lower = df[col].quantile(0.01)
-    df[col] = df[col].clip(lower=lower, upper=upper)
 
-# Fill missing data with blanks
-df = df.fillna({
-    'english_name': '',
-    'japanese_names': '',
-    'genres': '',
-    'themes': '',
-    'demographics': '',
-    'duration': df['duration'].median(),
-    'synopsis': '',
-    'episodes': df['episodes'].median(),
-    'studios': '',
-    'source': '',
-    'producers': '',
-    'premiered': 0,
-    'type': '',
-    'rating': '',
-})
+@per_unique
+def clean_list_column(col: pd.Series) -> pd.Series:
+    """Making commas spaced evenly, forcing all to lowercase."""
+    text = col.astype(str).str.lower().str.strip().str.replace(r'\s*,\s*', ', ', regex=True)
+    return text.mask(col.isna(), '')
+
+
+def parse_chunk(df: pd.DataFrame, text_cols: List[str]) -> pd.DataFrame:
+    """Drop, text-clean and parse the columns of one chunk (row-independent steps)."""
+    df = df.drop(columns=[c for c in COLUMNS_TO_DROP if c in df.columns])
+
+    for col in text_cols:
+        if col in df.columns:
+            df[col] = clean_text(df[col])
+
+    if 'premiered' in df.columns:
+        df['premiered'] = extract_year(df['premiered'])
+    if 'duration' in df.columns:
+        df['duration'] = parse_duration(df['duration'])
+
+    # Make numbers integers
+    for col in ('score', 'episodes'):
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors='coerce')
+    return df
+
+
+# ---------------------------------------------------
+# Chunked input
+# ---------------------------------------------------
+
+# A task is either ('parquet', path, [row group ids]) or ('frame', DataFrame)
+Task = Tuple
+
+
+def text_columns(path: str, frame: Optional[pd.DataFrame] = None) -> List[str]:
+    """Object columns of the whole input (as the un-chunked script saw them), minus synopsis."""
+    frame = pq.read_schema(path).empty_table().to_pandas() if frame is None else frame.iloc[:0]
+    frame = frame.drop(columns=[c for c in COLUMNS_TO_DROP if c in frame.columns])
+    return [c for c in frame.select_dtypes(include='object').columns if c != 'synopsis']
+
+
+def iter_tasks(path: str, chunk_rows: int, frame: Optional[pd.DataFrame] = None) -> Iterator[Task]:
+    if frame is not None:
+        for start in range(0, len(frame), chunk_rows):
+            yield ('frame', frame.iloc[start:start + chunk_rows])
+        return
+
+    meta = pq.ParquetFile(path).metadata
+    groups, rows = [], 0
+    for i in range(meta.num_row_groups):
+        groups.append(i)
+        rows += meta.row_group(i).num_rows
+        if rows >= chunk_rows:
+            yield ('parquet', path, groups)
+            groups, rows = [], 0
+    if groups:
+        yield ('parquet', path, groups)
+
+
+def read_task(task: Task, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    if task[0] == 'frame':
+        df = task[1]
+        return df[[c for c in columns if c in df.columns]] if columns is not None else df.copy()
+    _, path, groups = task
+    if columns is not None:
+        columns = [c for c in columns if c in pq.read_schema(path).names]
+    return pq.ParquetFile(path).read_row_groups(groups, columns=columns).to_pandas()
+
+
+# ---------------------------------------------------
+# Passes
+# ---------------------------------------------------
+
+def _stats_chunk(task: Task, text_cols: List[str]) -> pd.DataFrame:
+    return parse_chunk(read_task(task, COLS_TO_CLIP + ['duration']), text_cols)
+
+
+def compute_stats(numeric: pd.DataFrame) -> Dict:
+    """Clipping bounds and fill-in medians over the whole dataset."""
+    bounds = {col: (numeric[col].quantile(0.01), numeric[col].quantile(0.99)) for col in COLS_TO_CLIP}
+    lower, upper = bounds['episodes']
+    return {
+        'bounds': bounds,
+        'duration_median': numeric['duration'].median(),
+        # Filled after clipping, so the median is of the clipped values
+        'episodes_median': numeric['episodes'].clip(lower=lower, upper=upper).median(),
+    }
+
+
+def _clean_chunk(task: Task, text_cols: List[str], stats: Dict) -> pd.DataFrame:
+    df = parse_chunk(read_task(task), text_cols)
+
+    for col, (lower, upper) in stats['bounds'].items():
+        df[col] = df[col].clip(lower=lower, upper=upper)
+
+    df = df.fillna({**FILL_BLANKS,
+                    'duration': stats['duration_median'],
+                    'episodes': stats['episodes_median']})
+
+    # Drop useless, almost blank animes
+    df = df.dropna(subset=['name', 'score'])
+    df = df[(df['genres'] != '') | (df['synopsis'] != '')]
+
+    return df.assign(**{col: clean_list_column(df[col]) for col in LIST_COLUMNS})
+
+
+def _concat(frames: List[pd.DataFrame]) -> pd.DataFrame:
+    out = pd.concat(frames, ignore_index=True)
+    # concat skips empty chunks when choosing dtypes; an int column that had
+    # NaNs (and so became float) in any chunk must stay float overall
+    for col in out.columns:
+        dtypes = {f[col].dtype for f in frames}
+        if len(dtypes) > 1 and all(pd.api.types.is_numeric_dtype(d) for d in dtypes):
+            out[col] = out[col].astype(np.result_type(*dtypes))
+    return out
+
+
+def preprocess(path: str, workers: int = 1, chunk_rows: int = DEFAULT_CHUNK_ROWS) -> pd.DataFrame:
+    frame = None if path.endswith('.parquet') else pd.read_pickle(path)
+    text_cols = text_columns(path, frame)
+    tasks = list(iter_tasks(path, chunk_rows, frame))
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # Pass 1: quantiles and medians
+        numeric = _concat(list(pool.map(_stats_chunk, tasks, [text_cols] * len(tasks))))
+        stats = compute_stats(numeric)
+        del numeric
 
-# Drop useless, almost blank animes
-df = df.dropna(subset=['name', 'score'])
-df = df[(df['genres'] != '') | (df['synopsis'] != '')]
+        # Pass 2: clean chunks in parallel, dedupe on anime_id in input order
+        frames, seen = [], set()
+        for df in pool.map(_clean_chunk, tasks, [text_cols] * len(tasks), [stats] * len(tasks)):
+            ids = df['anime_id']
+            keep = ~ids.duplicated(keep='first').to_numpy()
+            keep &= np.array([aid not in seen for aid in ids.tolist()], dtype=bool)
+            seen.update(ids[keep].tolist())
+            frames.append(df[keep])
 
-# Drop duplicate anime entries based on anime_id
-df = df.drop_duplicates(subset='anime_id', keep='first').reset_index(drop=True)
+    return _concat(frames)
 
-# Cleaning up spacing and formatting of some data
-# Making commas spaced evenly, forcing all to lowercase
-def clean_list_column(text):
-    if pd.isna(text):
-        return ''
-    return ', '.join([x.strip().lower() for x in str(text).split(',')])
 
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('input', nargs='?', default=DEFAULT_INPUT, help='raw_data.pkl or a .parquet file')
+    parser.add_argument('--output-dir', default=DEFAULT_OUTPUT_DIR)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--chunk-rows', type=int, default=DEFAULT_CHUNK_ROWS)
+    args = parser.parse_args()
 
-# Applying formatting rules to necessary areas
-for col in ['genres', 'themes', 'demographics', 'studios']:
-    df[col] = df[col].apply(clean_list_column)
+    df = preprocess(args.input, workers=args.workers, chunk_rows=args.chunk_rows)
 
-# Saving Cleaned Data
-df.to_pickle('../data/cleaned_data.pkl')
-df.to_parquet("../data/cleaned_data.parquet", engine='pyarrow', compression='snappy')
\ No newline at end of file
+    # Saving Cleaned Data
+    df.to_pickle(os.path.join(args.output_dir, 'cleaned_data.pkl'))
+    df.to_parquet(os.path.join(args.output_dir, 'cleaned_data.parquet'), engine='pyarrow', compression='snappy')
+    print(f"✓ Cleaned {len(df)} anime → {args.output_dir}")
@@ -0,0 +1,117 @@
+# conftest.py
+"""
+The backend, scripts and models/pyth are flat module directories (their
+modules import each other as `import animeknn`), so put them on sys.path.
+
+    python -m pytest -q
+"""
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+for sub in ("anime_recommender/backend", "scripts", "models/pyth"):
+    path = str(ROOT / sub)
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+
+GENRES = ["action", "comedy", "drama", "romance", "fantasy"]
+
+
+def make_catalog(n_series: int = 40, per_series: int = 3, dim: int = 16, seed: int = 0):
+    """
+    Synthetic catalog: n_series franchises of per_series entries ("Title007
+    Story", "... 2nd Season", "... Movie") whose embeddings sit close to a
+    shared direction, plus the matching metadata and raw_data tables.
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(n_series, dim))
+    emb = np.repeat(centers, per_series, axis=0) + 0.6 * rng.normal(size=(n_series * per_series, dim))
+    emb = (emb / np.linalg.norm(emb, axis=1, keepdims=True)).astype(np.float32)
+
+    suffixes = ["", " 2nd Season", " Movie", " Final Season"][:per_series]
+    names = [f"Title{s:03d} Story{suffix}" for s in range(n_series) for suffix in suffixes]
+    n = len(names)
+    anime_ids = np.arange(1000, 1000 + n)
+    genre_sets = [[GENRES[i % len(GENRES)], GENRES[(i * 7) % len(GENRES)]] for i in range(n)]
+    metadata = pd.DataFrame({
+        "anime_id": anime_ids,
+        "name": [x.lower() for x in names],
+        "score": np.round(rng.uniform(5, 9, n), 2),
+        "genres": [" ".join(g) for g in genre_sets],
+        "genre_theme_set": genre_sets,
+        "episodes": rng.integers(1, 50, n).astype(float),
+    })
+    raw_data = pd.DataFrame({
+        "anime_id": anime_ids,
+        "name": names,
+        "english_name": names,
+        "score": metadata["score"],
+        "episodes": metadata["episodes"],
+        "genres": [", ".join(g).title() for g in genre_sets],
+        "image_url": [f"https://img.example/{a}.jpg" for a in anime_ids],
+        "anime_url": [f"https://myanimelist.net/anime/{a}" for a in anime_ids],
+    })
+    return emb, metadata, raw_data
+
+
+@pytest.fixture
+def catalog(tmp_path, monkeypatch):
+    """
+    Write a synthetic catalog to tmp_path and point animeknn at it, with a
+    fresh engine and no persisted neighbor table or ANN indexes.
+    """
+    import animeknn
+    import display_store
+
+    emb, metadata, raw_data = make_catalog()
+    pd.DataFrame({"anime_id": metadata["anime_id"], "embedding": list(emb)}).to_parquet(
+        tmp_path / "embeddings.parquet")
+    metadata.to_parquet(tmp_path / "cleaned_data_names.parquet")
+    raw_data.to_csv(tmp_path / "raw_data.csv", index=False)
+
+    for name, filename in [("EMBEDDINGS_PATH", "embeddings.parquet"),
+                           ("EMBEDDINGS_NPY_PATH", "embeddings.npy"),
+                           ("CLEANED_DATA_PATH", "cleaned_data_names.parquet"),
+                           ("RAW_DATA_PATH", "raw_data.csv"),
+                           ("NEIGHBORS_PATH", "neighbors.npz"),
+                           ("IVF_INDEX_PATH", "ivf_index.npz"),
+                           ("HNSW_INDEX_PATH", "hnsw_index.npz"),
+                           ("FRANCHISES_PATH", "franchises.npz")]:
+        monkeypatch.setattr(animeknn, name, tmp_path / filename)
+    monkeypatch.setattr(animeknn, "QUANTIZED_PATHS",
+                        {kind: tmp_path / f"quantized_{kind}.npz" for kind in ("sq8", "pq")})
+    monkeypatch.setattr(animeknn, "SEARCH_BACKEND", "exact")
+    monkeypatch.setattr(animeknn, "engine", animeknn.DataEngine(lazy_display=False))
+    # Caches keyed by id() must not outlive the frames they were built for
+    monkeypatch.setattr(animeknn, "_search_indexes", {})
+    monkeypatch.setattr(animeknn, "_series_indexes", {})
+    monkeypatch.setattr(display_store, "_display_stores", {})
+    return tmp_path
+
+
+@pytest.fixture(scope="session")
+def clustered():
+    """(2000, 32) L2-normalized embeddings around 40 centers, and 50 query rows."""
+    rng = np.random.default_rng(0)
+    centers = rng.normal(size=(40, 32))
+    emb = centers[rng.integers(0, 40, 2000)] + 0.5 * rng.normal(size=(2000, 32))
+    emb = (emb / np.linalg.norm(emb, axis=1, keepdims=True)).astype(np.float32)
+    return emb, rng.choice(len(emb), size=50, replace=False)
+
+
+def recall_at_k(index, emb, queries, k=10, **search_kwargs) -> float:
+    """Mean overlap of index.search with the exact top k, excluding the query row."""
+    import animeknn
+
+    hits = []
+    for q in queries:
+        exact, _ = animeknn.knn_search(emb[q], emb, k=k, exclude_idx=q)
+        found, _ = index.search(emb[q], k, exclude_idx=q, **search_kwargs)
+        assert q not in found
+        hits.append(len(set(found.tolist()) & set(exact.tolist())) / k)
+    return float(np.mean(hits))
@@ -0,0 +1,59 @@
+"""App factory and gunicorn preload settings (app.create_app, gunicorn.conf.py)."""
+import gc
+import importlib.util
+
+import pytest
+
+import animeknn
+from conftest import ROOT
+
+
+@pytest.fixture
+def client(catalog, monkeypatch):
+    monkeypatch.setenv("RESPONSE_CACHE_MB", "0")
+    from app import create_app
+
+    return create_app(preload=True).test_client()
+
+
+def test_preload_loads_before_returning(client):
+    assert animeknn.engine.ready
+    assert client.get("/readyz").status_code == 200
+
+
+def test_search_and_recommend(client):
+    hits = client.get("/api/search?q=title002 story").get_json()
+    assert [hit["anime_id"] for hit in hits] == [1006, 1007, 1008]
+
+    response = client.post("/api/recommend", json={"anime_ids": [1006], "k": 5})
+    recs = response.get_json()["recommendations"]
+    assert response.status_code == 200 and len(recs) == 5
+    ids = [rec["anime_id"] for rec in recs]
+    assert not {1006, 1007, 1008} & set(ids)
+    assert {"name", "image_url", "anime_url", "similarity"} <= set(recs[0])
+
+
+def test_unknown_seeds_return_empty(client):
+    assert client.post("/api/recommend", json={"anime_ids": [1]}).get_json() == {"recommendations": []}
+    assert client.post("/api/recommend", json={"anime_ids": [1000], "mode": "bogus"}).status_code == 400
+
+
+def test_gunicorn_config_preloads_and_freezes():
+    spec = importlib.util.spec_from_file_location(
+        "gunicorn_conf", ROOT / "anime_recommender/backend/gunicorn.conf.py")
+    conf = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(conf)
+    assert conf.preload_app and conf.wsgi_app == "app:create_app(preload=True)"
+
+    class Log:
+        def info(self, *args):
+            self.args = args
+
+    class Server:
+        log = Log()
+
+    try:
+        conf.when_ready(Server())
+        assert gc.get_freeze_count() > 0
+    finally:
+        gc.unfreeze()
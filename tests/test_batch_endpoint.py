@@ -0,0 +1,79 @@
+"""Batch recommendation endpoint (/api/recommend/batch)."""
+import json
+
+import pytest
+
+SEEDS = {"a": [1000], "b": [1003, 1006], "c": [1], "d": [1009]}
+
+
+@pytest.fixture
+def app_module(catalog):
+    import app
+
+    return app
+
+
+@pytest.fixture
+def client(app_module):
+    return app_module.create_app(preload=True).test_client()
+
+
+def test_keyed_seeds_return_one_entry_each(client):
+    body = client.post("/api/recommend/batch", json={"seeds": SEEDS, "k": 4}).get_json()
+    recs = body["recommendations"]
+    assert list(recs) == list(SEEDS)
+    assert recs["c"] == []
+    assert all(len(recs[key]) == 4 for key in ("a", "b", "d"))
+    assert not {1003, 1004, 1005, 1006, 1007, 1008} & {r["anime_id"] for r in recs["b"]}
+
+
+def test_list_seeds_are_keyed_by_joined_ids(client):
+    body = client.post("/api/recommend/batch", json={"seeds": [[1000], [1003, 1006]], "k": 3}).get_json()
+    assert list(body["recommendations"]) == ["1000", "1003,1006"]
+
+
+@pytest.mark.parametrize("how", ["flag", "accept"])
+def test_ndjson_stream_across_blocks(client, app_module, monkeypatch, how):
+    monkeypatch.setattr(app_module, "BATCH_BLOCK", 2)
+    body = {"seeds": SEEDS, "k": 4}
+    if how == "flag":
+        response = client.post("/api/recommend/batch", json={**body, "stream": True})
+    else:
+        response = client.post("/api/recommend/batch", json=body,
+                               headers={"Accept": "application/x-ndjson"})
+    assert response.mimetype == "application/x-ndjson"
+
+    lines = [json.loads(line) for line in response.data.decode().splitlines()]
+    assert [line["key"] for line in lines] == list(SEEDS)
+    full = client.post("/api/recommend/batch", json=body).get_json()["recommendations"]
+    assert {line["key"]: line["recommendations"] for line in lines} == full
+
+
+def test_batch_reuses_single_recommend_cache(client):
+    single = client.post("/api/recommend", json={"anime_ids": [1000], "k": 4}).get_json()
+    before = client.get("/api/cache/stats").get_json()["hits"]
+    batch = client.post("/api/recommend/batch", json={"seeds": {"a": [1000]}, "k": 4}).get_json()
+    assert batch["recommendations"]["a"] == single["recommendations"]
+    assert client.get("/api/cache/stats").get_json()["hits"] == before + 1
+
+
+@pytest.mark.parametrize("body", [{}, {"seeds": 5}, {"seeds": [1000, 1003]},
+                                  {"seeds": {"a": [1000]}, "mode": "bogus"},
+                                  {"seeds": [[{"a": 1}]]}, {"seeds": {"a": ["1000"]}},
+                                  {"seeds": [[1000], [True]]}])
+@pytest.mark.parametrize("stream", [False, True])
+def test_malformed_batches_are_rejected(client, body, stream):
+    response = client.post("/api/recommend/batch", json={**body, "stream": stream})
+    assert response.status_code == 400
+    assert "error" in response.get_json()
+
+
+def test_duplicate_list_seeds_are_answered_once(client):
+    response = client.post("/api/recommend/batch", json={"seeds": [[1000], [1003], [1000]], "k": 3})
+    assert response.data.decode().count('"1000":') == 1
+    assert list(response.get_json()["recommendations"]) == ["1000", "1003"]
+
+
+def test_oversized_batches_are_rejected(client, app_module, monkeypatch):
+    monkeypatch.setattr(app_module, "MAX_BATCH", 3)
+    assert client.post("/api/recommend/batch", json={"seeds": SEEDS}).status_code == 413
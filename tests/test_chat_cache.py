@@ -0,0 +1,100 @@
+"""Chat reply cache keyed on normalized prompts (chat_cache.ChatCache)."""
+import threading
+import time
+
+import pandas as pd
+import pytest
+
+from chat_cache import ChatCache
+from response_cache import ResponseCache
+from title_index import TitleIndex
+
+
+@pytest.fixture
+def index():
+    return TitleIndex(pd.DataFrame({
+        "anime_id": [16498, 20],
+        "name": ["Shingeki no Kyojin", "Naruto"],
+        "english_name": ["Attack on Titan", None],
+        "members": [3_800_000, 2_800_000],
+    }))
+
+
+def test_case_whitespace_and_punctuation_share_a_key():
+    cache = ChatCache(ResponseCache())
+    assert cache.key("What should I watch after Naruto?") == cache.key("  what should i WATCH after naruto ")
+    assert cache.key("what to watch after naruto") != cache.key("what to watch after bleach")
+
+
+def test_titles_resolve_to_one_spelling(index):
+    cache = ChatCache(ResponseCache(), title_index=lambda: index)
+    assert cache.normalize("Is Attack on Titan good?") == "is anime:16498 good"
+    assert cache.key("Is Attack on Titan good?") == cache.key("is shingeki no kyojin good")
+    # No index yet (catalog still loading): plain normalization
+    assert ChatCache(ResponseCache(), title_index=lambda: None).normalize("Attack on Titan!") == \
+        "attack on titan"
+
+
+def test_namespace_separates_models():
+    shared = ResponseCache()
+    a = ChatCache(shared, namespace="model-a")
+    b = ChatCache(shared, namespace="model-b")
+    a.set("hello", "from a")
+    assert a.get("hello") == "from a" and b.get("hello") is None
+
+
+def test_identical_messages_make_one_upstream_call():
+    cache = ChatCache(ResponseCache())
+    calls, gate = [], threading.Event()
+
+    def compute(message):
+        calls.append(message)
+        gate.wait(5)
+        return "Try Mob Psycho 100."
+
+    replies = []
+    threads = [threading.Thread(target=lambda m=m: replies.append(cache.reply(m, compute)))
+               for m in ["Recommend something!", "recommend something", "RECOMMEND SOMETHING?"]]
+    threads[0].start()
+    while not calls:
+        time.sleep(0.01)
+    for thread in threads[1:]:
+        thread.start()
+    time.sleep(0.05)
+    gate.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert calls == ["Recommend something!"]
+    assert replies == ["Try Mob Psycho 100."] * 3
+
+
+def test_stats_track_upstream_and_saved_time():
+    cache = ChatCache(ResponseCache())
+
+    def slow(message):
+        time.sleep(0.05)
+        return "reply"
+
+    cache.reply("hi", slow)
+    cache.reply("Hi!", slow)
+    assert cache.get("hi") == "reply"
+    stats = cache.stats()
+    assert stats["upstream_calls"] == 1 and stats["hits"] == 2
+    assert stats["mean_upstream_seconds"] >= 0.05
+    assert stats["saved_seconds"] >= 0.09
+
+
+def test_chat_endpoint_uses_the_cache(catalog, monkeypatch):
+    monkeypatch.setenv("RESPONSE_CACHE_MB", "0")
+    import app
+
+    calls = []
+    monkeypatch.setattr(app, "chat_with_gemini", lambda message: calls.append(message) or "Watch Monster.")
+    client = app.create_app(preload=True).test_client()
+
+    for message in ["Something dark?", "something dark", "SOMETHING DARK"]:
+        assert client.post("/api/chat", json={"message": message}).get_json() == {"reply": "Watch Monster."}
+    assert calls == ["Something dark?"]
+    assert client.post("/api/chat", json={"message": ""}).status_code == 400
+    assert client.get("/api/chat/cache/stats").get_json()["upstream_calls"] == 1
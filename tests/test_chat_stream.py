@@ -0,0 +1,166 @@
+"""Streamed chat replies: read timeout (gemini_client.py) and coalescing (chat_cache.py)."""
+import threading
+import time
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+import fake_gemini_server
+import gemini_client
+from chat_cache import ChatCache
+from response_cache import ResponseCache
+
+
+@pytest.fixture
+def fake_gemini(monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), fake_gemini_server.FakeGeminiHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setenv("GEMINI_API_KEY", "fake")
+    monkeypatch.setattr(gemini_client, "GEMINI_BASE_URL", f"http://127.0.0.1:{server.server_address[1]}")
+    monkeypatch.setattr(gemini_client, "_client", None)
+    yield server
+    server.shutdown()
+
+
+def test_stalled_stream_hits_the_read_timeout(fake_gemini, monkeypatch):
+    monkeypatch.setattr(fake_gemini_server, "CHUNK_DELAY", 2.0)
+    monkeypatch.setattr(gemini_client, "STREAM_READ_TIMEOUT", 0.3)
+    free = gemini_client._slots._value
+
+    start = time.monotonic()
+    with pytest.raises(gemini_client.ChatTimeout):
+        list(gemini_client.ChatStream("hi"))
+    assert time.monotonic() - start < 1.5
+    assert gemini_client._slots._value == free
+
+
+def test_stream_against_fake_server(fake_gemini, monkeypatch):
+    monkeypatch.setattr(fake_gemini_server, "CHUNK_DELAY", 0.0)
+    text = "".join(gemini_client.ChatStream("hi")).strip()
+    assert text == fake_gemini_server.REPLY
+
+
+class Upstream:
+    """Chunk iterator whose chunks are released one at a time by the test."""
+
+    def __init__(self, chunks):
+        self.chunks = list(chunks)
+        self.ready = threading.Semaphore(0)
+        self.closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if not self.chunks:
+            raise StopIteration
+        assert self.ready.acquire(timeout=5)
+        return self.chunks.pop(0)
+
+    def close(self):
+        self.closed = True
+
+
+def _read_all(reader, out):
+    out.extend(reader)
+
+
+def test_identical_streams_share_one_upstream_call():
+    cache = ChatCache(ResponseCache())
+    started = []
+
+    def start(message):
+        started.append(message)
+        return Upstream(["Try ", "Mob ", "Psycho."])
+
+    first = cache.stream("Recommend something!", start)
+    upstream_chunks = []
+    reader_thread = threading.Thread(target=_read_all, args=(first, upstream_chunks))
+    reader_thread.start()
+    upstream = cache._streams[cache.key("Recommend something!")]
+    # Release one chunk, then join with an identical (normalized) message
+    upstream._chunks.ready.release()
+    while not upstream._parts:
+        time.sleep(0.01)
+
+    second = cache.stream("recommend  something", start)
+    late_chunks = []
+    late_thread = threading.Thread(target=_read_all, args=(second, late_chunks))
+    late_thread.start()
+    upstream._chunks.ready.release()
+    upstream._chunks.ready.release()
+    reader_thread.join(5)
+    late_thread.join(5)
+
+    assert started == ["Recommend something!"]
+    assert upstream_chunks == late_chunks == ["Try ", "Mob ", "Psycho."]
+    assert cache.get("recommend something") == "Try Mob Psycho."
+    assert not cache._streams
+    assert cache.stats()["upstream_calls"] == 1
+
+
+def test_abandoned_stream_closes_upstream():
+    cache = ChatCache(ResponseCache())
+    upstream = Upstream(["a", "b"])
+    a = cache.stream("hello", lambda m: upstream)
+    b = cache.stream("hello", lambda m: pytest.fail("should join the running stream"))
+
+    a.close()
+    assert not upstream.closed
+    b.close()                 # the last reader leaves before the first chunk
+    assert upstream.closed
+    assert not cache._streams
+    assert cache.get("hello") is None
+
+
+def test_failed_stream_is_not_cached():
+    cache = ChatCache(ResponseCache())
+
+    def broken(message):
+        yield "partial "
+        raise gemini_client.ChatTimeout("too slow")
+
+    reader = cache.stream("hello", broken)
+    assert next(reader) == "partial "
+    with pytest.raises(gemini_client.ChatTimeout):
+        next(reader)
+    assert cache.get("hello") is None
+    # The next identical message starts a fresh upstream call
+    assert list(cache.stream("hello", lambda m: iter(["ok"]))) == ["ok"]
+    assert cache.get("hello") == "ok"
+
+
+
+def _failing_client(error):
+    """Client whose stream raises error on the first chunk."""
+    def chunks():
+        raise error
+        yield
+
+    class Models:
+        def generate_content_stream(self, **kwargs):
+            return chunks()
+
+    class Client:
+        models = Models()
+
+    return Client()
+
+
+@pytest.mark.parametrize("error", [
+    TimeoutError("socket read timed out"),
+    gemini_client.errors.ServerError(504, {"error": {"message": "deadline", "status": "DEADLINE_EXCEEDED"}}),
+])
+def test_transport_timeouts_become_chat_timeouts(monkeypatch, error):
+    monkeypatch.setattr(gemini_client, "get_client", lambda: _failing_client(error))
+    free = gemini_client._slots._value
+    with pytest.raises(gemini_client.ChatTimeout):
+        list(gemini_client.ChatStream("hi"))
+    assert gemini_client._slots._value == free
+
+
+def test_other_stream_errors_pass_through(monkeypatch):
+    error = gemini_client.errors.ClientError(400, {"error": {"message": "bad", "status": "INVALID_ARGUMENT"}})
+    monkeypatch.setattr(gemini_client, "get_client", lambda: _failing_client(error))
+    with pytest.raises(gemini_client.errors.ClientError):
+        list(gemini_client.ChatStream("hi"))
@@ -0,0 +1,63 @@
+"""Columnar display data (display_store.py)."""
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from display_store import DisplayStore, get_display_store
+
+
+@pytest.fixture
+def metadata():
+    return pd.DataFrame({
+        "anime_id": [1, 2, 3],
+        "name": ["Alpha", "Beta", "Gamma"],
+        "score": [8.5, np.nan, 7.0],
+        "episodes": [12.0, 24.0, np.nan],
+        "genres": ["Action", "Drama", "Comedy"],
+    })
+
+
+@pytest.fixture
+def raw_data():
+    # No row for anime 3; a duplicate row for anime 1 that must be ignored
+    return pd.DataFrame({
+        "anime_id": [1, 2, 1],
+        "name": ["Alpha (raw)", "Beta (raw)", "Alpha (dup)"],
+        "score": [8.6, np.inf, 1.0],
+        "episodes": [12, 26, 1],
+        "genres": ["Action, Drama", "Drama", "x"],
+        "image_url": ["a.jpg", None, "dup.jpg"],
+        "anime_url": ["a", "b", "dup"],
+    })
+
+
+def test_records_prefer_raw_data_and_fall_back_to_metadata(metadata, raw_data):
+    store = DisplayStore(metadata, raw_data)
+    alpha, beta, gamma = store.records(np.array([0, 1, 2]), np.float32([0.9, 0.5, np.nan]))
+
+    assert alpha["name"] == "Alpha (raw)" and alpha["image_url"] == "a.jpg"
+    assert beta["score"] is None                 # inf sanitized
+    assert gamma["name"] == "Gamma" and gamma["episodes"] is None
+    assert gamma["image_url"] is None and gamma["similarity"] is None
+    assert type(alpha["anime_id"]) is int and type(beta["episodes"]) is int
+
+
+def test_json_fragments_match_records(metadata, raw_data):
+    store = DisplayStore(metadata, raw_data)
+    idx, sims = np.array([2, 0]), np.float32([0.25, 0.75])
+    assert json.loads(store.to_json(idx, sims)) == store.records(idx, sims)
+
+    plain = DisplayStore(metadata, raw_data, with_json=False)
+    assert plain.json_blob is None
+    assert json.loads(plain.to_json(idx, sims)) == store.records(idx, sims)
+
+
+def test_column_batch_and_cache(metadata, raw_data):
+    store = get_display_store(metadata, raw_data)
+    assert get_display_store(metadata, raw_data) is store
+
+    batch = store.column_batch(np.array([1, 0]), np.float32([0.5, 0.25]))
+    assert batch["anime_id"] == [2, 1]
+    assert batch["similarity"] == [0.5, 0.25]
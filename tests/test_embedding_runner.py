@@ -0,0 +1,123 @@
+import sys
+import time
+import types
+
+import numpy as np
+import pytest
+
+from embedding_runner import (EmbeddingRunner, StubBackend, TokenBucket, VertexBackend, content_hash,
+                              estimate_tokens, load_checkpoints, pack_batches)
+
+
+def _texts(n, chars=40):
+    return [f"{i:04d}".ljust(chars, "x") for i in range(n)]
+
+
+def test_pack_batches_respects_budget_and_cap():
+    texts = _texts(50)
+    batches = pack_batches(texts, max_tokens=35, hard_cap=4)
+    assert [i for b in batches for i in b] == list(range(50))
+    for b in batches:
+        assert len(b) <= 4
+        assert len(b) == 1 or sum(estimate_tokens(texts[i]) for i in b) <= 35
+
+
+def test_runner_matches_serial_stub():
+    texts = _texts(300)
+    keys = [f"k{i}" for i in range(300)]
+    out = EmbeddingRunner(StubBackend(dim=8), max_in_flight=6, hard_cap=7).run(keys, texts)
+    ref = StubBackend(dim=8).embed(texts)
+    assert all(np.array_equal(out[k], ref[i]) for i, k in enumerate(keys))
+
+
+def test_token_bucket_charges_oversized_requests_in_full():
+    bucket = TokenBucket(rate=1000, capacity=100)
+    start = time.monotonic()
+    for _ in range(3):
+        bucket.acquire(500)
+    # 1500 tokens at 1000/s with a 100-token burst
+    assert time.monotonic() - start >= 1.3
+
+
+def test_runner_keeps_to_tokens_per_minute():
+    # 10 tokens per text, 15 texts per batch: every batch is 150 tokens,
+    # more than the one-second burst (100) of a 6000/min quota
+    texts, keys = _texts(30), [f"k{i}" for i in range(30)]
+    runner = EmbeddingRunner(StubBackend(dim=4), max_in_flight=4, tokens_per_minute=6000,
+                             max_tokens=10_000, hard_cap=15)
+    start = time.monotonic()
+    runner.run(keys, texts)
+    elapsed = time.monotonic() - start
+
+    sent = sum(estimate_tokens(t) for t in texts)
+    burst = runner.token_bucket.capacity
+    observed = (sent - burst) / elapsed * 60
+    assert observed <= 6000 * 1.05
+
+
+def test_resume_skips_checkpointed_keys(tmp_path):
+    class Flaky(StubBackend):
+        def embed(self, texts):
+            if self.calls >= 3:
+                self.calls += 1
+                raise RuntimeError("boom")
+            return super().embed(texts)
+
+    texts, keys = _texts(200), [f"k{i}" for i in range(200)]
+    ckpt = tmp_path / "ckpt"
+    with pytest.raises(RuntimeError):
+        EmbeddingRunner(Flaky(dim=4), max_in_flight=1, checkpoint_dir=ckpt, checkpoint_every=1,
+                        max_retries=0, base_sleep=0, hard_cap=20).run(keys, texts)
+    saved = load_checkpoints(ckpt)
+    assert len(saved) == 60
+
+    backend = StubBackend(dim=4)
+    out = EmbeddingRunner(backend, checkpoint_dir=ckpt, hard_cap=20).run(keys, texts)
+    assert backend.calls == 7
+    ref = StubBackend(dim=4).embed(texts)
+    assert all(np.array_equal(out[k], ref[i]) for i, k in enumerate(keys))
+
+
+def test_content_hash_covers_request_params():
+    params = {"model": "text-embedding-004", "task_type": "RETRIEVAL_DOCUMENT", "auto_truncate": True}
+    key = content_hash(["Genres: action. A story", "action"], params)
+
+    assert key == content_hash(["Genres: action. A story", "action"], dict(reversed(params.items())))
+    assert key != content_hash(["Genres: action. A story", "action"], {**params, "task_type": "RETRIEVAL_QUERY"})
+    assert key != content_hash(["Genres: action. A story", "action"], {**params, "model": "other"})
+    assert key != content_hash(["Genres: action. A story", "comedy"], params)
+
+
+class _Embedding:
+    def __init__(self, values):
+        self.values = values
+
+
+def test_vertex_backend_sends_what_its_params_report(monkeypatch):
+    language_models = types.ModuleType("vertexai.language_models")
+    language_models.TextEmbeddingInput = lambda text, task_type: (text, task_type)
+    monkeypatch.setitem(sys.modules, "vertexai", types.ModuleType("vertexai"))
+    monkeypatch.setitem(sys.modules, "vertexai.language_models", language_models)
+    calls = []
+
+    class Model:
+        def get_embeddings(self, texts, auto_truncate=False):
+            calls.append((texts, auto_truncate))
+            return [_Embedding([1.0, 2.0]) for _ in texts]
+
+    class OldModel:
+        def get_embeddings(self, texts):
+            calls.append((texts, None))
+            return [_Embedding([1.0, 2.0]) for _ in texts]
+
+    backend = VertexBackend(Model(), task_type="RETRIEVAL_DOCUMENT")
+    assert backend.embed(["a", "b"]).shape == (2, 2)
+    assert calls[-1] == ([("a", "RETRIEVAL_DOCUMENT"), ("b", "RETRIEVAL_DOCUMENT")], True)
+    assert backend.params == {"task_type": "RETRIEVAL_DOCUMENT", "auto_truncate": True}
+
+    # An SDK without auto_truncate is never asked for it, and the key says so
+    old = VertexBackend(OldModel())
+    old.embed(["a"])
+    assert calls[-1] == (["a"], None)
+    assert old.params == {"task_type": None, "auto_truncate": False}
+    assert content_hash(["a"], backend.params) != content_hash(["a"], {**backend.params, "auto_truncate": False})
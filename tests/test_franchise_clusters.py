@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+
+import animeknn
+from franchise_clusters import build_franchise_ids, franchise_key, load_franchise_ids, save_franchises
+
+CATALOG = [
+    "kyoukai no kanata",
+    "kyoukai no kanata movie 2 i ll be here mirai hen",
+    "naruto",
+    "naruto shippuuden",
+    "re zero kara hajimeru isekai seikatsu",
+    "re zero kara hajimeru isekai seikatsu 2nd season",
+    "love live school idol project",
+    "love hina",
+    "kimi no na wa",
+    "kimi no suizou wo tabetai",
+    "monster",
+    "",
+    "",
+]
+
+
+def _ids():
+    return dict(zip(range(len(CATALOG)), build_franchise_ids(CATALOG)))
+
+
+def test_franchise_key_drops_sequel_words_and_numbering():
+    assert franchise_key("Re:Zero kara Hajimeru Isekai Seikatsu 2nd Season") == \
+        "re zero kara hajimeru isekai seikatsu"
+    assert franchise_key("Gintama: The Final") == "gintama"
+
+
+def test_known_sequels_share_a_franchise():
+    ids = _ids()
+    assert ids[0] == ids[1]      # kyoukai no kanata / its movie
+    assert ids[2] == ids[3]      # naruto / naruto shippuuden
+    assert ids[4] == ids[5]      # re zero / 2nd season
+
+
+def test_known_lookalikes_stay_apart():
+    ids = _ids()
+    assert ids[6] != ids[7]      # love live / love hina
+    assert ids[8] != ids[9]      # kimi no na wa / kimi no suizou
+    assert ids[11] != ids[12]    # unnamed rows are never merged
+
+
+def test_ids_are_dense_in_first_appearance_order():
+    ids = build_franchise_ids(CATALOG)
+    assert ids[0] == 0
+    assert set(ids.tolist()) == set(range(ids.max() + 1))
+
+
+def test_load_aligns_by_anime_id(tmp_path):
+    path = tmp_path / "franchises.npz"
+    save_franchises(path, np.array([10, 20, 30]), np.array([0, 0, 1]))
+    assert load_franchise_ids(path, [30, 99, 10]).tolist() == [1, -1, 0]
+    assert load_franchise_ids(tmp_path / "missing.npz", [1]) is None
+
+
+def test_series_filter_keeps_title_prefix_fallback():
+    metadata = pd.DataFrame({"name": ["kidou senshi gundam", "kidou senshi gundam unicorn",
+                                      "naruto", "cowboy bebop"]})
+    # The clustering put every title in its own franchise: the prefix check
+    # still removes the missed sequel
+    index = animeknn.SeriesIndex(metadata, franchise_ids=np.arange(4, dtype=np.int32))
+    kept = animeknn.filter_same_series(np.arange(4), 0, metadata, series_index=index)
+    assert kept.tolist() == [2, 3]
+
+    # A franchise id on its own is enough too
+    index = animeknn.SeriesIndex(metadata, franchise_ids=np.array([0, 1, 0, 2], dtype=np.int32))
+    kept = animeknn.filter_same_series(np.arange(4), 0, metadata, series_index=index)
+    assert kept.tolist() == [3]
@@ -0,0 +1,47 @@
+"""HNSW graph index (hnsw_index.py)."""
+import numpy as np
+import pytest
+
+from conftest import recall_at_k
+from hnsw_index import HNSWIndex
+
+RECALL_THRESHOLD = 0.9
+
+
+@pytest.fixture(scope="module")
+def index(clustered):
+    emb, _ = clustered
+    return HNSWIndex.build(emb)
+
+
+def test_recall_against_exact_search(index, clustered):
+    emb, queries = clustered
+    assert recall_at_k(index, emb, queries) >= RECALL_THRESHOLD
+    assert recall_at_k(index, emb, queries, ef_search=200) >= RECALL_THRESHOLD
+
+
+def test_layer_degrees_are_bounded(index):
+    for level, (off, nbrs) in enumerate(zip(index.offsets, index.neighbors)):
+        degrees = np.diff(off)
+        assert degrees.max() <= (2 * index.M if level == 0 else index.M)
+        assert off[-1] == len(nbrs)
+
+
+def test_save_load_round_trip(index, clustered, tmp_path):
+    emb, queries = clustered
+    path = tmp_path / "hnsw_index.npz"
+    index.save(path)
+    loaded = HNSWIndex.load(path, emb)
+
+    assert loaded.fingerprint == index.fingerprint and loaded.max_level == index.max_level
+    for q in queries[:10]:
+        np.testing.assert_array_equal(loaded.search(emb[q], 10)[0], index.search(emb[q], 10)[0])
+
+
+def test_search_over_a_float16_store(index, clustered):
+    emb, queries = clustered
+    half = HNSWIndex(emb.astype(np.float16), index.offsets, index.neighbors,
+                     index.entry_point, index.fingerprint)
+    _, sims = half.search(emb[queries[0]], 10)
+    assert sims.dtype == np.float32
+    assert recall_at_k(half, emb, queries) >= RECALL_THRESHOLD
@@ -0,0 +1,38 @@
+"""IVF index (ivf_index.py)."""
+import numpy as np
+
+import animeknn
+from conftest import recall_at_k
+from ivf_index import IVFIndex
+
+RECALL_THRESHOLD = 0.9
+
+
+def test_recall_against_exact_search(clustered):
+    emb, queries = clustered
+    index = IVFIndex.build(emb)
+    assert recall_at_k(index, emb, queries) >= RECALL_THRESHOLD
+    # Probing every cell is an exact search
+    assert recall_at_k(index, emb, queries, nprobe=index.nlist) == 1.0
+
+
+def test_lists_partition_the_catalog(clustered):
+    emb, _ = clustered
+    index = IVFIndex.build(emb, nlist=16)
+    assert index.list_offsets[-1] == len(emb)
+    assert sorted(index.list_ids.tolist()) == list(range(len(emb)))
+
+
+def test_save_load_and_stale_check(catalog):
+    emb = animeknn.engine.embeddings
+    IVFIndex.build(emb, nlist=8, nprobe=3).save(animeknn.IVF_INDEX_PATH)
+
+    index = animeknn.load_search_index("ivf", emb)
+    assert index is not None and index.nprobe == 3
+    found, _ = animeknn.approximate_knn_search(emb[0], emb, k=5, index=index, exclude_idx=0)
+    assert len(found) == 5 and 0 not in found
+
+    changed = emb.copy()
+    changed[0] = -changed[0]
+    assert animeknn.load_search_index("ivf", changed) is None
+    assert animeknn.load_search_index("ivf", emb, fingerprint=0) is None
@@ -0,0 +1,34 @@
+"""Batched KNN search and batch_recommend (animeknn.py)."""
+import numpy as np
+
+import animeknn
+
+
+def test_knn_search_batch_matches_single_queries(clustered):
+    emb, queries = clustered
+    # block_size smaller than Q exercises the block boundaries
+    idx, sims = animeknn.knn_search_batch(emb[queries], emb, k=10, exclude_idx=queries, block_size=7)
+    assert idx.shape == sims.shape == (len(queries), 10)
+    for row, q in enumerate(queries):
+        exact_idx, exact_sims = animeknn.knn_search(emb[q], emb, k=10, exclude_idx=q)
+        assert idx[row].tolist() == exact_idx.tolist()
+        np.testing.assert_allclose(sims[row], exact_sims, rtol=1e-5)
+        assert np.all(np.diff(sims[row]) <= 0)
+
+
+def test_knn_search_batch_without_exclusion_finds_the_query(clustered):
+    emb, queries = clustered
+    idx, _ = animeknn.knn_search_batch(emb[queries[:5]], emb, k=3)
+    assert idx[:, 0].tolist() == queries[:5].tolist()
+
+
+def test_batch_recommend_resolves_names(catalog):
+    results = animeknn.batch_recommend(["Title004 Story", "no such anime"], k=5)
+    assert list(results) == ["Title004 Story", "no such anime"]
+    assert results["no such anime"] == []
+
+    recs = results["Title004 Story"]
+    assert [r["rank"] for r in recs] == list(range(1, len(recs) + 1))
+    assert 0 < len(recs) <= 5
+    # Same-series entries (ids 1012-1014) are filtered out
+    assert not {r["anime_id"] for r in recs} & {1012, 1013, 1014}
@@ -0,0 +1,91 @@
+"""Lazy data loading and readiness (animeknn.DataEngine, /readyz)."""
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+import animeknn
+from conftest import ROOT
+
+
+def test_import_reads_no_data():
+    code = ("import animeknn, sys; "
+            "assert animeknn.engine.state == 'idle'; "
+            "assert 'sklearn' not in sys.modules and 'vertexai' not in sys.modules")
+    subprocess.run([sys.executable, "-c", code], check=True,
+                   cwd=ROOT / "anime_recommender/backend")
+
+
+def test_first_access_loads_once(catalog):
+    engine = animeknn.DataEngine(lazy_display=True)
+    assert engine.state == "idle" and not engine.ready
+
+    assert engine.embeddings.shape == (120, 16)
+    assert engine.ready and engine.metadata is engine.metadata
+    assert [s["step"] for s in engine.steps] == ["embeddings+metadata", "series_index"]
+    assert not engine.status()["display_loaded"]
+
+    assert len(engine.raw_data) == 120
+    assert engine.status()["display_loaded"]
+    assert [s["step"] for s in engine.steps][-1] == "raw_data"
+
+
+def test_module_attributes_go_through_the_engine(catalog):
+    assert animeknn.metadata is animeknn.engine.metadata
+    with pytest.raises(AttributeError):
+        animeknn.not_a_thing
+
+
+def test_failed_load_is_reported(catalog, monkeypatch):
+    monkeypatch.setattr(animeknn, "CLEANED_DATA_PATH", catalog / "missing.parquet")
+    engine = animeknn.DataEngine()
+    engine.warm_up().join()
+    status = engine.status()
+    assert status["state"] == "failed" and "missing.parquet" in status["error"]
+
+
+def test_readyz_reports_warm_up_progress(catalog, monkeypatch):
+    monkeypatch.setenv("RESPONSE_CACHE_MB", "0")
+    release = threading.Event()
+    load_core_data = animeknn.load_core_data
+
+    def slow_load():
+        release.wait(5)
+        return load_core_data()
+
+    monkeypatch.setattr(animeknn, "load_core_data", slow_load)
+    from app import create_app
+
+    client = create_app().test_client()
+    assert client.get("/healthz").status_code == 200
+    response = client.get("/readyz")
+    assert response.status_code == 503
+    assert response.get_json()["state"] in ("idle", "loading")
+
+    release.set()
+    # Requests arriving during warm-up wait for it instead of failing
+    assert client.get("/api/search?q=title001").status_code == 200
+    response = client.get("/readyz")
+    assert response.status_code == 200 and response.get_json()["state"] == "ready"
+
+
+@pytest.mark.parametrize("call", ["search", "recommend"])
+def test_lazy_display_waits_for_the_first_request(catalog, monkeypatch, call):
+    monkeypatch.setenv("RESPONSE_CACHE_MB", "0")
+    monkeypatch.setattr(animeknn, "engine", animeknn.DataEngine(lazy_display=True))
+    from app import create_app
+
+    client = create_app().test_client()
+    deadline = time.monotonic() + 5
+    while not client.get("/readyz").get_json()["recommender_ready"]:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    assert client.get("/readyz").get_json()["display_loaded"] is False
+
+    if call == "search":
+        assert client.get("/api/search?q=title001").get_json()
+    else:
+        assert client.post("/api/recommend", json={"anime_ids": [1000], "k": 3}).get_json()["recommendations"]
+    assert client.get("/readyz").get_json()["display_loaded"] is True
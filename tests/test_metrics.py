@@ -0,0 +1,98 @@
+"""Prometheus metrics (metrics.py, /metrics)."""
+import os
+import re
+
+from metrics import Counter, Histogram, Registry, cache_collector
+
+
+def _samples(text):
+    """{'name{labels}': value} without the pid label."""
+    out = {}
+    for line in text.splitlines():
+        if line and not line.startswith("#"):
+            name, value = line.rsplit(" ", 1)
+            out[re.sub(r',?pid="\d+"', "", name).replace("{}", "")] = float(value.replace("+Inf", "inf"))
+    return out
+
+
+def test_counter_and_histogram_exposition():
+    registry = Registry()
+    requests = registry.register(Counter("requests_total", "Requests.", ("status",)))
+    latency = registry.register(Histogram("latency_seconds", "Latency.", ("stage",), buckets=(0.1, 1.0)))
+    requests.inc(status=200)
+    requests.inc(2, status=200)
+    requests.inc(status=500)
+    for value in (0.05, 0.1, 0.5, 3.0):
+        latency.observe(value, stage="knn")
+
+    text = registry.render()
+    assert "# TYPE requests_total counter" in text and "# TYPE latency_seconds histogram" in text
+    assert f'pid="{os.getpid()}"' in text
+    samples = _samples(text)
+    assert samples['requests_total{status="200"}'] == 3
+    assert samples['requests_total{status="500"}'] == 1
+    # Buckets are cumulative and inclusive of their upper bound
+    assert samples['latency_seconds_bucket{stage="knn",le="0.1"}'] == 2
+    assert samples['latency_seconds_bucket{stage="knn",le="1.0"}'] == 3
+    assert samples['latency_seconds_bucket{stage="knn",le="+Inf"}'] == 4
+    assert samples['latency_seconds_count{stage="knn"}'] == 4
+    assert abs(samples['latency_seconds_sum{stage="knn"}'] - 3.65) < 1e-9
+
+
+def test_histogram_timer_and_label_escaping():
+    registry = Registry()
+    latency = registry.register(Histogram("t_seconds", "T.", ("stage",)))
+    with latency.time(stage='say "hi"\n'):
+        pass
+    assert 't_seconds_count{stage="say \\"hi\\"\\n",' in registry.render()
+
+
+def test_cache_collectors_merge_into_one_family():
+    registry = Registry()
+    registry.add_collector("a", cache_collector("recommend", lambda: {"hits": 1, "entries": 2}))
+    registry.add_collector("b", cache_collector("chat", lambda: {"hits": 5, "saved_seconds": 1.5}))
+    registry.add_collector("b", cache_collector("chat", lambda: {"hits": 7}))
+
+    text = registry.render()
+    assert text.count("# TYPE cache_hits_total counter") == 1
+    samples = _samples(text)
+    assert samples['cache_hits_total{cache="recommend"}'] == 1
+    assert samples['cache_hits_total{cache="chat"}'] == 7
+    assert samples['cache_entries{cache="recommend"}'] == 2
+    assert 'cache_saved_seconds_total{cache="chat"}' not in samples
+
+
+def test_metrics_endpoint_reports_stages_and_requests(catalog, monkeypatch):
+    monkeypatch.setenv("RESPONSE_CACHE_MB", "0")
+    from app import create_app
+
+    client = create_app(preload=True).test_client()
+    client.post("/api/recommend", json={"anime_ids": [1000], "k": 5})
+    client.post("/api/recommend/batch", json={"seeds": [[1003]], "k": 5})
+    client.get("/no/such/route")
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.content_type.startswith("text/plain; version=0.0.4")
+    samples = _samples(response.get_data(as_text=True))
+    for pipeline in ("single", "batch"):
+        for stage in ("resolve_ids", "knn_search"):
+            assert samples[f'recommend_stage_seconds_count{{pipeline="{pipeline}",stage="{stage}"}}'] >= 1
+    assert samples['http_requests_total{endpoint="/api/recommend",method="POST",status="200"}'] >= 1
+    # Routes are labeled by rule, never by raw path
+    assert not any("/no/such/route" in name for name in samples)
+    assert 'cache_hits_total{cache="recommend"}' in samples
+
+
+def test_cli_recommend_times_its_stages(catalog):
+    import animeknn
+    from metrics import REGISTRY
+
+    emb, _, metadata, raw_data = animeknn.load_data()
+    results = animeknn.recommend_anime("title003 story", emb, metadata, raw_data, k=5, verbose=False)
+    assert results
+
+    samples = _samples(REGISTRY.render())
+    for stage in ("resolve_ids", "knn_search", "filter_same_series", "mmr_rerank",
+                  "diversify_by_genre", "response_build"):
+        assert samples[f'recommend_stage_seconds_count{{pipeline="cli",stage="{stage}"}}'] >= 1
@@ -0,0 +1,56 @@
+"""MMR re-ranking (animeknn.mmr_rerank / mmr_rerank_batch)."""
+import numpy as np
+import pytest
+
+import animeknn
+
+
+def reference_mmr(candidate_embeddings, query_vec, lambda_mult=0.7, top_n=10):
+    """The original per-candidate loop."""
+    selected, remaining = [], list(range(len(candidate_embeddings)))
+    query_sims = candidate_embeddings @ query_vec
+    for _ in range(min(top_n, len(candidate_embeddings))):
+        scores = []
+        for idx in remaining:
+            div = np.max(candidate_embeddings[selected] @ candidate_embeddings[idx]) if selected else 0
+            scores.append((lambda_mult * query_sims[idx] - (1 - lambda_mult) * div, idx))
+        best = max(scores, key=lambda x: x[0])[1]
+        selected.append(best)
+        remaining.remove(best)
+    return selected
+
+
+@pytest.mark.parametrize("lambda_mult", [0.3, 0.7, 1.0])
+def test_matches_the_original_loop(clustered, lambda_mult):
+    emb, queries = clustered
+    for q in queries[:10]:
+        pool, _ = animeknn.knn_search(emb[q], emb, k=60, exclude_idx=q)
+        cand = emb[pool].astype(np.float64)
+        got = animeknn.mmr_rerank(cand, emb[q].astype(np.float64), lambda_mult, top_n=20)
+        assert got == reference_mmr(cand, emb[q].astype(np.float64), lambda_mult, top_n=20)
+
+
+def test_pure_relevance_keeps_similarity_order(clustered):
+    emb, queries = clustered
+    pool, _ = animeknn.knn_search(emb[queries[0]], emb, k=30)
+    assert animeknn.mmr_rerank(emb[pool], emb[queries[0]], lambda_mult=1.0, top_n=30) == list(range(30))
+    assert animeknn.mmr_rerank(emb[:0], emb[0]) == []
+
+
+def test_batch_matches_single_with_padding(clustered):
+    emb, queries = clustered
+    sizes = [40, 25, 3, 40]
+    qs = queries[:len(sizes)]
+    padded = np.zeros((len(sizes), max(sizes)), dtype=np.intp)
+    valid = np.zeros(padded.shape, dtype=bool)
+    for row, (q, size) in enumerate(zip(qs, sizes)):
+        padded[row, :size], _ = animeknn.knn_search(emb[q], emb, k=size, exclude_idx=q)
+        valid[row, :size] = True
+
+    order = animeknn.mmr_rerank_batch(emb[padded], emb[qs], 0.6, top_n=10, valid=valid)
+    assert order.shape == (len(sizes), 10)
+    for row, (q, size) in enumerate(zip(qs, sizes)):
+        single = animeknn.mmr_rerank(emb[padded[row, :size]], emb[q], 0.6, top_n=10)
+        got = order[row][order[row] >= 0].tolist()
+        assert got == single
+        assert np.all(order[row][len(single):] == -1)
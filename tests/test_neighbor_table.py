@@ -0,0 +1,84 @@
+"""Precomputed neighbor table (neighbor_table.py)."""
+import numpy as np
+import pytest
+
+from neighbor_table import NeighborTable, build_neighbor_table, embeddings_fingerprint, load_neighbor_table
+
+
+@pytest.mark.parametrize("n", [0, 1])
+def test_tiny_catalogs_have_no_neighbors(n):
+    emb = np.ones((n, 4), dtype=np.float32) / 2
+    indices, sims = build_neighbor_table(emb, top_n=10)
+    assert indices.shape == sims.shape == (n, 0)
+    assert NeighborTable.build(emb).top_n == 0
+
+
+def test_two_rows_are_each_others_neighbor():
+    emb = np.eye(2, dtype=np.float32)
+    indices, _ = build_neighbor_table(emb, top_n=10)
+    assert indices.tolist() == [[1], [0]]
+
+
+def _catalog_embeddings(n=300, dim=16, seed=0):
+    rng = np.random.default_rng(seed)
+    emb = rng.normal(size=(n, dim)).astype(np.float32)
+    return emb / np.linalg.norm(emb, axis=1, keepdims=True)
+
+
+def test_lookup_matches_exact_search():
+    import animeknn
+
+    emb = _catalog_embeddings()
+    table = NeighborTable.build(emb, top_n=20, block_size=64)
+    for q in (0, 17, 299):
+        idx, sims = table.lookup(q, 10)
+        exact_idx, exact_sims = animeknn.knn_search(emb[q], emb, k=10, exclude_idx=q)
+        assert idx.tolist() == exact_idx.tolist()
+        np.testing.assert_allclose(sims, exact_sims, atol=1e-3)     # stored as float16
+        assert q not in idx
+
+
+def test_load_rejects_a_stale_table(tmp_path):
+    emb = _catalog_embeddings()
+    path = tmp_path / "neighbors.npz"
+    NeighborTable.build(emb, top_n=5).save(path)
+
+    loaded = load_neighbor_table(path, emb)
+    assert loaded is not None and loaded.top_n == 5
+    assert load_neighbor_table(path, emb, fingerprint=embeddings_fingerprint(emb)) is not None
+
+    changed = emb.copy()
+    changed[3] = changed[4]
+    assert load_neighbor_table(path, changed) is None
+    assert load_neighbor_table(path, emb, fingerprint=0) is None
+    assert load_neighbor_table(tmp_path / "missing.npz", emb) is None
+
+
+def test_recommender_serves_single_seeds_from_the_table(catalog, monkeypatch):
+    import animeknn
+    from recommender_knn import AnimeKNNRecommender
+
+    NeighborTable.build(animeknn.engine.embeddings, top_n=150).save(animeknn.NEIGHBORS_PATH)
+    rec = AnimeKNNRecommender()
+    assert rec.neighbor_table is not None
+
+    monkeypatch.setattr(animeknn, "knn_search", lambda *a, **kw: pytest.fail("scanned"))
+    results = rec.recommend([1000], k=5)
+    assert len(results) == 5
+    assert 1000 not in [r["anime_id"] for r in results]
+
+
+def test_table_answers_report_exact_similarities(catalog):
+    import animeknn
+    from recommender_knn import AnimeKNNRecommender
+
+    exact = AnimeKNNRecommender()._recommend_indices([1000], k=5, lambda_mult=0.7)
+    NeighborTable.build(animeknn.engine.embeddings, top_n=150).save(animeknn.NEIGHBORS_PATH)
+    rec = AnimeKNNRecommender()
+    assert rec.neighbor_table is not None
+
+    for got in (rec._recommend_indices([1000], k=5, lambda_mult=0.7),
+                rec._recommend_indices_batch([[1000]], k=5, lambda_mult=0.7)[0]):
+        assert got[0].tolist() == exact[0].tolist()
+        assert got[1].dtype == np.float32
+        np.testing.assert_allclose(got[1], exact[1], rtol=1e-6)
@@ -0,0 +1,156 @@
+"""Chunked preprocessing (scripts/preprocessing.py) against the original row-wise pipeline."""
+import re
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import preprocessing
+
+
+def reference_preprocess(df: pd.DataFrame) -> pd.DataFrame:
+    """The original whole-frame script, minus the file I/O (drop() without axis= for pandas 3)."""
+    df = df.drop(columns=['anime_url', 'image_url', 'scored_by', 'favorites', 'rank'])
+
+    def clean_text(text):
+        if pd.isna(text):
+            return ''
+        text = text.lower()
+        text = re.sub(r'[^a-z0-9\s]', ' ', text)
+        return re.sub(r'\s+', ' ', text).strip()
+
+    for col in df.select_dtypes(include='object').columns:
+        if col == 'synopsis':
+            continue
+        df[col] = df[col].astype(str).apply(clean_text)
+
+    def extract_year(premiered):
+        if pd.isna(premiered):
+            return np.nan
+        match = re.search(r'(19|20)\d{2}', str(premiered))
+        return int(match.group(0)) if match else np.nan
+
+    df['premiered'] = df['premiered'].apply(extract_year)
+
+    def parse_duration(duration):
+        if pd.isna(duration):
+            return np.nan
+        duration = duration.lower()
+        hours = re.search(r'(\d+)\s*hr', duration)
+        mins = re.search(r'(\d+)\s*min', duration)
+        total_minutes = 0
+        if hours:
+            total_minutes += int(hours.group(1)) * 60
+        if mins:
+            total_minutes += int(mins.group(1))
+        return total_minutes if total_minutes > 0 else np.nan
+
+    df['duration'] = df['duration'].apply(parse_duration)
+    df['score'] = pd.to_numeric(df['score'], errors='coerce')
+    df['episodes'] = pd.to_numeric(df['episodes'], errors='coerce')
+
+    for col in ['members', 'popularity', 'episodes']:
+        upper = df[col].quantile(0.99)
+        lower = df[col].quantile(0.01)
+        df[col] = df[col].clip(lower=lower, upper=upper)
+
+    df = df.fillna({
+        'english_name': '', 'japanese_names': '', 'genres': '', 'themes': '',
+        'demographics': '', 'duration': df['duration'].median(), 'synopsis': '',
+        'episodes': df['episodes'].median(), 'studios': '', 'source': '', 'producers': '',
+        'premiered': 0, 'type': '', 'rating': '',
+    })
+    df = df.dropna(subset=['name', 'score'])
+    df = df[(df['genres'] != '') | (df['synopsis'] != '')]
+    df = df.drop_duplicates(subset='anime_id', keep='first').reset_index(drop=True)
+
+    def clean_list_column(text):
+        if pd.isna(text):
+            return ''
+        return ', '.join([x.strip().lower() for x in str(text).split(',')])
+
+    for col in ['genres', 'themes', 'demographics', 'studios']:
+        df[col] = df[col].apply(clean_list_column)
+    return df
+
+
+def make_raw(n: int = 400, seed: int = 0) -> pd.DataFrame:
+    """A scraped-looking dump: messy text, missing values, outliers and duplicate ids."""
+    rng = np.random.default_rng(seed)
+
+    def pick(options):
+        return [options[i] for i in rng.integers(0, len(options), n)]
+
+    df = pd.DataFrame({
+        'anime_id': rng.integers(1, n * 3 // 4, n),
+        'name': pick(["Naruto: Shippuuden", "K-On!!", "Re:Zero  kara", "Steins;Gate 0", None, "86 (Eighty-Six)"]),
+        'english_name': pick(["Attack on Titan", "Fate/Zero", None, "nan", "Bleach: TYBW"]),
+        'japanese_names': pick(["進撃の巨人", "ナルト", None, "Rezero"]),
+        'score': np.array(pick([8.5, 7.25, np.nan, 6.0, 9.1])),
+        'genres': pick(["Action,Adventure", " Comedy , Slice of Life", None, "Drama", "Sci-Fi,  Mecha "]),
+        'themes': pick(["School", None, "Military, Space", "Gore,Psychological"]),
+        'demographics': pick(["Shounen", "Seinen", None]),
+        'synopsis': pick(["A boy and his friends.", None, "Hidden “quotes” & stuff!"]),
+        'type': pick(["TV", "Movie", "OVA", None]),
+        'episodes': pick(["12", "24", "Unknown", None, "1000", "1"]),
+        'premiered': pick(["Spring 2006", "fall 1998", None, "Unknown", "Winter 2021"]),
+        'duration': pick(["24 min per ep", "1 hr 30 min", "2 hr", "Unknown", None, "7 sec"]),
+        'source': pick(["Manga", "Original", None, "Light novel"]),
+        'studios': pick(["Madhouse", "Kyoto Animation,Shaft", None]),
+        'producers': pick(["Aniplex, Dentsu", None, "add some"]),
+        'rating': pick(["PG-13 - Teens 13 or older", "R - 17+ (violence & profanity)", None]),
+        'members': np.where(rng.random(n) < 0.02, 10**8, rng.integers(100, 10**6, n)),
+        'popularity': rng.integers(1, 20000, n),
+        'anime_url': "https://myanimelist.net/anime/1",
+        'image_url': None,
+        'scored_by': rng.integers(0, 1000, n),
+        'favorites': rng.integers(0, 1000, n),
+        'rank': rng.integers(1, 20000, n).astype(float),
+    })
+    return df.astype({c: object for c in df.columns if df[c].dtype == object or df[c].dtype == 'str'})
+
+
+@pytest.fixture(scope='module')
+def raw():
+    return make_raw()
+
+
+@pytest.fixture(scope='module')
+def expected(raw):
+    expected = reference_preprocess(raw.copy())
+    # The fixture exercises dedup and the blank/missing-score drops
+    assert raw['anime_id'].duplicated().any() and 100 < len(expected) < raw['anime_id'].nunique()
+    return expected
+
+
+@pytest.mark.parametrize('chunk_rows,workers', [(10**6, 1), (37, 1), (64, 2)])
+def test_pickle_input_matches_the_original(tmp_path, raw, expected, chunk_rows, workers):
+    path = tmp_path / 'raw_data.pkl'
+    raw.to_pickle(path)
+    out = preprocessing.preprocess(str(path), workers=workers, chunk_rows=chunk_rows)
+    pd.testing.assert_frame_equal(out, expected, check_exact=True)
+
+
+def test_parquet_input_matches_the_original(tmp_path, raw):
+    path = tmp_path / 'raw_data.parquet'
+    raw.to_parquet(path, row_group_size=50)
+    expected = reference_preprocess(pd.read_parquet(path))
+    out = preprocessing.preprocess(str(path), workers=1, chunk_rows=120)
+    pd.testing.assert_frame_equal(out, expected, check_exact=True)
+
+
+def test_per_unique_matches_row_wise_cleaning():
+    col = pd.Series(["A!", None, np.nan, "A!", "b  c", "Fate/Zero"], dtype=object)
+    expected = [re.sub(r'\s+', ' ', re.sub(r'[^a-z0-9\s]', ' ', x.lower())).strip() if not pd.isna(x) else ''
+                for x in col.astype(str)]
+    assert preprocessing.clean_text(col).tolist() == expected
+
+
+def test_duration_and_year_parsing():
+    durations = pd.Series(["1 hr 30 min", "24 min per ep", "7 sec", None], dtype=object)
+    parsed = preprocessing.parse_duration(durations)
+    assert parsed.iloc[0] == 90 and parsed.iloc[1] == 24 and parsed.iloc[2:].isna().all()
+    years = preprocessing.extract_year(pd.Series(["Spring 2006", "fall 1998", "Unknown"], dtype=object))
+    assert years.iloc[0] == 2006 and years.iloc[1] == 1998 and np.isnan(years.iloc[2])
+    # Complete columns come out as integers, like the row-wise int returns
+    assert preprocessing.extract_year(pd.Series(["Spring 2006"], dtype=object)).dtype == np.int64
@@ -0,0 +1,51 @@
+"""Quantized embedding stores (quantization.py)."""
+import numpy as np
+import pytest
+
+import animeknn
+from conftest import recall_at_k
+from quantization import ProductQuantizer, QuantizedStore, ScalarQuantizer
+
+
+@pytest.fixture(scope="module")
+def stores(clustered):
+    emb, _ = clustered
+    return {kind: QuantizedStore.build(emb, kind=kind) for kind in ("sq8", "pq")}
+
+
+@pytest.mark.parametrize("kind, threshold", [("sq8", 0.95), ("pq", 0.9)])
+def test_recall_against_exact_search(stores, clustered, kind, threshold):
+    emb, queries = clustered
+    assert recall_at_k(stores[kind], emb, queries) >= threshold
+
+
+def test_scalar_codes_round_trip(clustered):
+    emb, _ = clustered
+    sq = ScalarQuantizer.train(emb)
+    codes = sq.encode(emb)
+    assert codes.dtype == np.int8
+    assert np.abs(sq.decode(codes) - emb).max() <= sq.scale.max() / 2 + 1e-6
+    np.testing.assert_allclose(sq.scores(codes, emb[0]), sq.decode(codes) @ emb[0], atol=1e-4)
+
+
+def test_product_scores_match_decoded_vectors(stores, clustered):
+    emb, _ = clustered
+    pq = stores["pq"].quantizer
+    codes = stores["pq"].codes
+    assert codes.shape == (len(emb), pq.m) and codes.dtype == np.uint8
+    np.testing.assert_allclose(pq.scores(codes, emb[5]), pq.decode(codes) @ emb[5], atol=1e-4)
+
+    with pytest.raises(ValueError):
+        ProductQuantizer.train(emb[:, :30], m=16)
+
+
+def test_saved_store_loads_as_a_search_backend(catalog):
+    emb = animeknn.engine.embeddings
+    QuantizedStore.build(emb, kind="sq8").save(animeknn.QUANTIZED_PATHS["sq8"])
+
+    store = animeknn.load_search_index("sq8", emb)
+    assert isinstance(store, QuantizedStore) and store.quantizer.name == "sq8"
+    found, sims = store.search(emb[7], 5, exclude_idx=7)
+    exact, _ = animeknn.knn_search(emb[7], emb, k=5, exclude_idx=7)
+    assert found.tolist() == exact.tolist()
+    assert animeknn.load_search_index("pq", emb) is None      # not built
@@ -0,0 +1,78 @@
+"""Single vs batch recommendation paths (recommender_knn.py, app.py)."""
+import numpy as np
+import pytest
+
+import animeknn
+
+
+SEED_LISTS = [[1000], [1004], [1010, 1021], [1030, 1033, 1060], [1090], [999999]]
+
+
+@pytest.mark.parametrize("backend", ["exact", "ivf"])
+@pytest.mark.parametrize("mode", ["centroid", "max"])
+def test_recommend_and_batch_endpoints_agree(catalog, monkeypatch, backend, mode):
+    if backend == "ivf":
+        from ivf_index import IVFIndex
+        emb = animeknn.engine.embeddings
+        IVFIndex.build(emb, nlist=8, nprobe=2).save(animeknn.IVF_INDEX_PATH)
+        monkeypatch.setattr(animeknn, "SEARCH_BACKEND", backend)
+    # No response cache: both endpoints must compute their own results
+    monkeypatch.setenv("RESPONSE_CACHE_MB", "0")
+    from app import create_app
+    client = create_app(preload=True).test_client()
+
+    body = {"k": 8, "mode": mode}
+    batch = client.post("/api/recommend/batch", json={**body, "seeds": SEED_LISTS}).get_json()
+    for seeds in SEED_LISTS:
+        single = client.post("/api/recommend", json={**body, "anime_ids": seeds}).get_json()
+        key = ",".join(map(str, seeds))
+        got, want = batch["recommendations"][key], single["recommendations"]
+        assert [r["anime_id"] for r in got] == [r["anime_id"] for r in want], key
+        # Matrix vs vector products may differ in the last float32 bits
+        assert [r["similarity"] for r in got] == pytest.approx([r["similarity"] for r in want], abs=1e-6)
+
+
+def test_batch_uses_the_configured_index_for_single_seeds(catalog, monkeypatch):
+    from ivf_index import IVFIndex
+    from recommender_knn import AnimeKNNRecommender
+
+    IVFIndex.build(animeknn.engine.embeddings, nlist=8, nprobe=1).save(animeknn.IVF_INDEX_PATH)
+    rec = AnimeKNNRecommender(search_backend="ivf")
+    assert rec.search_index is not None
+    assert not rec._needs_scan(np.array([3]), rec.default_candidates)
+    assert rec._needs_scan(np.array([3, 4]), rec.default_candidates)
+
+    calls = []
+    monkeypatch.setattr(rec.search_index, "search",
+                        lambda *a, _search=rec.search_index.search, **kw: calls.append(a) or _search(*a, **kw))
+    rec._recommend_indices_batch([[1003], [1006]], k=5, lambda_mult=0.7)
+    assert len(calls) == 2
+
+
+def test_vectorized_series_filter_matches_per_query(catalog):
+    metadata = animeknn.engine.metadata
+    emb = animeknn.engine.embeddings
+    series = animeknn.get_series_index(metadata)
+    queries = np.array([0, 5, 31, 77])
+    pools, _ = animeknn.knn_search_batch(emb[queries], emb, k=30, exclude_idx=queries)
+
+    mask = series.same_series_mask_batch(pools, queries)
+    for row, q in enumerate(queries):
+        expected = animeknn.filter_same_series(pools[row], q, metadata)
+        np.testing.assert_array_equal(pools[row, ~mask[row]], expected)
+    # Every query's own franchise (3 entries per series) is dropped from its pool
+    assert np.all(pools[mask] // 3 == np.repeat(queries // 3, mask.sum(axis=1)))
+
+
+def test_recommend_batch_matches_recommend_anime(catalog):
+    metadata = animeknn.engine.metadata
+    emb = animeknn.engine.embeddings
+    names = ["title003 story", "title020 story movie"]
+    queries = [animeknn.find_anime_by_name(x, metadata) for x in names]
+
+    batch = animeknn.recommend_batch(queries, emb, metadata, k=6, candidates=40, diversify_genres=False)
+    for name, (idx, sims) in zip(names, batch):
+        single = animeknn.recommend_anime(name, emb, metadata, animeknn.engine.raw_data, k=6,
+                                          candidates=40, diversify_genres=False, verbose=False)
+        assert [r["anime_id"] for r in single] == metadata["anime_id"].to_numpy()[idx].tolist()
+        assert [r["similarity"] for r in single] == pytest.approx(sims.tolist(), abs=1e-6)
@@ -0,0 +1,134 @@
+"""Response cache (response_cache.py)."""
+import threading
+import time
+
+import pytest
+
+import response_cache
+from response_cache import ResponseCache, SQLiteBackend, cache_from_env, make_key
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(response_cache.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_lru_evicts_past_the_byte_bound():
+    cache = ResponseCache(max_bytes=30)
+    cache.set("a", b"x" * 10)
+    cache.set("b", b"x" * 10)
+    cache.set("c", b"x" * 10)
+    assert cache.get("a") is not None      # a is now most recent
+    cache.set("d", b"x" * 10)
+    assert cache.get("b") is None
+    assert [cache.get(k) is not None for k in "acd"] == [True, True, True]
+    cache.set("huge", b"x" * 31)           # never cached, evicts nothing
+    assert cache.get("huge") is None and len(cache) == 3
+    stats = cache.stats()
+    assert stats["bytes"] == 30 and stats["evictions"] == 1
+
+
+def test_entries_expire_after_ttl(clock):
+    cache = ResponseCache(ttl=60)
+    cache.set("a", b"body")
+    clock[0] += 59
+    assert cache.get("a") == b"body"
+    clock[0] += 2
+    assert cache.get("a") is None
+    assert cache.stats()["expirations"] == 1 and cache.stats()["bytes"] == 0
+
+
+def test_concurrent_misses_compute_once():
+    cache = ResponseCache()
+    calls, started = [], threading.Event()
+
+    def compute():
+        calls.append(1)
+        started.set()
+        time.sleep(0.2)
+        return b"result"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_compute("k", compute)))
+               for _ in range(8)]
+    threads[0].start()
+    started.wait()
+    for thread in threads[1:]:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert results == [b"result"] * 8
+    assert cache.stats()["coalesced"] == 7
+
+
+def test_failed_computation_is_not_cached():
+    cache = ResponseCache()
+
+    def boom():
+        raise ValueError("pipeline failed")
+
+    with pytest.raises(ValueError):
+        cache.get_or_compute("k", boom)
+    assert cache.get_or_compute("k", lambda: b"ok") == b"ok"
+
+
+def test_shared_tier_serves_other_caches(tmp_path):
+    path = tmp_path / "cache.sqlite"
+    first = ResponseCache(shared=SQLiteBackend(path))
+    second = ResponseCache(shared=SQLiteBackend(path))
+    first.set(make_key((1, 2), 10, 0.7), b"body")
+
+    assert second.get(make_key((1, 2), 10, 0.7)) == b"body"
+    assert second.stats()["shared_hits"] == 1
+    assert len(second) == 1                # promoted into the local LRU
+    assert second.get(make_key((1, 2), 10, 0.5)) is None
+
+
+def test_shared_tier_drops_expired_rows(tmp_path):
+    backend = SQLiteBackend(tmp_path / "cache.sqlite", ttl=-1)
+    backend.set("k", b"stale")
+    assert backend.get("k") is None
+
+
+def test_cache_from_env(tmp_path, monkeypatch):
+    monkeypatch.setenv("TEST_CACHE_MB", "0.5")
+    monkeypatch.setenv("TEST_CACHE_TTL", "5")
+    monkeypatch.setenv("TEST_CACHE_PATH", str(tmp_path / "shared.sqlite"))
+    cache = cache_from_env("TEST_CACHE")
+    assert cache.max_bytes == 2**19 and cache.ttl == 5
+    assert cache.shared is not None and cache.shared.ttl == 5
+
+
+def test_recommend_responses_are_cached(catalog):
+    from app import create_app
+
+    client = create_app(preload=True).test_client()
+    body = {"anime_ids": [1000, 1003], "k": 5}
+    first = client.post("/api/recommend", json=body)
+    second = client.post("/api/recommend", json=body)
+    assert first.status_code == 200 and first.data == second.data
+    stats = client.get("/api/cache/stats").get_json()
+    assert stats["hits"] == 1 and stats["entries"] == 1
+
+
+def test_sqlite_writes_are_counted_across_threads(tmp_path):
+    backend = SQLiteBackend(tmp_path / "cache.sqlite", max_entries=10)
+
+    def write(t):
+        for i in range(128):
+            backend.set(f"{t}-{i}", b"x")
+
+    threads = [threading.Thread(target=write, args=(t,)) for t in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert backend._writes == 8 * 128
+    # 1024 writes → the 256-write trims ran, the last one right at the end
+    count = backend._connect().execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+    assert count == 10
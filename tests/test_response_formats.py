@@ -0,0 +1,77 @@
+import msgpack
+import pyarrow as pa
+import pytest
+from werkzeug.datastructures import MIMEAccept
+
+from response_formats import ARROW, JSON, MSGPACK, encode_columns, negotiate
+
+COLUMNS = {
+    "anime_id": [1, 2, 3],
+    "name": ["Cowboy Bebop", "Unknown", None],
+    "score": [8.75, "N/A", float("nan")],
+    "episodes": [26, "N/A", None],
+    "genres": ["action, sci fi", "N/A", None],
+    "image_url": [None, None, "https://example.org/a.jpg"],
+    "anime_url": [None, None, None],
+    "similarity": [0.91, 0.5, 0.25],
+}
+
+
+def _arrow(data: bytes) -> pa.Table:
+    return pa.ipc.open_stream(data).read_all()
+
+
+def test_arrow_missing_values_become_typed_nulls():
+    table = _arrow(encode_columns(COLUMNS, ARROW))
+    assert table.schema.field("score").type == pa.float64()
+    assert table.schema.field("episodes").type == pa.float64()
+    assert table.schema.field("anime_url").type == pa.string()
+    assert table.column("score").to_pylist() == [8.75, None, None]
+    assert table.column("episodes").to_pylist() == [26.0, None, None]
+    assert table.column("name").to_pylist() == ["Cowboy Bebop", "Unknown", None]
+
+
+def test_arrow_schema_is_fixed_for_all_null_and_empty_batches():
+    empty = {f: [] for f in COLUMNS}
+    assert _arrow(encode_columns(empty, ARROW)).schema == _arrow(encode_columns(COLUMNS, ARROW)).schema
+
+
+def test_msgpack_uses_the_same_typed_columns():
+    decoded = msgpack.unpackb(encode_columns(COLUMNS, MSGPACK), raw=False)
+    assert decoded["score"] == [8.75, None, None]
+    assert decoded["anime_id"] == [1, 2, 3]
+
+
+def test_unknown_format_is_rejected():
+    with pytest.raises(ValueError):
+        encode_columns(COLUMNS, "text/csv")
+
+
+@pytest.mark.parametrize("accept, expected", [
+    ([("*/*", 1)], JSON),
+    ([("application/json", 1)], JSON),
+    ([("application/msgpack", 1)], MSGPACK),
+    ([("application/x-msgpack", 1)], MSGPACK),
+    ([("application/vnd.apache.arrow.stream", 1), ("application/json", 0.5)], ARROW),
+    ([("application/msgpack", 0.2), ("application/vnd.apache.arrow.stream", 0.9)], ARROW),
+    ([], JSON),
+])
+def test_negotiate(accept, expected):
+    assert negotiate(MIMEAccept(accept)) == expected
+
+
+@pytest.mark.parametrize("accept", [JSON, MSGPACK, ARROW])
+def test_negotiated_responses_vary_on_accept(catalog, monkeypatch, accept):
+    monkeypatch.setenv("RESPONSE_CACHE_MB", "0")
+    from app import create_app
+
+    client = create_app(preload=True).test_client()
+    responses = [
+        client.get("/api/search?q=title001", headers={"Accept": accept}),
+        client.post("/api/recommend", json={"anime_ids": [1000], "k": 3}, headers={"Accept": accept}),
+        client.post("/api/recommend/batch", json={"seeds": [[1000]], "k": 3}, headers={"Accept": accept}),
+    ]
+    for response in responses:
+        assert response.status_code == 200
+        assert "Accept" in response.vary
+    assert responses[0].mimetype == responses[1].mimetype == accept
@@ -0,0 +1,96 @@
+"""Same-franchise filtering (animeknn.SeriesIndex / filter_same_series)."""
+import numpy as np
+import pandas as pd
+import pytest
+
+import animeknn
+from animeknn import SeriesIndex, filter_same_series
+from conftest import make_catalog
+
+
+def reference_filter(candidate_indices, query_idx, metadata):
+    """The original per-row iloc implementation."""
+    query_row = metadata.iloc[query_idx]
+    if not str(query_row.get('name', '')).strip():
+        return np.asarray(candidate_indices)
+
+    if 'series_key' in metadata.columns:
+        query_key = str(query_row.get('series_key', '')).strip().lower()
+
+        def same_series(idx):
+            target_key = str(metadata.iloc[idx].get('series_key', '')).strip().lower()
+            return idx == query_idx or bool(query_key and target_key and query_key == target_key)
+    else:
+        query_root = ' '.join(str(query_row.get('name', '')).lower().split()[:2])
+
+        def same_series(idx):
+            target_title = str(metadata.iloc[idx].get('name', '')).lower()
+            return idx == query_idx or bool(query_root and target_title.startswith(query_root))
+
+    return np.array([idx for idx in candidate_indices if not same_series(idx)])
+
+
+@pytest.fixture
+def metadata():
+    _, metadata, _ = make_catalog(n_series=10)
+    metadata.loc[4, "name"] = ""
+    return metadata
+
+
+@pytest.fixture
+def keyed(metadata):
+    keyed = metadata.copy()
+    keyed["series_key"] = [f" Series{i // 3} " if i % 5 else "" for i in range(len(keyed))]
+    return keyed
+
+
+@pytest.mark.parametrize("with_key", [False, True])
+def test_matches_the_original_filter(metadata, keyed, with_key):
+    frame = keyed if with_key else metadata
+    index = SeriesIndex(frame)
+    candidates = np.random.default_rng(0).permutation(len(frame))
+    for q in range(len(frame)):
+        got = filter_same_series(candidates, q, frame, series_index=index)
+        np.testing.assert_array_equal(got, reference_filter(candidates, q, frame))
+
+
+def test_title_prefix_drops_sequels(metadata):
+    # Rows 0..2 are "title000 story", "... 2nd season", "... movie"
+    got = filter_same_series(np.arange(9), 0, metadata, series_index=SeriesIndex(metadata))
+    assert got.tolist() == [3, 4, 5, 6, 7, 8]
+
+
+def test_unnamed_query_filters_nothing(metadata):
+    candidates = np.arange(len(metadata))
+    np.testing.assert_array_equal(
+        filter_same_series(candidates, 4, metadata, series_index=SeriesIndex(metadata)), candidates)
+
+
+def test_franchise_ids_extend_the_match(metadata):
+    franchise_ids = np.arange(len(metadata), dtype=np.int32) // 3
+    franchise_ids[9] = franchise_ids[0]  # a spin-off with an unrelated title
+    franchise_ids[1] = -1                # not clustered yet: the title prefix still catches it
+    index = SeriesIndex(metadata, franchise_ids)
+    got = filter_same_series(np.arange(12), 0, metadata, series_index=index)
+    assert got.tolist() == [3, 4, 5, 6, 7, 8, 10, 11]
+
+
+@pytest.mark.parametrize("with_key", [False, True])
+def test_batch_mask_matches_single(metadata, keyed, with_key):
+    frame = keyed if with_key else metadata
+    franchise_ids = np.where(np.arange(len(frame)) % 4, np.arange(len(frame)) // 6, -1).astype(np.int32)
+    index = SeriesIndex(frame, franchise_ids)
+    rng = np.random.default_rng(1)
+    queries = np.arange(len(frame))
+    pools = np.stack([rng.permutation(len(frame))[:12] for _ in queries])
+
+    mask = index.same_series_mask_batch(pools, queries)
+    for q, pool, row in zip(queries, pools, mask):
+        expected = index.same_series_mask(pool, q) if index.has_name[q] else np.zeros(len(pool), bool)
+        np.testing.assert_array_equal(row, expected)
+
+
+def test_series_index_is_cached_per_frame(catalog):
+    metadata = pd.read_parquet(animeknn.CLEANED_DATA_PATH)
+    assert animeknn.get_series_index(metadata) is animeknn.get_series_index(metadata)
+    assert animeknn.get_series_index(metadata).franchise_ids is None
@@ -0,0 +1,64 @@
+"""Sparse top-k neighbor table (models/pyth/sparse_neighbors.py)."""
+import numpy as np
+import pytest
+from scipy import sparse
+from sklearn.preprocessing import normalize
+
+from sparse_neighbors import SparseNeighbors, topk_csr
+
+
+@pytest.fixture(scope="module")
+def features():
+    # TF-IDF-like: sparse, non-negative, with duplicate rows (ties) and an empty row
+    X = sparse.random(300, 80, density=0.05, format="csr", random_state=0)
+    X = sparse.vstack([X, X[:5], sparse.csr_matrix((1, 80))]).tocsr()
+    return X
+
+
+def dense_top(X, i, n):
+    """Reference: stable sort of the full dense cosine similarity row."""
+    Xn = normalize(X.astype(np.float64))
+    sims = (Xn @ Xn.T).toarray()[i]
+    sims[i] = -np.inf
+    order = np.argsort(-sims, kind="stable")[:n]
+    return order, sims[order]
+
+
+@pytest.mark.parametrize("block_size", [None, 7, 1000])
+def test_matches_dense_top_k(features, block_size):
+    k = 15
+    table = topk_csr(features, k=k, block_size=block_size)
+    assert table.shape == (features.shape[0],) * 2
+    for i in range(features.shape[0]):
+        start, stop = table.indptr[i], table.indptr[i + 1]
+        idx, sims = dense_top(features, i, k)
+        keep = sims > 0
+        np.testing.assert_array_equal(table.indices[start:stop], idx[keep])
+        np.testing.assert_allclose(table.data[start:stop], sims[keep], rtol=1e-6)
+
+
+def test_empty_row_and_tiny_inputs(features):
+    table = topk_csr(features, k=10)
+    assert table.indptr[-1] - table.indptr[-2] == 0
+    assert topk_csr(sparse.csr_matrix((1, 5)), k=10).nnz == 0
+
+
+def test_top_beyond_k_uses_the_exact_row(features):
+    neighbors = SparseNeighbors.build(features, k=5)
+    for i in (0, 42, 300):
+        idx, sims = neighbors.top(i, 3)
+        np.testing.assert_array_equal(idx, dense_top(features, i, 3)[0])
+
+        idx, sims = neighbors.top(i, 40)
+        want_idx, want_sims = dense_top(features, i, 40)
+        np.testing.assert_array_equal(idx, want_idx)
+        np.testing.assert_allclose(sims, want_sims, rtol=1e-6, atol=1e-7)
+        assert i not in idx
+
+
+def test_save_and_load(tmp_path, features):
+    neighbors = SparseNeighbors.build(features, k=8)
+    neighbors.save(tmp_path / "neighbors.npz")
+    loaded = SparseNeighbors.load(features, tmp_path / "neighbors.npz")
+    for i in (0, 100, 301):
+        np.testing.assert_array_equal(loaded.top(i, 8)[0], neighbors.top(i, 8)[0])
@@ -0,0 +1,101 @@
+"""Typeahead title index (title_index.TitleIndex)."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import make_catalog
+from title_index import TitleIndex, normalize_title
+
+
+@pytest.fixture
+def raw_data():
+    return pd.DataFrame({
+        "anime_id": [1, 2, 3, 4, 5, 6, 7],
+        "name": ["Shingeki no Kyojin", "Shingeki no Kyojin Season 2", "Naruto",
+                 "Naruto: Shippuuden", "Boruto: Naruto Next Generations", "One Piece", None],
+        "english_name": ["Attack on Titan", "Attack on Titan Season 2", None,
+                         "Naruto Shippuden", "Boruto", "nan", "Untitled"],
+        "members": [3_800_000, 2_200_000, 2_800_000, 2_300_000, 800_000, 2_400_000, 10],
+        "image_url": [f"https://img.example/{i}.jpg" for i in range(1, 8)],
+    })
+
+
+def test_matches_a_substring_scan_of_the_catalog():
+    _, _, raw_data = make_catalog()
+    index = TitleIndex(raw_data)
+    cols = ["english_name", "name"]
+    for q in ["title01", "story", "2nd", "movie", "le0", "e0", "t", "title007 story movie", "zzz"]:
+        mask = np.zeros(len(raw_data), dtype=bool)
+        for c in cols:
+            mask |= raw_data[c].astype(str).str.lower().str.contains(q, regex=False)
+        expected = set(raw_data.loc[mask, "anime_id"])
+        assert {hit["anime_id"] for hit in index.search(q, limit=len(raw_data))} == expected
+
+
+def test_ranks_exact_then_prefix_then_substring_then_popularity(raw_data):
+    index = TitleIndex(raw_data)
+    assert [hit["anime_id"] for hit in index.search("naruto")] == [3, 4, 5]
+    assert [hit["anime_id"] for hit in index.search("attack on titan")] == [1, 2]
+    assert [hit["anime_id"] for hit in index.search("Attack", limit=1)] == [1]
+
+
+def test_short_queries_match_mid_title(raw_data):
+    index = TitleIndex(raw_data)
+    # Prefix hit first, then substrings by popularity
+    assert [hit["anime_id"] for hit in index.search("on")] == [6, 1, 2, 5]
+    assert [hit["anime_id"] for hit in index.search("to")] == [3, 4, 5]
+    assert index.search("") == [] and index.search("   ") == []
+
+    short = TitleIndex(pd.DataFrame({"anime_id": [1, 2], "name": ["86 (Eighty-Six)", "Eighty Six 86"]}))
+    assert [hit["anime_id"] for hit in short.search("86")] == [1, 2]
+    assert [hit["anime_id"] for hit in short.search("x")] == [1, 2]
+
+
+def test_payload_prefers_english_name_and_sanitizes(raw_data):
+    index = TitleIndex(raw_data)
+    by_id = {item["anime_id"]: item for item in index.items}
+    assert by_id[1] == {"anime_id": 1, "name": "Attack on Titan", "image_url": "https://img.example/1.jpg"}
+    assert by_id[3]["name"] == "Naruto"
+    assert by_id[6]["name"] == "One Piece"
+    assert by_id[7]["name"] == "Untitled"
+    # Returned dicts are copies
+    index.search("naruto")[0]["name"] = "changed"
+    assert index.search("naruto")[0]["name"] == "Naruto"
+
+
+def test_japanese_names_come_from_metadata(raw_data):
+    metadata = pd.DataFrame({"anime_id": [1, 3], "japanese_names": ["進撃の巨人", "ナルト"]})
+    index = TitleIndex(raw_data, metadata)
+    assert [hit["anime_id"] for hit in index.search("進撃")] == [1]
+    assert normalize_title(float("nan")) == ""
+
+
+def test_fuzzy_search_tolerates_typos(raw_data):
+    index = TitleIndex(raw_data)
+    assert index.search("atack on titen") == []
+    assert [hit["anime_id"] for hit in index.fuzzy_search("atack on titen", limit=2)] == [1, 2]
+    assert index.fuzzy_search("shingeky no kyojn")[0]["anime_id"] == 1
+    assert index.fuzzy_search("qqqqqq") == []
+
+
+def test_fuzzy_shortlist_bounds_the_scored_rows():
+    _, _, raw_data = make_catalog()
+    index = TitleIndex(raw_data)
+    assert index.fuzzy_search("titel007 stori movei", limit=1)[0]["anime_id"] == 1000 + 3 * 7 + 2
+    # Every row shares trigrams with the query; only the shortlist is scored
+    assert len(index.fuzzy_search_rows("title story", limit=1000, shortlist=5)) <= 5
+
+
+def test_fuzzy_short_queries_use_plain_search(raw_data):
+    index = TitleIndex(raw_data)
+    np.testing.assert_array_equal(index.fuzzy_search_rows("on"), index.search_rows("on"))
+
+
+def test_search_endpoint_fuzzy_flag(catalog, monkeypatch):
+    monkeypatch.setenv("RESPONSE_CACHE_MB", "0")
+    from app import create_app
+
+    client = create_app(preload=True).test_client()
+    assert client.get("/api/search?q=titel003 storry").get_json() == []
+    hits = client.get("/api/search?q=titel003 storry&fuzzy=1").get_json()
+    assert hits and hits[0]["anime_id"] == 1009